@@ -0,0 +1,240 @@
+import asyncio
+import contextvars
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import click
+import openai
+from flask import has_app_context, has_request_context, request
+from flask.cli import with_appcontext
+from sqlalchemy import case, func, insert
+
+from ai.rate_governor import current_governor, estimate_tokens, is_retryable, retry_delay
+from datamanager.models import db, AICall
+
+# USD per 1M tokens: (input, cached input, output). Image models bill their output image as tokens too.
+AI_PRICES = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-image-1": (5.00, 1.25, 40.00),
+}
+
+# Attempts per call when no rate governor is set up (scripts); the clients themselves never retry.
+DEFAULT_ATTEMPTS = 3
+
+# (route, user_id) of whatever triggered the calls: a job, a streaming request, a pool refill ...
+_scope = contextvars.ContextVar("ai_call_scope", default=None)
+
+
+@contextmanager
+def ai_call_scope(route, user_id=None):
+    """Attributes every AI call made inside the block (and in tasks copied from it) to route and user."""
+    token = _scope.set((route, user_id))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def current_scope():
+    """The innermost ai_call_scope, else the current request's endpoint and user_id, else (None, None)."""
+    scope = _scope.get()
+    if scope is not None:
+        return scope
+    if has_request_context():
+        return request.endpoint, (request.view_args or {}).get("user_id")
+    return None, None
+
+
+def estimate_cost(model, prompt_tokens, cached_tokens, completion_tokens):
+    prices = next((p for name, p in AI_PRICES.items() if (model or "").startswith(name)), None)
+    if prices is None:
+        return 0.0
+    input_price, cached_price, output_price = prices
+    return ((prompt_tokens - cached_tokens) * input_price + cached_tokens * cached_price
+            + completion_tokens * output_price) / 1_000_000
+
+
+def _token_counts(usage):
+    """(prompt, completion, cached) from chat usage (prompt_/completion_tokens) or image usage (input_/output_tokens)."""
+    if usage is None:
+        return 0, 0, 0
+    prompt = getattr(usage, "prompt_tokens", None) or getattr(usage, "input_tokens", None) or 0
+    completion = getattr(usage, "completion_tokens", None) or getattr(usage, "output_tokens", None) or 0
+    details = getattr(usage, "prompt_tokens_details", None) or getattr(usage, "input_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) or 0
+    return prompt, completion, cached
+
+
+def record_ai_call(operation, model, started, usage=None, retries=None, error=None):
+    """
+    Stores one ai_calls row. Written on its own connection so the caller's
+    session (and any transaction it has open) is left alone; outside an app
+    context the call is only printed.
+    """
+    prompt, completion, cached = _token_counts(usage)
+    route, user_id = current_scope()
+    row = {
+        "created_at": datetime.utcnow(),
+        "operation": operation,
+        "model": model,
+        "route": route,
+        "user_id": user_id,
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+        "cached_tokens": cached,
+        "duration_ms": int((time.perf_counter() - started) * 1000),
+        "retries": retries,
+        "status": "error" if error else "ok",
+        "error": error,
+        "cost_usd": estimate_cost(model, prompt, cached, completion),
+    }
+    if not has_app_context():
+        print(f"[AI call] {row}")
+        return
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(insert(AICall), row)
+    except Exception as e:
+        print(f"[AI call] could not record {operation}: {e}")
+
+
+def _retry_delay(governor, model, error, attempt, attempts):
+    """Seconds to sleep before the next attempt, or None when the error is final."""
+    if attempt + 1 >= attempts or not is_retryable(error):
+        return None
+    delay = retry_delay(error, attempt)
+    if governor is not None and isinstance(error, openai.RateLimitError):
+        governor.rate_limited(model, delay)  # the governor holds every call to the model, this one included
+        return 0
+    return delay
+
+
+def tracked_call(operation, resource, method, **kwargs):
+    """
+    resource.<method>(**kwargs), e.g. tracked_call("daily_meals", client.chat.completions, "parse", ...).
+    Each attempt first waits for its turn at the rate governor. 429s, 5xx and connection errors
+    are retried with backoff, honouring retry-after, up to AI_MAX_ATTEMPTS attempts in all.
+    """
+    model = kwargs.get("model")
+    governor = current_governor()
+    estimate = estimate_tokens(kwargs)
+    attempts = governor.max_attempts if governor else DEFAULT_ATTEMPTS
+    started = time.perf_counter()
+    for attempt in range(attempts):
+        if governor is not None:
+            governor.acquire(model, estimate)
+        try:
+            raw = getattr(resource.with_raw_response, method)(**kwargs)
+            result = raw.parse()
+            break
+        except Exception as e:
+            delay = _retry_delay(governor, model, e, attempt, attempts)
+            if delay is None:
+                record_ai_call(operation, model, started, retries=attempt, error=str(e))
+                raise
+            time.sleep(delay)
+    record_ai_call(operation, model, started, usage=result.usage, retries=attempt + raw.retries_taken)
+    if governor is not None:
+        governor.settle(model, estimate, sum(_token_counts(result.usage)[:2]))
+    return result
+
+
+async def tracked_call_async(operation, resource, method, **kwargs):
+    """tracked_call for AsyncOpenAI resources; waiting at the governor happens off the event loop."""
+    model = kwargs.get("model")
+    governor = current_governor()
+    estimate = estimate_tokens(kwargs)
+    attempts = governor.max_attempts if governor else DEFAULT_ATTEMPTS
+    started = time.perf_counter()
+    for attempt in range(attempts):
+        if governor is not None:
+            await asyncio.to_thread(governor.acquire, model, estimate)
+        try:
+            raw = await getattr(resource.with_raw_response, method)(**kwargs)
+            result = raw.parse()
+            break
+        except Exception as e:
+            delay = _retry_delay(governor, model, e, attempt, attempts)
+            if delay is None:
+                record_ai_call(operation, model, started, retries=attempt, error=str(e))
+                raise
+            await asyncio.sleep(delay)
+    record_ai_call(operation, model, started, usage=result.usage, retries=attempt + raw.retries_taken)
+    if governor is not None:
+        governor.settle(model, estimate, sum(_token_counts(result.usage)[:2]))
+    return result
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+def usage_report(days=7):
+    """Per-operation latency/tokens/cost and per-user daily cost over the last `days` days."""
+    since = datetime.utcnow() - timedelta(days=days)
+
+    operations = []
+    totals = (db.session.query(AICall.operation,
+                               func.count(AICall.id),
+                               func.sum(case((AICall.status == "error", 1), else_=0)),
+                               func.sum(AICall.prompt_tokens),
+                               func.sum(AICall.completion_tokens),
+                               func.sum(AICall.cached_tokens),
+                               func.sum(AICall.cost_usd))
+              .filter(AICall.created_at >= since)
+              .group_by(AICall.operation)
+              .order_by(func.sum(AICall.cost_usd).desc()))
+    durations = defaultdict(list)
+    for operation, duration in (db.session.query(AICall.operation, AICall.duration_ms)
+                                .filter(AICall.created_at >= since)
+                                .order_by(AICall.duration_ms)):
+        durations[operation].append(duration)
+
+    for operation, calls, errors, prompt, completion, cached, cost in totals:
+        operations.append({
+            "operation": operation,
+            "calls": calls,
+            "errors": errors or 0,
+            "p50_ms": _percentile(durations[operation], 0.50),
+            "p95_ms": _percentile(durations[operation], 0.95),
+            "prompt_tokens": prompt or 0,
+            "completion_tokens": completion or 0,
+            "cached_tokens": cached or 0,
+            "tokens_per_call": round(((prompt or 0) + (completion or 0)) / calls),
+            "cost_usd": round(cost or 0, 4),
+        })
+
+    day = func.date(AICall.created_at)
+    users = [
+        {"user_id": user_id, "day": on, "calls": calls, "tokens": tokens or 0, "cost_usd": round(cost or 0, 4)}
+        for user_id, on, calls, tokens, cost in
+        db.session.query(AICall.user_id, day, func.count(AICall.id),
+                         func.sum(AICall.prompt_tokens + AICall.completion_tokens), func.sum(AICall.cost_usd))
+        .filter(AICall.created_at >= since)
+        .group_by(AICall.user_id, day)
+        .order_by(day.desc(), func.sum(AICall.cost_usd).desc())
+    ]
+    return {"since": since.isoformat(), "operations": operations, "users": users}
+
+
+@click.command("ai-usage")
+@click.option("--days", type=int, default=7, show_default=True)
+@with_appcontext
+def ai_usage_command(days):
+    """Latency, tokens and cost of the AI calls of the last few days."""
+    report = usage_report(days)
+    click.echo(f"AI calls since {report['since']}\n")
+    click.echo(f"{'operation':<20}{'calls':>7}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}"
+               f"{'tokens/call':>13}{'cost $':>10}")
+    for row in report["operations"]:
+        click.echo(f"{row['operation']:<20}{row['calls']:>7}{row['errors']:>8}{row['p50_ms']:>9}{row['p95_ms']:>9}"
+                   f"{row['tokens_per_call']:>13}{row['cost_usd']:>10.4f}")
+
+    click.echo(f"\n{'day':<12}{'user':>8}{'calls':>7}{'tokens':>10}{'cost $':>10}")
+    for row in report["users"]:
+        click.echo(f"{row['day']:<12}{str(row['user_id'] or '-'):>8}{row['calls']:>7}{row['tokens']:>10}"
+                   f"{row['cost_usd']:>10.4f}")
@@ -0,0 +1,317 @@
+"""
+Nightly plan generation for every user through a batch API, off the peak hours
+and at the batch discount:
+
+    flask batch-plans --kind all                      # write, submit, wait, import
+    flask batch-plans --kind daily_plan --no-wait     # from cron: submit / check once, re-run later
+
+1. write     one JSONL request line per user (daily plan) or per user and day (weekly plan),
+             built by the same request builders the live generators use
+2. submit    through the OpenAI Batch API, or the local stand-in (--backend local)
+3. download  poll until the batch is done, then save its output sorted by user
+4. import    validate every result against the Pydantic models and bulk-insert the
+             plans, --chunk-size users per transaction
+
+Progress is checkpointed in the batch_runs table (the import position is committed
+with each chunk), so running the same command again resumes a run where it stopped.
+"""
+import json
+import os
+import random
+import shutil
+import time
+import uuid
+from datetime import date
+from types import SimpleNamespace
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from openai import OpenAI
+from pydantic import ValidationError
+
+from ai import openai_service
+from ai.image_service import attach_lazy_images
+from ai.openai_service import DailyPlan, DayPlan, WeeklyPlan
+from datamanager.models import db, BatchRun, User
+
+BATCH_KINDS = ("daily_plan", "weekly_plan")
+TERMINAL = {"completed", "failed", "expired", "cancelled"}
+
+
+def user_requests(kind, user):
+    """[(custom_id, chat completion kwargs), ...] for one user: the day, or each of the seven days."""
+    if kind == "daily_plan":
+        return [(f"daily_plan:{user.id}", openai_service.daily_plan_request(user))]
+    return [(f"weekly_plan:{user.id}:{day['weekday']}", openai_service.day_plan_request(user, day))
+            for day in openai_service.week_schedule(user)]
+
+
+def strict_schema(node):
+    """A model_json_schema() in strict structured-output form: every object closed, all its fields required."""
+    if isinstance(node, list):
+        return [strict_schema(value) for value in node]
+    if not isinstance(node, dict):
+        return node
+    node = {key: strict_schema(value) for key, value in node.items() if not (key == "default" and value is None)}
+    if node.get("type") == "object" and "properties" in node:
+        node["additionalProperties"] = False
+        node["required"] = list(node["properties"])
+    return node
+
+
+def response_format(model):
+    """The response_format the live .parse() calls send for a Pydantic model, as plain JSON."""
+    return {"type": "json_schema",
+            "json_schema": {"name": model.__name__, "schema": strict_schema(model.model_json_schema()),
+                            "strict": True}}
+
+
+def request_line(custom_id, kwargs):
+    body = dict(kwargs)
+    body["response_format"] = response_format(body["response_format"])
+    return {"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body}
+
+
+def write_requests(kind, users, path):
+    """Writes the run's request file (atomically); returns the number of lines."""
+    count = 0
+    with open(f"{path}.tmp", "w") as f:
+        for user in users:
+            for custom_id, kwargs in user_requests(kind, user):
+                f.write(json.dumps(request_line(custom_id, kwargs)) + "\n")
+                count += 1
+    os.replace(f"{path}.tmp", path)
+    return count
+
+
+class OpenAIBatchBackend:
+    """The OpenAI Batch API: results within 24h at half the price of the same live calls."""
+
+    def __init__(self):
+        self.client = OpenAI()
+
+    def submit(self, request_path):
+        with open(request_path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(input_file_id=input_file.id, endpoint="/v1/chat/completions",
+                                           completion_window="24h")
+        return batch.id
+
+    def status(self, batch_id):
+        return self.client.batches.retrieve(batch_id).status
+
+    def download(self, batch_id, path):
+        batch = self.client.batches.retrieve(batch_id)
+        with open(path, "w") as f:
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if file_id:
+                    f.write(self.client.files.content(file_id).text)
+
+
+class LocalBatchBackend:
+    """
+    File-based stand-in for the Batch API, for testing the workflow without an
+    account: a batch is a directory under `directory`, "completes" `delay`
+    seconds after submission, and answers every request with a recorded plan
+    from benchmarks/fixtures (picked by the response schema, like mock_openai).
+    """
+
+    def __init__(self, directory, delay=5.0, error_rate=0.0):
+        self.directory = directory
+        self.delay = delay
+        self.error_rate = error_rate
+
+    def _dir(self, batch_id):
+        return os.path.join(self.directory, batch_id)
+
+    def submit(self, request_path):
+        batch_id = f"batch_local_{uuid.uuid4().hex[:12]}"
+        os.makedirs(self._dir(batch_id))
+        shutil.copy(request_path, os.path.join(self._dir(batch_id), "input.jsonl"))
+        with open(os.path.join(self._dir(batch_id), "batch.json"), "w") as f:
+            json.dump({"id": batch_id, "ready_at": time.time() + self.delay}, f)
+        return batch_id
+
+    def status(self, batch_id):
+        with open(os.path.join(self._dir(batch_id), "batch.json")) as f:
+            return "completed" if time.time() >= json.load(f)["ready_at"] else "in_progress"
+
+    def download(self, batch_id, path):
+        from benchmarks.mock_openai import load_fixtures  # test tooling, only needed by the stand-in
+        fixtures = load_fixtures()
+        with open(os.path.join(self._dir(batch_id), "input.jsonl")) as requests, open(path, "w") as f:
+            for line in requests:
+                request = json.loads(line)
+                schema = request["body"]["response_format"]["json_schema"]["name"]
+                if random.random() < self.error_rate or schema not in fixtures:
+                    result = {"custom_id": request["custom_id"], "response": None,
+                              "error": {"code": "server_error", "message": "Stand-in failure"}}
+                else:
+                    content = random.choice(fixtures[schema])
+                    result = {"custom_id": request["custom_id"], "error": None, "response": {
+                        "status_code": 200, "request_id": uuid.uuid4().hex,
+                        "body": {"object": "chat.completion", "model": request["body"]["model"],
+                                 "choices": [{"index": 0, "finish_reason": "stop",
+                                              "message": {"role": "assistant", "content": content,
+                                                          "refusal": None}}]}}}
+                f.write(json.dumps(result) + "\n")
+
+
+def _sort_key(custom_id):
+    # "weekly_plan:12:Tuesday" → (12, "Tuesday"): all lines of a user end up next to each other
+    _, user_id, *day = custom_id.split(":")
+    return int(user_id), day
+
+
+def sort_output(raw_path, path):
+    """The downloaded results grouped by user (batch output comes in completion order)."""
+    with open(raw_path) as f:
+        results = [json.loads(line) for line in f if line.strip()]
+    results.sort(key=lambda result: _sort_key(result["custom_id"]))
+    with open(path, "w") as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+
+
+def parse_result(result, schema):
+    """The validated Pydantic model of one result line; ValueError if the request failed or did not validate."""
+    response = result.get("response") or {}
+    if result.get("error") or response.get("status_code") != 200:
+        raise ValueError((result.get("error") or {}).get("message") or f"status {response.get('status_code')}")
+    message = response["body"]["choices"][0]["message"]
+    if message.get("refusal") or not message.get("content"):
+        raise ValueError(message.get("refusal") or "empty response")
+    try:
+        return schema.model_validate_json(message["content"])
+    except ValidationError as e:
+        raise ValueError(f"invalid {schema.__name__}: {e.error_count()} error(s)") from e
+
+
+def user_plan(kind, results):
+    """The plan dict of one user's result lines (a weekly plan needs all seven days)."""
+    if kind == "daily_plan":
+        return parse_result(results[0], DailyPlan).model_dump()
+    days = {result["custom_id"].rsplit(":", 1)[1]: parse_result(result, DayPlan) for result in results}
+    return WeeklyPlan(**days).model_dump()
+
+
+def _user_groups(path, start_line):
+    """Yields (line number after the group, user id, [result, ...]) for each user, from start_line on."""
+    group, group_user = [], None
+    with open(path) as f:
+        for number, line in enumerate(f):
+            if number < start_line:
+                continue
+            result = json.loads(line)
+            user_id = _sort_key(result["custom_id"])[0]
+            if group and user_id != group_user:
+                yield number, group_user, group
+                group = []
+            group_user = user_id
+            group.append(result)
+        if group:
+            yield number + 1, group_user, group
+
+
+def import_results(run, chunk_size, echo=print):
+    """Saves the plans of run.output_path from run.next_line on; commits the checkpoint with each chunk."""
+    data_manager = current_app.extensions["data_manager"]
+    save = data_manager.save_daily_plans if run.kind == "daily_plan" else data_manager.save_weekly_plans
+
+    def flush(plans, next_line, failures):
+        genders = dict(db.session.query(User.id, User.gender).filter(User.id.in_([user_id for user_id, _ in plans])))
+        # images are made when first viewed (/img/...); no cache lookups here, their periodic counter
+        # flush writes on a second connection, which would wait on this chunk's open write transaction
+        saved = [(user_id, attach_lazy_images(plan, SimpleNamespace(gender=genders[user_id]), use_cache=False))
+                 for user_id, plan in plans if user_id in genders]
+        save(saved, commit=False)
+        run.plans_saved += len(saved)
+        run.failures += failures + len(plans) - len(saved)  # users deleted since the requests were written
+        run.next_line = next_line
+        db.session.commit()  # the plans and the checkpoint in one transaction
+
+    plans, failures = [], 0
+    for next_line, user_id, results in _user_groups(run.output_path, run.next_line):
+        try:
+            plan = user_plan(run.kind, results)
+        except (ValueError, TypeError) as e:
+            echo(f"user {user_id}: {e}")
+            failures += 1
+        else:
+            plans.append((user_id, plan))
+        if len(plans) + failures >= chunk_size:
+            flush(plans, next_line, failures)
+            plans, failures = [], 0
+    if plans or failures:
+        flush(plans, next_line, failures)
+
+
+def advance(run, client, chunk_size, poll_seconds, wait):
+    """Takes the run through whatever steps it has left."""
+    if run.status == "new":
+        users = current_app.extensions["data_manager"].get_all_users()
+        run.request_count = write_requests(run.kind, users, run.request_path)
+        run.status = "written"
+        db.session.commit()
+        click.echo(f"{run.id}: wrote {run.request_count} request(s) for {len(users)} user(s)")
+
+    if run.status == "written":
+        run.batch_id = client.submit(run.request_path)
+        run.status = "submitted"
+        db.session.commit()
+        click.echo(f"{run.id}: submitted as {run.batch_id}")
+
+    if run.status == "submitted":
+        status = client.status(run.batch_id)
+        while wait and status not in TERMINAL:
+            time.sleep(poll_seconds)
+            status = client.status(run.batch_id)
+        if status not in TERMINAL:
+            click.echo(f"{run.id}: batch {run.batch_id} is {status}")
+            return
+        if status != "completed":
+            run.status, run.error = "failed", f"batch {status}"
+            db.session.commit()
+            return
+        raw_path = run.request_path.replace(".requests.", ".raw.")
+        client.download(run.batch_id, raw_path)
+        run.output_path = run.request_path.replace(".requests.", ".results.")
+        sort_output(raw_path, run.output_path)
+        run.status = "downloaded"
+        db.session.commit()
+
+    if run.status == "downloaded":
+        import_results(run, chunk_size, echo=click.echo)
+        run.status = "imported"
+        db.session.commit()
+
+
+@click.command("batch-plans")
+@click.option("--kind", type=click.Choice([*BATCH_KINDS, "all"]), default="daily_plan", show_default=True)
+@click.option("--run", "run_name", default=None, help="Run to start or resume (default: <kind>-<today>).")
+@click.option("--backend", type=click.Choice(["openai", "local"]), default="openai", show_default=True)
+@click.option("--workdir", default="batches", show_default=True, help="Where request/result files are kept.")
+@click.option("--chunk-size", type=int, default=200, show_default=True, help="Users per import transaction.")
+@click.option("--poll-seconds", type=float, default=60, show_default=True)
+@click.option("--wait/--no-wait", default=True, help="Wait for the batch, or check once and exit.")
+@with_appcontext
+def batch_plans_command(kind, run_name, backend, workdir, chunk_size, poll_seconds, wait):
+    """Generate plans for all users through a batch API, resumably."""
+    os.makedirs(workdir, exist_ok=True)
+    backends = {"openai": OpenAIBatchBackend,
+                "local": lambda: LocalBatchBackend(os.path.join(workdir, "local_batches"))}
+    for plan_kind in (BATCH_KINDS if kind == "all" else [kind]):
+        name = run_name if run_name and kind != "all" else f"{plan_kind}-{date.today().isoformat()}"
+        run = db.session.get(BatchRun, name)
+        if run is None:
+            run = BatchRun(id=name, kind=plan_kind, backend=backend, status="new",
+                           request_path=os.path.join(workdir, f"{name}.requests.jsonl"))
+            db.session.add(run)
+        client = backends[run.backend]()
+        try:
+            advance(run, client, chunk_size, poll_seconds, wait)
+        except Exception as e:
+            db.session.rollback()
+            click.echo(f"{name}: stopped at {run.status}: {e} (run the command again to resume)")
+        click.echo(f"{name}: {run.status}, {run.plans_saved} plan(s) saved, {run.failures} failure(s)")
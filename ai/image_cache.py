@@ -0,0 +1,139 @@
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import update
+from sqlalchemy.dialects.sqlite import insert
+
+from datamanager.models import db, ImageCacheEntry, ImageCacheStat
+
+
+def normalize_item_name(name: str) -> str:
+    """'  Grilled Chicken-Salad! ' → 'grilled chicken salad'"""
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", str(name).lower()).split())
+
+
+def image_cache_key(kind, name, gender=None):
+    """
+    Builds the cache key from everything the image prompt depends on:
+    meals only depend on the name, workouts also on the user's gender.
+    """
+    if kind == "workout":
+        return f"workout:{(gender or 'any').lower()}:{normalize_item_name(name)}"
+    return f"meal:{normalize_item_name(name)}"
+
+
+class ImageCache:
+    """
+    Persistent image index stored in SQLite, so every worker process shares it
+    and it survives restarts. Entries are evicted least-recently-used once the
+    index grows past IMAGE_CACHE_MAX_ENTRIES. Evicting an entry only drops it
+    from the index; the image file stays, since saved plans still link to it.
+
+    Lookups only read: hit/miss counters are kept in memory and written every
+    IMAGE_CACHE_FLUSH_SECONDS, and an entry's last_used_at is only moved once it
+    is IMAGE_CACHE_TOUCH_SECONDS old, which is all the LRU order needs.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._counts = defaultdict(lambda: {"hits": 0, "misses": 0})  # kind → not written yet
+        self._entry_hits = defaultdict(int)  # key → hits not written yet
+        self._touched = {}  # key → new last_used_at
+        self._flushed_at = time.monotonic()
+
+    def get(self, key, count=True):
+        """Returns the cached URL for key (and counts a hit) or None (and counts a miss, unless count=False)."""
+        kind = key.split(":", 1)[0]
+        entry = (db.session.query(ImageCacheEntry.url, ImageCacheEntry.last_used_at)
+                 .filter(ImageCacheEntry.key == key).first())
+        now = datetime.utcnow()
+        with self._lock:
+            if entry is None:
+                if count:
+                    self._counts[kind]["misses"] += 1
+            else:
+                self._counts[kind]["hits"] += 1
+                self._entry_hits[key] += 1
+                touch_after = timedelta(seconds=current_app.config.get("IMAGE_CACHE_TOUCH_SECONDS", 3600))
+                if now - entry.last_used_at >= touch_after:
+                    self._touched[key] = now
+            due = time.monotonic() - self._flushed_at >= current_app.config.get("IMAGE_CACHE_FLUSH_SECONDS", 30)
+        if due:
+            self.flush()
+        return entry.url if entry is not None else None
+
+    def put(self, key, url):
+        """Stores (or replaces) the URL for key and evicts old entries if needed."""
+        kind = key.split(":", 1)[0]
+        now = datetime.utcnow()
+        stmt = insert(ImageCacheEntry).values(key=key, kind=kind, url=url, hits=0,
+                                              created_at=now, last_used_at=now)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=[ImageCacheEntry.key],
+            set_={"url": stmt.excluded.url, "last_used_at": stmt.excluded.last_used_at},
+        ))
+        self._evict()
+        db.session.commit()
+
+    def flush(self):
+        """Writes the counters and last_used_at updates gathered since the last flush, on its own connection."""
+        with self._lock:
+            counts, entry_hits, touched = self._counts, self._entry_hits, self._touched
+            self._reset()
+        if not counts:
+            return
+        with db.engine.begin() as connection:
+            for kind, counter in counts.items():
+                connection.execute(self._count_stmt(kind, **counter))
+            for key, hits in entry_hits.items():
+                values = {"hits": ImageCacheEntry.hits + hits}
+                if key in touched:
+                    values["last_used_at"] = touched[key]
+                connection.execute(update(ImageCacheEntry).where(ImageCacheEntry.key == key).values(**values))
+
+    def stats(self):
+        """Entry count plus hit/miss/eviction counters per kind."""
+        self.flush()
+        counters = {row.kind: {"hits": row.hits, "misses": row.misses, "evictions": row.evictions}
+                    for row in ImageCacheStat.query.all()}
+        for counter in counters.values():
+            lookups = counter["hits"] + counter["misses"]
+            counter["hit_rate"] = round(counter["hits"] / lookups, 3) if lookups else None
+        return {"entries": ImageCacheEntry.query.count(), "kinds": counters}
+
+    def _evict(self):
+        max_entries = current_app.config.get("IMAGE_CACHE_MAX_ENTRIES", 5000)
+        excess = ImageCacheEntry.query.count() - max_entries
+        if excess <= 0:
+            return
+
+        oldest = (db.session.query(ImageCacheEntry.key, ImageCacheEntry.kind)
+                  .order_by(ImageCacheEntry.last_used_at)
+                  .limit(excess)
+                  .all())
+        (ImageCacheEntry.query
+         .filter(ImageCacheEntry.key.in_([key for key, _ in oldest]))
+         .delete(synchronize_session=False))
+        for _, kind in oldest:
+            db.session.execute(self._count_stmt(kind, evictions=1))
+
+    @staticmethod
+    def _count_stmt(kind, hits=0, misses=0, evictions=0):
+        # single UPSERT so concurrent workers never lose an increment
+        stmt = insert(ImageCacheStat).values(kind=kind, hits=hits, misses=misses, evictions=evictions)
+        return stmt.on_conflict_do_update(
+            index_elements=[ImageCacheStat.kind],
+            set_={"hits": ImageCacheStat.hits + hits,
+                  "misses": ImageCacheStat.misses + misses,
+                  "evictions": ImageCacheStat.evictions + evictions},
+        )
+
+
+image_cache = ImageCache()
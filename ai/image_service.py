@@ -0,0 +1,261 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+import contextvars
+import hashlib
+import hmac
+import re
+import threading
+
+import requests
+from flask import current_app
+
+from ai.image_cache import image_cache, image_cache_key, normalize_item_name
+from ai.image_variants import LAZY_IMAGE_PREFIX
+from ai.mealdb_mirror import find_meal_thumb, mirror_loaded
+from ai.openai_img import generate_meal_images, generate_workout_images
+from ai.single_flight import single_flight
+from datamanager.plan_items import iter_plan_items
+
+DEFAULT_MEAL_IMAGE = "/static/default_meal.jpg"
+DEFAULT_WORKOUT_IMAGE = "/static/default_workout.jpg"
+
+# The only user attribute the image prompts depend on. A plain tuple is
+# safe to hand to worker threads, unlike the ORM User object.
+ImageProfile = namedtuple("ImageProfile", ["gender"])
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Lazy images (IMAGE_MODE=lazy): plans link to /img/<kind>/<key> and the image is made on first view.
+LAZY_IMAGE_KEY = re.compile(r"[a-z0-9_]{1,120}")
+
+
+# Meal Image Fetcher with Caching
+def get_meal_image(meal_name: str) -> str:
+    """
+    Fetches a meal image from TheMealDB API by meal name, or generates one.
+    Results are kept in the persistent image cache, shared by all workers.
+    """
+    key = image_cache_key("meal", meal_name)
+    cached = image_cache.get(key)
+    if cached:
+        return cached
+    return _coalesced(key, lambda: _fetch_meal_image(meal_name), DEFAULT_MEAL_IMAGE)
+
+
+def _coalesced(key, fetch, placeholder):
+    """
+    Runs fetch() for an image cache miss, at most once at a time per image
+    across threads and worker processes (see ai/single_flight.py): concurrent
+    requests for the same image wait for the first one and share its result.
+    """
+    def fetch_once():
+        cached = image_cache.get(key, count=False)  # done by whoever held the lease before us
+        if cached:
+            return cached
+        image_url = fetch()
+        if image_url != placeholder:  # don't cache failures
+            image_cache.put(key, image_url)
+        return image_url
+
+    try:
+        return single_flight.do(f"image:{key}", fetch_once,
+                                timeout=current_app.config.get("IMAGE_DEADLINE_SECONDS", 90))
+    except TimeoutError:
+        print(f"[Image] {key!r} still being made elsewhere, using the placeholder")
+        return placeholder
+
+
+def _fetch_meal_image(meal_name: str) -> str:
+    # The local TheMealDB mirror (flask import-mealdb) answers without any network call;
+    # the live search API is only asked while no mirror has been imported.
+    if mirror_loaded():
+        return find_meal_thumb(meal_name) or generate_meal_images(meal_name)
+
+    try:
+        clean = meal_name.strip().title()  # normalize casing
+        response = requests.get(
+            f"https://www.themealdb.com/api/json/v1/1/search.php?s={clean}",
+            timeout=15,
+        )
+        data = response.json()
+        meals = data.get("meals")
+        if meals and meals[0].get("strMealThumb"):
+            return meals[0]["strMealThumb"]
+
+        # else generate a meal pic:
+        else:
+            generated_image_path = generate_meal_images(meal_name)
+            return generated_image_path
+
+    except Exception as e:
+        print(f"[Meal image fetch error] {meal_name!r}: {e}")
+        return generate_meal_images(meal_name)
+
+
+# Workout Image Fetcher with Caching
+def get_workout_image(workout_item, user) -> str:
+    """
+    Accepts either a workout dictionary or a plain string.
+    Always passes a proper dictionary to generate_workout_images().
+    Cached per workout name and gender, since both end up in the prompt.
+    """
+    # 🧠 1. Convert if it’s just a string
+    if isinstance(workout_item, str):
+        workout_data = {"name": workout_item}
+    else:
+        # assume it's already a dictionary
+        workout_data = workout_item
+
+    key = image_cache_key("workout", workout_data.get("name", ""), getattr(user, "gender", None))
+    cached = image_cache.get(key)
+    if cached:
+        return cached
+    return _coalesced(key, lambda: _generate_workout_image(workout_data, user), DEFAULT_WORKOUT_IMAGE)
+
+
+def _generate_workout_image(workout_data, user):
+    try:
+        return generate_workout_images(workout_data, user)
+    except Exception as e:
+        print(f"[Workout image fetch error] {workout_data.get('name', workout_data)!r}: {e}")
+        # Try one more time just using the name string
+        return generate_workout_images({"name": str(workout_data)}, user)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=current_app.config.get("IMAGE_WORKERS", 8),
+                thread_name_prefix="plan-image",
+            )
+    return _executor
+
+
+def _resolve_image(app, kind, name, profile):
+    # generate_*_images need current_app to find the static folder
+    with app.app_context():
+        if kind == "meal":
+            return get_meal_image(name)
+        return get_workout_image(name, profile)
+
+
+def attach_plan_images(plan_dict, user, deadline=None):
+    """
+    Resolves the images of all meals and workouts of a plan concurrently and
+    writes image_url back into each item dict, in place.
+
+    Identical names are looked up once. Items whose image is not ready within
+    `deadline` seconds (IMAGE_DEADLINE_SECONDS by default) get the placeholder
+    image, so plan latency is bounded by the slowest image or the deadline.
+    """
+    app = current_app._get_current_object()
+    if deadline is None:
+        deadline = app.config.get("IMAGE_DEADLINE_SECONDS", 90)
+    profile = ImageProfile(gender=getattr(user, "gender", None))
+
+    items = [(kind, item) for _, kind, _, item in iter_plan_items(plan_dict) if item.get("name")]
+
+    executor = _get_executor()
+    futures = {}
+    for kind, item in items:
+        key = (kind, item["name"])
+        if key not in futures:
+            # copy_context: image calls are accounted to the same route/user as the plan (see ai_usage)
+            futures[key] = executor.submit(contextvars.copy_context().run,
+                                           _resolve_image, app, kind, item["name"], profile)
+
+    done, not_done = wait(futures.values(), timeout=deadline)
+    if not_done:
+        print(f"[Plan images] {len(not_done)} image(s) not ready after {deadline}s, using placeholders")
+
+    # ordered write-back into the plan
+    for kind, item in items:
+        future = futures[(kind, item["name"])]
+        if future in done and future.exception() is None:
+            item["image_url"] = future.result()
+        else:
+            item["image_url"] = DEFAULT_MEAL_IMAGE if kind == "meal" else DEFAULT_WORKOUT_IMAGE
+
+    return plan_dict
+
+
+def attach_cached_images(plan_dict, user):
+    """
+    attach_plan_images without any network call: images already in the image
+    cache, placeholders for everything else. Used for local (offline) plans.
+    """
+    gender = getattr(user, "gender", None)
+    for _, kind, _, item in iter_plan_items(plan_dict):
+        url = image_cache.get(image_cache_key(kind, item["name"], gender)) if item.get("name") else None
+        item["image_url"] = url or (DEFAULT_MEAL_IMAGE if kind == "meal" else DEFAULT_WORKOUT_IMAGE)
+    return plan_dict
+
+
+def lazy_image_key(kind, name, gender=None):
+    """URL key of an item image, named like the image files: 'grilled_chicken', 'push_ups_male'."""
+    slug = normalize_item_name(name).replace(" ", "_")
+    if kind == "workout":
+        return f"{slug}_{(gender or 'any').lower()}"
+    return slug
+
+
+def parse_lazy_image_key(kind, key):
+    """lazy_image_key the other way round: (name, gender); None for a malformed key."""
+    if not LAZY_IMAGE_KEY.fullmatch(key):
+        return None
+    gender = None
+    if kind == "workout":
+        key, _, gender = key.rpartition("_")
+        if not key:
+            return None
+    return key.replace("_", " "), (None if gender == "any" else gender)
+
+
+def lazy_image_signature(kind, key):
+    """HMAC of an /img/ link under the app's secret key: only links the app wrote may generate an image."""
+    message = f"{kind}/{key}".encode()
+    return hmac.new(current_app.secret_key.encode(), message, hashlib.sha256).hexdigest()[:16]
+
+
+def lazy_image_url(kind, name, gender=None):
+    """'/img/meal/tofu_bowl?s=<signature>'"""
+    key = lazy_image_key(kind, name, gender)
+    return f"{LAZY_IMAGE_PREFIX}{kind}/{key}?s={lazy_image_signature(kind, key)}"
+
+
+def verify_lazy_image(kind, key, signature):
+    return bool(signature) and hmac.compare_digest(signature, lazy_image_signature(kind, key))
+
+
+def attach_lazy_images(plan_dict, user, use_cache=True):
+    """
+    Like attach_cached_images, but items without a cached image link to
+    /img/<kind>/<key>?s=<signature>, which generates the image the first time it is viewed
+    (see resolve_lazy_image). The plan never waits for an image.
+    use_cache=False links every item lazily without touching the database.
+    """
+    gender = getattr(user, "gender", None)
+    for _, kind, _, item in iter_plan_items(plan_dict):
+        if not item.get("name"):
+            item["image_url"] = DEFAULT_MEAL_IMAGE if kind == "meal" else DEFAULT_WORKOUT_IMAGE
+            continue
+        url = image_cache.get(image_cache_key(kind, item["name"], gender)) if use_cache else None
+        item["image_url"] = url or lazy_image_url(kind, item["name"], gender)
+    return plan_dict
+
+
+def resolve_lazy_image(kind, name, gender):
+    """
+    The image URL for an item, looked up or generated on demand. Concurrent
+    requests for the same image share one lookup/generation (see _coalesced).
+    """
+    try:
+        if kind == "meal":
+            return get_meal_image(name)
+        return get_workout_image(name, ImageProfile(gender=gender))
+    except Exception as e:
+        print(f"[Lazy image] {kind} {name!r}: {e}")
+        return DEFAULT_MEAL_IMAGE if kind == "meal" else DEFAULT_WORKOUT_IMAGE
@@ -0,0 +1,151 @@
+import glob
+import os
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from http_cache import hashed_static_url
+
+try:
+    from PIL import Image, features
+except ImportError:  # without Pillow no derivatives are written and the originals are served as before
+    Image = None
+
+# Derivatives written next to each saved image: <name>.thumb.webp, <name>.medium.webp (+ .avif)
+VARIANT_WIDTHS = {"thumb": 160, "medium": 640}
+# Where an image is shown → the variant for its `src` and the `sizes` hint for the browser.
+CONTEXTS = {
+    "list": ("thumb", "80px"),  # dashboard rows, w-20 h-20
+    "card": ("medium", "240px"),  # daily_meals / daily_workouts cards, w-60
+    "detail": ("medium", "(min-width: 700px) 640px, 100vw"),  # item_details
+}
+QUALITY = {"webp": 80, "avif": 60}
+# Plan images saved as signed /img/<kind>/<key>?s=... links (see ai.image_service.attach_lazy_images);
+# their variants are asked for with &size=thumb|medium[&format=avif] and picked by that route.
+LAZY_IMAGE_PREFIX = "/img/"
+# TheMealDB serves its own resized copies under these suffixes (originals are 700px wide)
+THEMEALDB_PREFIX = "https://www.themealdb.com/images/"
+THEMEALDB_SIZES = {"thumb": ("small", 250), "medium": ("medium", 500)}
+
+_existing = set()  # variant files seen on disk; they are never deleted once written
+
+
+def variant_formats():
+    """WebP always, AVIF too when this Pillow build can encode it."""
+    formats = ["webp"]
+    try:
+        if features.check("avif"):
+            formats.append("avif")
+    except (ValueError, AttributeError):
+        pass
+    return formats
+
+
+def variant_path(original_path, variant, fmt):
+    return f"{os.path.splitext(original_path)[0]}.{variant}.{fmt}"
+
+
+def is_variant(path):
+    return any(f".{variant}." in os.path.basename(path) for variant in VARIANT_WIDTHS)
+
+
+def write_variants(original_path):
+    """Writes the resized derivatives of a saved image that do not exist yet; returns their paths."""
+    if Image is None:
+        return []
+    written = []
+    with Image.open(original_path) as image:
+        image.load()
+        for variant, width in VARIANT_WIDTHS.items():
+            resized = image.copy()
+            resized.thumbnail((width, width), Image.LANCZOS)  # keeps the aspect ratio
+            if resized.mode not in ("RGB", "RGBA"):
+                resized = resized.convert("RGB")
+            for fmt in variant_formats():
+                path = variant_path(original_path, variant, fmt)
+                if os.path.exists(path):
+                    continue
+                resized.save(path, fmt.upper(), quality=QUALITY[fmt])
+                _existing.add(path)
+                written.append(path)
+    return written
+
+
+def _static_path(url):
+    """'/static/meal_images/x.png' → absolute file path, or None for anything not under /static/."""
+    if not url or not url.startswith("/static/"):
+        return None
+    return os.path.join(current_app.static_folder, url[len("/static/"):])
+
+
+def _variant_exists(path):
+    if path in _existing:
+        return True
+    if os.path.exists(path):
+        _existing.add(path)
+        return True
+    return False
+
+
+def variant_url(url, variant, fmt="webp"):
+    """URL of an image's derivative if there is one, else the original URL."""
+    if url and url.startswith(LAZY_IMAGE_PREFIX):
+        # not resolved yet: the /img/ route redirects to the derivative, or the original if it has none
+        if Image is None or fmt not in variant_formats():
+            return url
+        query = f"size={variant}" if fmt == "webp" else f"size={variant}&format={fmt}"
+        return f"{url}{'&' if '?' in url else '?'}{query}"
+    if url and url.startswith(THEMEALDB_PREFIX) and fmt == "webp":
+        return f"{url}/{THEMEALDB_SIZES[variant][0]}"
+    path = _static_path(url)
+    if path is None or is_variant(path):
+        return url
+    candidate = variant_path(path, variant, fmt)
+    if not _variant_exists(candidate):
+        return url
+    return "/static/" + os.path.relpath(candidate, current_app.static_folder).replace(os.sep, "/")
+
+
+def image_src(url, context="list"):
+    """Jinja filter: the `src` for an image shown in `context` (see CONTEXTS), content-hashed."""
+    return hashed_static_url(variant_url(url, CONTEXTS[context][0]))
+
+
+def image_sizes(context="list"):
+    """Jinja filter: the `sizes` attribute for `context`."""
+    return CONTEXTS[context][1]
+
+
+def image_srcset(url, fmt="webp"):
+    """Jinja filter: 'thumb.webp 160w, medium.webp 640w' for the derivatives that exist, '' if none."""
+    if url and url.startswith(THEMEALDB_PREFIX):
+        if fmt != "webp":
+            return ""
+        return ", ".join(f"{url}/{suffix} {width}w" for suffix, width in THEMEALDB_SIZES.values()) + f", {url} 700w"
+    entries = []
+    for variant, width in VARIANT_WIDTHS.items():
+        candidate = variant_url(url, variant, fmt)
+        if candidate != url:
+            entries.append(f"{hashed_static_url(candidate)} {width}w")
+    return ", ".join(entries)
+
+
+@click.command("image-variants")
+@with_appcontext
+def image_variants_command():
+    """Write the missing thumbnail/medium derivatives of every image under static/."""
+    if Image is None:
+        raise click.ClickException("Pillow is not installed (pip install Pillow)")
+    static = current_app.static_folder
+    paths = [path
+             for pattern in ("meal_images/*.png", "workout_images/*.png", "default_*.jpg")
+             for path in glob.glob(os.path.join(static, pattern))
+             if not is_variant(path)]
+    written = 0
+    for path in paths:
+        try:
+            written += len(write_variants(path))
+        except OSError as e:
+            click.echo(f"skipped {path}: {e}")
+    click.echo(f"Wrote {written} derivative(s) for {len(paths)} image(s) in {', '.join(variant_formats())}.")
@@ -0,0 +1,151 @@
+import functools
+import random
+from datetime import datetime, timedelta
+
+from flask import current_app, has_app_context
+
+from ai.single_flight import single_flight
+from datamanager.models import db, DailyPlan, LLMCacheEntry, WeeklyPlan
+
+# Which user fields end up in each generator's prompt. Workouts ignore the diet.
+PROFILE_FIELDS = {
+    "daily_meals": ("age", "gender", "weight", "height", "fitness_goal", "activity_level", "dietary_pref"),
+    "daily_workouts": ("age", "gender", "weight", "height", "fitness_goal", "activity_level"),
+    "daily_plan": ("age", "gender", "weight", "height", "fitness_goal", "activity_level", "dietary_pref"),
+    "weekly_plan": ("age", "gender", "weight", "height", "fitness_goal", "activity_level", "dietary_pref"),
+}
+
+# Numeric fields are bucketed so that similar profiles share cached plans.
+BAND_WIDTHS = {"age": 5, "weight": 5, "height": 5}
+
+
+def _band(value, width):
+    try:
+        low = int(float(value) // width * width)
+    except (TypeError, ValueError):
+        return "?"
+    return f"{low}-{low + width - 1}"
+
+
+def profile_fingerprint(kind, user):
+    """
+    'daily_meals|age=30-34|gender=male|weight=80-84|...' built from the prompt-relevant
+    user fields. Weekly plans start on today's weekday, so that is part of their key too.
+    """
+    parts = [kind]
+    for field in PROFILE_FIELDS[kind]:
+        value = getattr(user, field, None)
+        if field in BAND_WIDTHS:
+            value = _band(value, BAND_WIDTHS[field])
+        else:
+            value = " ".join(str(value or "").lower().split())
+        parts.append(f"{field}={value}")
+    if kind == "weekly_plan":
+        parts.append(f"start={datetime.today().strftime('%A')}")
+    return "|".join(parts)
+
+
+def is_regeneration(kind, user):
+    """
+    Whether the user already has a saved plan of `kind`: asking again means they want a
+    different plan, which a cached variant would not give them.
+    """
+    user_id = getattr(user, "id", None)
+    if user_id is None:
+        return False
+    if kind == "weekly_plan":
+        query = db.session.query(WeeklyPlan.id).filter(WeeklyPlan.user_id == user_id)
+    else:
+        query = db.session.query(DailyPlan.id).filter(DailyPlan.user_id == user_id)
+        if kind in ("daily_meals", "daily_plan"):
+            query = query.filter(DailyPlan.has_meals.is_(True))
+        if kind in ("daily_workouts", "daily_plan"):
+            query = query.filter(DailyPlan.has_workouts.is_(True))
+    return db.session.query(query.exists()).scalar()
+
+
+class LLMCache:
+    """
+    Keeps up to LLM_CACHE_VARIANTS generated responses per profile fingerprint for
+    LLM_CACHE_TTL_SECONDS. Until a key has all its variants, every request is a miss
+    that adds one; after that, requests are served from the stored variants
+    (round-robin by default, or random with LLM_CACHE_SELECTION="random").
+    """
+
+    def get_or_generate(self, kind, user, schema, generate):
+        key = profile_fingerprint(kind, user)
+        config = current_app.config
+        now = datetime.utcnow()
+
+        variants = (LLMCacheEntry.query
+                    .filter(LLMCacheEntry.key == key, LLMCacheEntry.expires_at > now)
+                    .order_by(LLMCacheEntry.served_count, LLMCacheEntry.id)
+                    .all())
+
+        if len(variants) >= config.get("LLM_CACHE_VARIANTS", 3):
+            if config.get("LLM_CACHE_SELECTION", "round_robin") == "random":
+                entry = random.choice(variants)
+            else:
+                entry = variants[0]  # least served first
+            (LLMCacheEntry.query
+             .filter_by(id=entry.id)
+             .update({"served_count": LLMCacheEntry.served_count + 1}, synchronize_session=False))
+            db.session.commit()
+            return schema.model_validate_json(entry.response_json)
+
+        def generate_once():
+            # whoever held the key before us may just have stored a variant: share it instead of making another
+            fresh = (LLMCacheEntry.query
+                     .filter(LLMCacheEntry.key == key, LLMCacheEntry.created_at >= now)
+                     .order_by(LLMCacheEntry.id.desc())
+                     .first())
+            if fresh is not None:
+                return fresh.response_json
+            result = generate()
+            if result is None:  # a refusal parses to None; don't serve that to anyone else
+                return None
+            self.put(key, kind, result)
+            return result.model_dump_json()
+
+        # Concurrent misses for one key (threads or worker processes) wait for a single generation.
+        try:
+            response_json = single_flight.do(f"llm:{key}", generate_once,
+                                             timeout=config.get("LLM_CACHE_WAIT_SECONDS", 120))
+        except TimeoutError:
+            return generate()
+        return schema.model_validate_json(response_json) if response_json is not None else None
+
+    def put(self, key, kind, result):
+        """Stores one more variant for key and drops the key's expired ones."""
+        now = datetime.utcnow()
+        ttl = timedelta(seconds=current_app.config.get("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+        (LLMCacheEntry.query
+         .filter(LLMCacheEntry.key == key, LLMCacheEntry.expires_at <= now)
+         .delete(synchronize_session=False))
+        db.session.add(LLMCacheEntry(key=key, kind=kind, response_json=result.model_dump_json(),
+                                     served_count=1, created_at=now, expires_at=now + ttl))
+        db.session.commit()
+
+
+llm_cache = LLMCache()
+
+
+def cached_generation(kind, schema):
+    """
+    Decorator putting the LLM cache in front of a generate_*(user) function.
+    It only applies with LLM_CACHE_ENABLED = True (off by default), and not when the user
+    regenerates a kind of plan they already have (see is_regeneration); otherwise, and
+    outside a Flask app context, it calls straight through.
+    The undecorated function stays reachable as .uncached.
+    """
+    def decorator(generate):
+        @functools.wraps(generate)
+        def wrapper(user):
+            if (not has_app_context() or not current_app.config.get("LLM_CACHE_ENABLED", False)
+                    or is_regeneration(kind, user)):
+                return generate(user)
+            return llm_cache.get_or_generate(kind, user, schema, lambda: generate(user))
+
+        wrapper.uncached = generate
+        return wrapper
+    return decorator
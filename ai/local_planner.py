@@ -0,0 +1,301 @@
+"""
+Rule-based plan engine: builds meals and workouts from a small local catalog,
+without any network call, in the same Pydantic shapes as the OpenAI generators.
+Plans are deterministic for a given user, plan kind and day.
+"""
+import random
+import re
+from datetime import date
+
+from ai.openai_service import (Meal, Exercise, DailyPlan, DailyMealsOnly, DailyWorkoutsOnly, DayPlan, WeeklyPlan,
+                               training_split, week_schedule)
+
+ALL_DIETS = frozenset({"vegetarian", "vegan", "keto", "pescatarian", "halal", "gluten-free"})
+
+
+def _meal(slot, name, ingredients, description, calories, protein, carbs, fats, diets):
+    return {"slot": slot, "name": name, "ingredients": ingredients, "description": description,
+            "calories": calories, "protein": protein, "carbs": carbs, "fats": fats,
+            "diets": frozenset(diets.split(","))}
+
+
+# slot, name, ingredients, description, kcal, protein g, carbs g, fats g, diets the meal fits
+MEAL_CATALOG = [
+    _meal("breakfast", "Oats Bowl with Berries", "Oats, almond milk, mixed berries, chia seeds",
+          "Simmer oats in almond milk and top with berries and chia.", 380, 14, 58, 10,
+          "vegan,vegetarian,pescatarian,halal"),
+    _meal("breakfast", "Greek Yogurt Parfait", "Greek yogurt, granola, honey, berries",
+          "Layer yogurt, granola and berries, drizzle with honey.", 350, 22, 45, 9,
+          "vegetarian,pescatarian,halal"),
+    _meal("breakfast", "Spinach Feta Omelette", "Eggs, spinach, feta, olive oil",
+          "Whisk eggs, cook with wilted spinach and fold in feta.", 320, 24, 4, 23,
+          "vegetarian,pescatarian,halal,keto,gluten-free"),
+    _meal("breakfast", "Tofu Scramble with Peppers", "Firm tofu, bell peppers, onion, turmeric, olive oil",
+          "Crumble tofu into sautéed peppers and onion, season with turmeric.", 300, 20, 12, 18,
+          "vegan,vegetarian,pescatarian,halal,keto,gluten-free"),
+    _meal("breakfast", "Chia Coconut Pudding", "Chia seeds, coconut milk, vanilla, almonds",
+          "Soak chia in coconut milk overnight, top with almonds.", 330, 8, 12, 27,
+          "vegan,vegetarian,pescatarian,halal,keto,gluten-free"),
+    _meal("breakfast", "Smoked Salmon Avocado Toast", "Wholegrain bread, smoked salmon, avocado, lemon",
+          "Toast bread, spread avocado and top with salmon and lemon.", 420, 24, 34, 20,
+          "pescatarian,halal"),
+    _meal("breakfast", "Chicken Sausage and Egg Skillet", "Chicken sausage, eggs, zucchini, olive oil",
+          "Brown sliced sausage with zucchini, crack in eggs and cover until set.", 410, 32, 6, 28,
+          "halal,keto,gluten-free"),
+    _meal("breakfast", "Buckwheat Banana Pancakes", "Buckwheat flour, banana, eggs, milk",
+          "Mix batter, cook small pancakes on a non-stick pan.", 400, 15, 62, 10,
+          "vegetarian,pescatarian,halal,gluten-free"),
+
+    _meal("main", "Grilled Chicken Quinoa Bowl", "Chicken breast, quinoa, cucumber, tomato, lemon",
+          "Grill chicken and serve over quinoa with chopped vegetables.", 550, 45, 50, 16,
+          "halal,gluten-free"),
+    _meal("main", "Beef Stir-Fry with Brown Rice", "Lean beef, broccoli, peppers, tamari, brown rice",
+          "Stir-fry beef and vegetables with tamari, serve with rice.", 600, 40, 58, 20,
+          "halal,gluten-free"),
+    _meal("main", "Baked Salmon with Sweet Potato", "Salmon fillet, sweet potato, green beans",
+          "Bake salmon and sweet potato wedges, steam the beans.", 580, 38, 45, 24,
+          "pescatarian,halal,gluten-free"),
+    _meal("main", "Lentil Curry with Basmati Rice", "Red lentils, tomato, coconut milk, curry spices, rice",
+          "Simmer lentils with spices and tomato, serve with rice.", 520, 24, 80, 10,
+          "vegan,vegetarian,pescatarian,halal,gluten-free"),
+    _meal("main", "Chickpea Spinach Stew", "Chickpeas, spinach, tomato, garlic, cumin",
+          "Cook chickpeas in spiced tomato sauce and stir in spinach.", 480, 20, 62, 14,
+          "vegan,vegetarian,pescatarian,halal,gluten-free"),
+    _meal("main", "Turkey Meatballs with Zucchini Noodles", "Ground turkey, zucchini, tomato sauce, parmesan",
+          "Bake meatballs and toss with sautéed zucchini noodles and sauce.", 480, 42, 14, 26,
+          "halal,keto,gluten-free"),
+    _meal("main", "Tuna Niçoise Salad", "Tuna, eggs, green beans, potatoes, olives",
+          "Arrange tuna, eggs and vegetables, dress with olive oil and lemon.", 450, 36, 18, 24,
+          "pescatarian,halal,gluten-free"),
+    _meal("main", "Halloumi Veggie Wrap", "Halloumi, tortilla, peppers, hummus, rocket",
+          "Grill halloumi and peppers, wrap with hummus and rocket.", 520, 22, 50, 24,
+          "vegetarian,pescatarian,halal"),
+    _meal("main", "Steak with Garlic Butter Broccoli", "Sirloin steak, broccoli, butter, garlic",
+          "Pan-sear steak, sauté broccoli in garlic butter.", 620, 48, 10, 42,
+          "halal,keto,gluten-free"),
+    _meal("main", "Shrimp Cauliflower Rice Bowl", "Shrimp, cauliflower rice, avocado, lime",
+          "Sauté shrimp, serve on cauliflower rice with avocado.", 430, 36, 16, 22,
+          "pescatarian,halal,keto,gluten-free"),
+    _meal("main", "Tofu Teriyaki Noodles", "Tofu, wheat noodles, teriyaki sauce, bok choy",
+          "Glaze tofu in teriyaki and toss with noodles and bok choy.", 540, 26, 72, 14,
+          "vegan,vegetarian,pescatarian,halal"),
+    _meal("main", "Black Bean Burrito Bowl", "Black beans, rice, corn, salsa, avocado",
+          "Layer rice, beans, corn and salsa, top with avocado.", 560, 22, 82, 14,
+          "vegan,vegetarian,pescatarian,halal,gluten-free"),
+    _meal("main", "Paneer Tikka with Salad", "Paneer, yogurt, tikka spices, mixed salad",
+          "Marinate and grill paneer, serve with salad.", 480, 28, 14, 32,
+          "vegetarian,pescatarian,halal,keto,gluten-free"),
+    _meal("main", "Coconut Tofu Curry with Cauliflower", "Tofu, coconut milk, curry paste, cauliflower",
+          "Simmer tofu and cauliflower in coconut curry.", 460, 22, 16, 34,
+          "vegan,vegetarian,pescatarian,halal,keto,gluten-free"),
+    _meal("main", "Chicken Pesto Pasta", "Whole wheat pasta, chicken breast, pesto, cherry tomatoes",
+          "Toss cooked pasta with grilled chicken, pesto and tomatoes.", 620, 40, 68, 20,
+          "halal"),
+
+    _meal("snack", "Apple with Peanut Butter", "Apple, peanut butter", "Slice the apple and dip in peanut butter.",
+          220, 6, 26, 12, "vegan,vegetarian,pescatarian,halal,gluten-free"),
+    _meal("snack", "Greek Yogurt with Honey", "Greek yogurt, honey", "Stir honey into the yogurt.",
+          180, 15, 20, 4, "vegetarian,pescatarian,halal,gluten-free"),
+    _meal("snack", "Hummus with Carrot Sticks", "Hummus, carrots", "Dip carrot sticks in hummus.",
+          200, 7, 22, 10, "vegan,vegetarian,pescatarian,halal,gluten-free"),
+    _meal("snack", "Mixed Nuts", "Almonds, walnuts, cashews", "A small handful of unsalted nuts.",
+          200, 6, 8, 17, "vegan,vegetarian,pescatarian,halal,keto,gluten-free"),
+    _meal("snack", "Olives and Almonds", "Green olives, almonds", "Serve together in a small bowl.",
+          210, 5, 6, 19, "vegan,vegetarian,pescatarian,halal,keto,gluten-free"),
+    _meal("snack", "Boiled Eggs", "Eggs, salt, pepper", "Boil two eggs for 9 minutes.",
+          160, 13, 1, 11, "vegetarian,pescatarian,halal,keto,gluten-free"),
+    _meal("snack", "Protein Smoothie", "Whey protein, banana, milk", "Blend everything with ice.",
+          250, 25, 28, 5, "vegetarian,pescatarian,halal,gluten-free"),
+    _meal("snack", "Cheese and Cucumber Bites", "Cheddar, cucumber", "Top cucumber slices with cheese.",
+          170, 10, 4, 13, "vegetarian,pescatarian,halal,keto,gluten-free"),
+]
+
+# name, type, muscle tags, instructions
+EXERCISE_CATALOG = [
+    ("Overhead Dumbbell Press", "Strength", {"shoulders"}, "Press the dumbbells overhead without arching the back."),
+    ("Lateral Raises", "Strength", {"shoulders"}, "Raise the dumbbells to shoulder height with soft elbows."),
+    ("Pike Push-Ups", "Strength", {"shoulders", "triceps"}, "Hips high, lower the head towards the floor."),
+    ("Push-Ups", "Strength", {"chest", "triceps"}, "Keep the core tight and use the full range of motion."),
+    ("Dumbbell Bench Press", "Strength", {"chest"}, "Lower the dumbbells to chest level, press up evenly."),
+    ("Incline Dumbbell Fly", "Strength", {"chest"}, "Open the arms wide with a slight bend, squeeze the chest."),
+    ("Bent-Over Dumbbell Row", "Strength", {"back"}, "Flat back, pull the elbows past the torso."),
+    ("Lat Pulldown", "Strength", {"back", "biceps"}, "Pull the bar to the upper chest, control the return."),
+    ("Superman Hold", "Strength", {"back", "core"}, "Lift arms and legs off the floor and hold."),
+    ("Triceps Dips", "Strength", {"triceps"}, "Lower until the elbows reach 90 degrees, press back up."),
+    ("Overhead Triceps Extension", "Strength", {"triceps"}, "Keep the elbows pointing forward."),
+    ("Dumbbell Biceps Curl", "Strength", {"biceps"}, "Curl without swinging, lower slowly."),
+    ("Hammer Curl", "Strength", {"biceps"}, "Neutral grip, elbows close to the body."),
+    ("Goblet Squat", "Strength", {"legs"}, "Chest up, sit between the heels, drive through the feet."),
+    ("Romanian Deadlift", "Strength", {"legs", "back"}, "Hinge at the hips with a flat back."),
+    ("Walking Lunges", "Strength", {"legs"}, "Long steps, back knee just above the floor."),
+    ("Plank", "Strength", {"core"}, "Straight line from head to heels, breathe steadily."),
+    ("Dead Bug", "Strength", {"core"}, "Press the lower back into the floor while extending opposite limbs."),
+    ("Russian Twists", "Strength", {"core"}, "Rotate from the torso, feet on the floor if needed."),
+    ("Kettlebell Swings", "Strength", {"full", "legs"}, "Snap the hips forward, let the arms follow."),
+    ("Burpees", "Cardio", {"full", "cardio"}, "Squat, jump back to plank, return and jump. 40 sec work + 20 sec rest."),
+    ("Mountain Climbers", "Cardio", {"full", "core", "cardio"}, "Drive the knees quickly. 30 sec work + 30 sec rest."),
+    ("Interval Run", "Cardio", {"cardio"}, "Run fast 1 min + jog 3 min, repeat 5 times."),
+    ("Jump Rope Intervals", "Cardio", {"cardio"}, "Skip fast 45 sec + easy 45 sec, repeat 8 times."),
+    ("Rowing Machine Intervals", "Cardio", {"cardio", "full"}, "Row hard 250 m + easy 1 min, repeat 6 times."),
+]
+WARM_UP = ("Dynamic Warm-Up", "Flexibility", "Arm circles, leg swings and jumping jacks.")
+RECOVERY = ("Mobility and Stretching", "Flexibility",
+            "Today is a rest day. Focus on recovery, hydration, and stretching: 20 min of gentle full-body stretches.")
+
+# focus wording in training_split() → catalog muscle tags
+FOCUS_TAGS = {"shoulders": {"shoulders"}, "chest": {"chest"}, "pecs": {"chest"}, "back": {"back"},
+              "triceps": {"triceps"}, "biceps": {"biceps"}, "legs": {"legs"}, "core": {"core"},
+              "cardio": {"cardio"}, "full body": {"full"}, "hit": {"full", "cardio"}}
+
+ACTIVITY_FACTORS = {"sedentary": 1.2, "light": 1.375, "moderate": 1.55, "active": 1.725, "very_active": 1.9}
+INTENSITY = {"sedentary": ("Low", "90 sec"), "light": ("Low", "90 sec"), "moderate": ("Moderate", "60 sec")}
+
+
+def _rng(kind, user, on=None):
+    # the same user, plan kind and day always give the same plan
+    return random.Random(f"{kind}|{getattr(user, 'id', None)}|{user.age}|{user.gender}|{user.weight}|"
+                         f"{user.fitness_goal}|{user.activity_level}|{user.dietary_pref}|{on or date.today()}")
+
+
+def _goal(user):
+    goal = (user.fitness_goal or "").lower()
+    return "lose" if goal.startswith("lose") else "gain" if goal.startswith("gain") else "maintain"
+
+
+def daily_calories(user):
+    """Mifflin-St Jeor resting energy × activity factor, adjusted for the goal."""
+    bmr = 10 * float(user.weight) + 6.25 * float(user.height) - 5 * int(user.age)
+    bmr += 5 if (user.gender or "").lower() == "male" else -161
+    calories = bmr * ACTIVITY_FACTORS.get((user.activity_level or "").lower(), 1.55)
+    return max(calories + {"lose": -500, "gain": 300}.get(_goal(user), 0), 1200)
+
+
+def _fits_diet(meal, user):
+    diet = (user.dietary_pref or "").strip().lower()
+    return diet not in ALL_DIETS or diet in meal["diets"]
+
+
+def _slots(main_meals, snacks):
+    """Main meals each followed by a snack while snacks last: breakfast, snack, main, snack, main ..."""
+    slots = []
+    for i in range(main_meals):
+        slots.append("breakfast" if i == 0 else "main")
+        if i < snacks:
+            slots.append("snack")
+    return slots
+
+
+def _meals(rng, user, main_meals, snacks, calories):
+    slots = _slots(main_meals, snacks)
+    snack_share = 0.1
+    main_share = (1 - snack_share * snacks) / main_meals
+    used = set()
+    meals = []
+    for i, slot in enumerate(slots):
+        candidates = [m for m in MEAL_CATALOG if m["slot"] == slot and _fits_diet(m, user)] \
+            or [m for m in MEAL_CATALOG if m["slot"] == slot]
+        fresh = [m for m in candidates if m["name"] not in used] or candidates
+        meal = rng.choice(fresh)
+        used.add(meal["name"])
+
+        # scale the portion towards this slot's share of the day's calories
+        share = snack_share if slot == "snack" else main_share
+        scale = min(max(calories * share / meal["calories"], 0.6), 1.6)
+        next_slot = slots[i + 1] if i + 1 < len(slots) else None
+        meals.append(Meal(
+            name=meal["name"],
+            ingredients=meal["ingredients"],
+            description=meal["description"],
+            calories=round(meal["calories"] * scale),
+            protein=round(meal["protein"] * scale),
+            carbs=round(meal["carbs"] * scale),
+            fats=round(meal["fats"] * scale),
+            rest_between_meals="2 - 3 h" if next_slot == "snack" else "1 - 2 h" if next_slot else "-",
+        ))
+    return meals
+
+
+def _first_number_range(text):
+    # "3 sets per exercise" → "3", "10 to 12 reps" → "10-12"
+    return "-".join(re.findall(r"\d+", text or "")) or "-"
+
+
+def _workouts(rng, user, focus, sets, reps, w_time, count, warm_up):
+    intensity, rest = INTENSITY.get((user.activity_level or "").lower(), ("High", "45 sec"))
+    if focus == "Rest":
+        name, w_type, instructions = RECOVERY
+        return [Exercise(name=name, type=w_type, duration="20 min", intensity="Low", sets="-", reps="-",
+                         rest_between_sets="-", instructions=instructions, workout_time="20 min", focus="Rest")]
+
+    wanted = set().union(*(tags for word, tags in FOCUS_TAGS.items() if word in focus.lower())) or {"full"}
+    candidates = [e for e in EXERCISE_CATALOG if e[2] & wanted]
+    chosen = rng.sample(candidates, min(count, len(candidates)))
+
+    minutes = int(_first_number_range(w_time).split("-")[0] or 30)
+    per_exercise = f"{max((minutes - (10 if warm_up else 0)) // max(len(chosen), 1), 5)} min"
+    workouts = []
+    if warm_up:
+        name, w_type, instructions = WARM_UP
+        workouts.append(Exercise(name=name, type=w_type, duration="10 min", intensity="Low", sets="-", reps="-",
+                                 rest_between_sets="-", instructions=instructions, workout_time=w_time, focus=focus))
+    for name, w_type, _, instructions in chosen:
+        cardio = w_type == "Cardio"
+        workouts.append(Exercise(
+            name=name, type=w_type, duration=per_exercise, intensity=intensity,
+            sets="-" if cardio else _first_number_range(sets),
+            reps="-" if cardio else _first_number_range(reps),
+            rest_between_sets="-" if cardio else rest,
+            instructions=instructions, workout_time=w_time, focus=focus,
+        ))
+    return workouts
+
+
+def local_daily_meals(user):
+    """2 main meals + 2 snacks, like generate_daily_meals."""
+    return DailyMealsOnly(meals=_meals(_rng("daily_meals", user), user, 2, 2, daily_calories(user) * 0.7))
+
+
+def local_daily_workouts(user):
+    """Warm-up + 2 exercises for today's focus of the training split, like generate_daily_workouts."""
+    sets, reps, _, w_time = training_split(user)
+    today = week_schedule(user)[0]
+    return DailyWorkoutsOnly(workouts=_workouts(_rng("daily_workouts", user), user, today["focus"],
+                                                sets, reps, w_time, count=2, warm_up=True))
+
+
+def local_daily_plan(user):
+    """5 meals when losing weight, 6 otherwise, plus 3 workouts for today's focus, like generate_daily_plan."""
+    rng = _rng("daily_plan", user)
+    sets, reps, _, w_time = training_split(user)
+    snacks = 2 if _goal(user) == "lose" else 3
+    return DailyPlan(
+        meals=_meals(rng, user, 3, snacks, daily_calories(user)),
+        workouts=_workouts(rng, user, week_schedule(user)[0]["focus"], sets, reps, w_time, count=3, warm_up=False),
+    )
+
+
+def local_weekly_plan(user):
+    """Seven days following week_schedule(): 5 meals a day (6 when active), 3 workouts or a rest day."""
+    rng = _rng("weekly_plan", user)
+    sets, reps, _, w_time = training_split(user)
+    snacks = 3 if (user.activity_level or "").lower() in ("active", "very_active") else 2
+    calories = daily_calories(user)
+
+    days = {}
+    for day in week_schedule(user):
+        rest = day["focus"] == "Rest"
+        days[day["weekday"]] = DayPlan(
+            meals=_meals(rng, user, 3, snacks, calories),
+            workouts=[] if rest else _workouts(rng, user, day["focus"], sets, reps, w_time, count=3, warm_up=False),
+            rest_day=rest,
+            notes=RECOVERY[2] if rest else f"Focus: {day['focus']}",
+        )
+    return WeeklyPlan(**days)
+
+
+LOCAL_GENERATORS = {
+    "daily_meals": local_daily_meals,
+    "daily_workouts": local_daily_workouts,
+    "daily_plan": local_daily_plan,
+    "weekly_plan": local_weekly_plan,
+}
@@ -0,0 +1,135 @@
+import json
+import threading
+import time
+from collections import defaultdict
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete
+from sqlalchemy.dialects.sqlite import insert
+
+from ai.image_cache import normalize_item_name
+from datamanager.models import db, MealDBMeal, MealDBTrigram
+
+
+def name_trigrams(name):
+    """
+    Trigram set of a meal name, per word and padded like pg_trgm does:
+    'Beef Stew' → {'  b', ' be', 'bee', 'eef', 'ef ', '  s', ' st', 'ste', 'tew', 'ew '}
+    """
+    trigrams = set()
+    for word in normalize_item_name(name).split():
+        padded = f"  {word} "
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+
+def read_dump(path):
+    """Meals of a TheMealDB dump: a search.php response ({"meals": [...]}) or a plain list of meals."""
+    with open(path) as f:
+        data = json.load(f)
+    meals = data.get("meals") if isinstance(data, dict) else data
+    return [meal for meal in meals or [] if meal.get("idMeal") and meal.get("strMeal") and meal.get("strMealThumb")]
+
+
+def import_meals(meals):
+    """Upserts TheMealDB meal dicts into the mirror and rebuilds their trigram rows. Returns the count."""
+    global _index
+    for meal in meals:
+        trigrams = name_trigrams(meal["strMeal"])
+        meal_id = int(meal["idMeal"])
+        stmt = insert(MealDBMeal).values(id=meal_id, name=meal["strMeal"], category=meal.get("strCategory"),
+                                         area=meal.get("strArea"), thumb_url=meal["strMealThumb"],
+                                         trigram_count=len(trigrams))
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=[MealDBMeal.id],
+            set_={column: stmt.excluded[column] for column in ("name", "category", "area", "thumb_url",
+                                                               "trigram_count")},
+        ))
+        db.session.execute(delete(MealDBTrigram).where(MealDBTrigram.meal_id == meal_id))
+        if trigrams:
+            db.session.execute(insert(MealDBTrigram), [{"trigram": t, "meal_id": meal_id} for t in trigrams])
+    db.session.commit()
+    _index = None  # this process sees the import at once, others after MEALDB_INDEX_TTL_SECONDS
+    return len(meals)
+
+
+class MealIndex:
+    """
+    In-memory copy of the mirror's trigram index, so a lookup is a few dict
+    operations (microseconds) instead of a query. Each process loads it from
+    the tables on first use and again every MEALDB_INDEX_TTL_SECONDS, which
+    is how it picks up imports made by `flask import-mealdb`.
+    """
+
+    def __init__(self, meals, postings):
+        self.meals = meals  # meal id → (name, thumb_url, trigram count)
+        self.postings = postings  # trigram → [meal id, ...]
+        self.loaded_at = time.monotonic()
+
+    @classmethod
+    def load(cls):
+        meals = {meal_id: (name, thumb_url, count)
+                 for meal_id, name, thumb_url, count in db.session.query(
+                     MealDBMeal.id, MealDBMeal.name, MealDBMeal.thumb_url, MealDBMeal.trigram_count)}
+        postings = defaultdict(list)
+        for trigram, meal_id in db.session.query(MealDBTrigram.trigram, MealDBTrigram.meal_id):
+            postings[trigram].append(meal_id)
+        return cls(meals, dict(postings))
+
+    def best_match(self, name):
+        """
+        (score, name, thumb_url) of the meal sharing the most trigrams with
+        `name`, scored by Dice similarity 2·shared / (|query| + |meal|); None if no trigram is shared.
+        """
+        trigrams = name_trigrams(name)
+        shared = defaultdict(int)
+        for trigram in trigrams:
+            for meal_id in self.postings.get(trigram, ()):
+                shared[meal_id] += 1
+        if not shared:
+            return None
+        meal_id = max(shared, key=lambda m: (2 * shared[m] / (len(trigrams) + self.meals[m][2]), -m))
+        name, thumb_url, count = self.meals[meal_id]
+        return 2 * shared[meal_id] / (len(trigrams) + count), name, thumb_url
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def meal_index():
+    """This process's MealIndex, (re)loaded when missing or older than MEALDB_INDEX_TTL_SECONDS."""
+    global _index
+    ttl = current_app.config.get("MEALDB_INDEX_TTL_SECONDS", 300)
+    with _index_lock:
+        if _index is None or time.monotonic() - _index.loaded_at > ttl:
+            _index = MealIndex.load()
+        return _index
+
+
+def mirror_loaded():
+    return bool(meal_index().meals)
+
+
+def find_meal_thumb(meal_name):
+    """
+    TheMealDB thumbnail of the mirrored meal most similar to meal_name, or None
+    when nothing scores at least MEALDB_MATCH_THRESHOLD (0.6 by default).
+    """
+    match = meal_index().best_match(meal_name)
+    if match is None or match[0] < current_app.config.get("MEALDB_MATCH_THRESHOLD", 0.6):
+        return None
+    return match[2]
+
+
+@click.command("import-mealdb")
+@click.argument("dumps", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@with_appcontext
+def import_mealdb_command(dumps):
+    """Load TheMealDB dump files (e.g. saved search.php?f=a … f=z responses) into the local mirror."""
+    total = 0
+    for path in dumps:
+        total += import_meals(read_dump(path))
+    click.echo(f"Imported {total} meal(s); the mirror now holds {MealDBMeal.query.count()}.")
@@ -5,11 +5,14 @@ from flask import current_app
 from openai import OpenAI
 from dotenv import load_dotenv
 from datetime import datetime
+from ai.image_cache import normalize_item_name
+from ai.ai_usage import tracked_call
+from ai.image_variants import write_variants
 
 # from app import app
 
 load_dotenv()
-client = OpenAI()
+client = OpenAI(max_retries=0)  # OPENAI_BASE_URL selects the endpoint; retries: ai_usage.tracked_call
 
 
 def generate_meal_images(meal_name: str) -> str:
@@ -18,10 +21,8 @@ def generate_meal_images(meal_name: str) -> str:
         # with app.app_context():
         img_dir = os.path.join(current_app.static_folder, "meal_images")
         os.makedirs(img_dir, exist_ok=True)
-        # timestamp = str(int(time.time()))
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M")
-
-        image_filename = f"{meal_name.replace(' ', '_').lower()}_{timestamp}.png"
+        # One file per normalized meal name (no timestamp), so the same meal is never generated twice.
+        image_filename = f"{normalize_item_name(meal_name).replace(' ', '_')}.png"
         image_path = os.path.join(img_dir, image_filename)
 
         # Add a tiny print to confirm the save:
@@ -38,7 +39,8 @@ def generate_meal_images(meal_name: str) -> str:
         healthy-looking and delicious.
         """
 
-        response = client.images.generate(
+        response = tracked_call(
+            "meal_image", client.images, "generate",
             model="gpt-image-1",
             # model="dall-e-2",
             prompt = prompt,
@@ -52,6 +54,7 @@ def generate_meal_images(meal_name: str) -> str:
         with open(image_path, "wb") as f:
             f.write(image_data)
 
+        write_variants(image_path)  # thumbnail / medium WebP for the dashboard and item pages
         print(f"[Meal image] saved: {image_path}")
         return f"/static/meal_images/{image_filename}"
 
@@ -68,8 +71,6 @@ def generate_workout_images(workout_item: dict, user) -> str:
         if isinstance(workout_item, dict):
 
             workout_name = workout_item.get("name", "exercise")
-            # timestamp = workout_item.get("created_at", str(time.time()))
-            timestamp = workout_item.get("created_at", str(datetime.now().strftime("%Y%m%d_%H%M")))
         else:
             # it's just a text word
             workout_name = str(workout_item)
@@ -79,7 +80,8 @@ def generate_workout_images(workout_item: dict, user) -> str:
         img_dir = os.path.join(current_app.static_folder, "workout_images")
         os.makedirs(img_dir, exist_ok=True)
 
-        image_filename = f"{workout_name.replace(' ', '_').lower()}_{timestamp}.png"
+        # One file per workout name and gender, the only inputs of the prompt.
+        image_filename = f"{normalize_item_name(workout_name).replace(' ', '_')}_{str(user.gender).lower()}.png"
         image_path = os.path.join(img_dir, image_filename)
         if os.path.exists(image_path):
             return f"/static/workout_images/{image_filename}"
@@ -93,7 +95,8 @@ def generate_workout_images(workout_item: dict, user) -> str:
         """
 
 
-        response = client.images.generate(
+        response = tracked_call(
+            "workout_image", client.images, "generate",
             model="gpt-image-1",
             # model="dall-e-2",
             prompt=prompt,
@@ -107,6 +110,7 @@ def generate_workout_images(workout_item: dict, user) -> str:
         with open(image_path, "wb") as f:
             f.write(image_data)
 
+        write_variants(image_path)
         print(f"[Workout image] saved: {image_path}")
         return f"/static/workout_images/{image_filename}"
 
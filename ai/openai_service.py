@@ -1,10 +1,13 @@
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+import asyncio
 import json, os
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime, timedelta
 import uuid #random
+from ai.llm_cache import cached_generation
+from ai.ai_usage import tracked_call, tracked_call_async
 # inside ai/openai_service.py
 # or:
 # impo sys
@@ -12,7 +15,10 @@ import uuid #random
 
 load_dotenv()
 
-client = OpenAI()
+# OPENAI_BASE_URL (read by the SDK, also for AsyncOpenAI) points the clients elsewhere,
+# e.g. at benchmarks/mock_openai.py for load tests.
+# max_retries=0: ai_usage.tracked_call retries, behind the rate governor (ai/rate_governor.py).
+client = OpenAI(max_retries=0)
 
 class Meal(BaseModel):
     name: str
@@ -54,8 +60,8 @@ class DailyMealsOnly(BaseModel):
 class DailyWorkoutsOnly(BaseModel):
     workouts: List[Exercise]
 
-def generate_daily_meals(user):
-    """Generate only meals/snacks for one day."""
+def daily_meals_request(user):
+    """Chat completion arguments (prompt and response schema) for one day of meals."""
     random_key = uuid.uuid4().hex[:8]
     # seed = random.randint(0, 99999)
     # and reference it inside the prompt.
@@ -93,7 +99,7 @@ def generate_daily_meals(user):
     }}
     """
 
-    completion = client.chat.completions.parse(
+    return dict(
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": "You are a professional nutrition coach."},
@@ -102,25 +108,26 @@ def generate_daily_meals(user):
         response_format=DailyMealsOnly,
         temperature=0.8,
         max_completion_tokens=800,
-
     )
+
+
+@cached_generation("daily_meals", DailyMealsOnly)
+def generate_daily_meals(user):
+    """Generate only meals/snacks for one day."""
+    completion = tracked_call("daily_meals", client.chat.completions, "parse", **daily_meals_request(user))
     plan = completion.choices[0].message.parsed
     return plan
 
 
-def generate_daily_workouts(user):
-    """Generate only workouts for one day."""
-    # a 7‑day outline you can reuse
-    # days = [day for day in range(1, 8)]
-
-    # choose intensity
-    if user.activity_level.lower() in ["sedentary", "light"]:
+def training_split(user):
+    """(sets, reps, 7-day focus list, session length) for the user's activity level."""
+    if (user.activity_level or "").lower() in ["sedentary", "light"]:
         sets = "2 sets per exercise"
         reps = "8 to 10 reps"
         focuses = ["Shoulders", "Chest", "Rest", "Back", "Triceps", "Cardio", "Rest"]
         w_time = "30 min"
 
-    elif user.activity_level.lower() == "moderate":
+    elif (user.activity_level or "").lower() == "moderate":
         sets = "3 sets per exercise"
         reps = "10 to 12 reps"
         focuses = ["Legs", "Chest + Pecs", "Back + Triceps", "Rest", "Shoulders", "Cardio", "Rest"]
@@ -132,18 +139,16 @@ def generate_daily_workouts(user):
         focuses = ["Push (Chest + Triceps)", "Pull (Back + Biceps)",
                          "Legs", "Rest", "Full Body HIT", "Core", "Rest"]
         w_time = "60 min"
+    return sets, reps, focuses, w_time
 
-    # now loop through the days list
-    # you could later build and return a dictionary instead of printing
-    plan = []
-    # for i in range(1, 8):
-    #     focus = workout_part[i - 1]
-    #     print(f"Day {i}: {focus} ({sets}, {reps})")
-    #     plan.append({"day": i, "focus": focus, "sets": sets, "reps": reps})
 
-    today = datetime.now()
-    days = [(today + timedelta(days=i)).strftime("%A") for i in range(7)]
+def week_schedule(user, start=None):
+    """The 7 days from `start` (today) with each day's weekday, focus, sets and reps."""
+    sets, reps, focuses, w_time = training_split(user)
+    start = start or datetime.now()
+    days = [(start + timedelta(days=i)).strftime("%A") for i in range(7)]
 
+    plan = []
     for i, day_name in enumerate(days):
         focus = focuses[i % len(focuses)]  # wrap safely if mismatch
         if "Rest" not in focus:
@@ -162,6 +167,13 @@ def generate_daily_workouts(user):
                 "sets": None,
                 "reps": None,
             })
+    return plan
+
+
+def daily_workouts_request(user):
+    """Chat completion arguments (prompt and response schema) for one day of workouts."""
+    plan = week_schedule(user)
+    focus = plan[-1]["focus"]
 
     random_key = uuid.uuid4().hex[:8]
     today_focus = plan[0]['focus']  # e.g. Tuesday plan
@@ -201,7 +213,7 @@ def generate_daily_workouts(user):
     }}
     """
 
-    completion = client.chat.completions.parse(
+    return dict(
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": "You are a professional fitness coach."},
@@ -211,15 +223,23 @@ def generate_daily_workouts(user):
         temperature=0.8,
         max_completion_tokens=800,
     )
+
+
+@cached_generation("daily_workouts", DailyWorkoutsOnly)
+def generate_daily_workouts(user):
+    """Generate only workouts for one day."""
+    completion = tracked_call("daily_workouts", client.chat.completions, "parse",
+                              **daily_workouts_request(user))
     llm_result = completion.choices[0].message.parsed
     return llm_result
 
 
-def generate_daily_plan(user):
+def daily_plan_request(user):
+    """Chat completion arguments (prompt and response schema) for a full day of meals and workouts."""
     # Decide reps based on activity level
-    if user.activity_level.lower() in ["sedentary", "light"]:
+    if (user.activity_level or "").lower() in ["sedentary", "light"]:
         reps = "2 sets per exercise"
-    elif user.activity_level.lower() == "moderate":
+    elif (user.activity_level or "").lower() == "moderate":
         reps = "3 sets per exercise"
     else:
         reps = "4 sets per exercise"
@@ -312,19 +332,24 @@ def generate_daily_plan(user):
         Make the plan realistic, motivating, and personalized to the user,
         """
 
-    # completion = client.chat.completions.create       # Create without using structured data.
-    completion = client.chat.completions.parse(        # parse by using structured data.
-
-    model="gpt-4o-mini",
-    messages=[
-    {"role": "developer", "content": "You are a professional coach."},
-    {"role": "user", "content": prompt}
-    ],
-    response_format=DailyPlan, # key part
-    max_completion_tokens=1000,
-    temperature=0.8
+    return dict(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "developer", "content": "You are a professional coach."},
+            {"role": "user", "content": prompt}
+        ],
+        response_format=DailyPlan,  # key part
+        max_completion_tokens=1000,
+        temperature=0.8
     )
 
+
+@cached_generation("daily_plan", DailyPlan)
+def generate_daily_plan(user):
+    # completion = client.chat.completions.create       # Create without using structured data.
+    completion = tracked_call("daily_plan", client.chat.completions, "parse",  # parse by using structured data.
+                              **daily_plan_request(user))
+
     # plan_text = completion.choices[0].message.content
     plan_text = completion.choices[0].message.parsed
     text_format=DailyPlan
@@ -423,137 +448,73 @@ class WeeklyPlan(BaseModel):
 #     return plan_text
 
 
-def generate_weekly_plan(user):
-    today = datetime.today()
-    weekday_name = today.strftime("%A")
-    month_name = today.strftime("%B")
+# How many days of a weekly plan are generated at the same time.
+WEEKLY_PLAN_CONCURRENCY = int(os.getenv("WEEKLY_PLAN_CONCURRENCY", "4"))
+
 
+def day_plan_request(user, day):
+    """Chat completion arguments for one day of a weekly plan; `day` is an entry of week_schedule()."""
     random_key = uuid.uuid4().hex[:8]
+    meals = "6 meals (3 main + 3 snacks)" if (user.activity_level or "").lower() in ["active", "very_active"] \
+        else "5 meals (3 main + 2 snacks)"
+    if day["focus"] == "Rest":
+        training = """- This is a REST day: set rest_day = true, leave workouts empty
+      and put recovery advice (stretching, hydration, sleep) in notes."""
+    else:
+        training = f"""- Training focus: {day["focus"]}, {day["sets"]}, {day["reps"]}.
+    - Provide 3 structured workouts: name, type (Strength/Cardio/Flexibility), duration, sets, reps,
+      rest_between_sets, intensity, short instructions. Start with a 5 to 10 min warm-up.
+    - If the focus includes "Cardio", do NOT give sets or reps; give a timing pattern instead."""
 
     prompt = f"""
     You are a certified professional fitness and nutrition coach.
-    Create a personalized unique 7-day weekly workout and meal plan for a week (Random key: {random_key})
-    for a client age {user.age}-year-old, gender {user.gender}, weight {user.weight}kg, height {user.height}cm tall. 
+    Create day {day["day"]} ({day["weekday"]}) of a personalized unique 7-day plan (Random key: {random_key})
+    for a client age {user.age}-year-old, gender {user.gender}, weight {user.weight}kg, height {user.height}cm tall.
     Based on Goal: {user.fitness_goal}, Activity level: {user.activity_level}, Dietary preference: {user.dietary_pref}.
 
-    * General Rules:
-    - Always return ONLY valid JSON.
-    - Today is {weekday_name} in the month of {month_name}.
-      That means the plan should start from **{weekday_name}** and continue in sequence
-      until the next {weekday_name} (7 full days total).
-
-      Example:
-      If today is Tuesday → generate days: Tuesday, Wednesday, Thursday, Friday, Saturday, Sunday, Monday.
-      
-    - each day must include:
-      (a) 3 meals + 2 snacks (with calories, protein, carbs, fats) 
-      AND 3 structured workouts, OR
-      (b) meals + rest_day = true with recovery notes.
-    - Respect dietary preferences and fitness goal.
-    - Provide for each meal short instructions as possible.
-    - Provide workouts with: name, type (Strength/Cardio/Flexibility), duration, sets, reps, rest_between_sets, intensity, short description, and short notes.
-
-    * Training Logic:
-    
-    - For Sedentary/Light levels (3 training days): prefer lower session frequency, lower intensity, mobility and functional work.
-      * Workouts alternate Upper Body, Lower Body, and Full Body.
-      * The last day should always end with a **Full Body Strength** session.
-
-    - Moderate Activity (4 training days):
-      * 2 rest days per week.
-      * Workouts alternate Upper Body, Lower Body, and Full Body.
-      * Before each rest day → include a **Full Body Workout**.
-      * Day 5 should always end with a **Full Body Strength** session.
-
-    - Active (5 training days):
-      * 2 rest days.
-      * Split into Upper Body, Lower Body, Cardio/HIIT, Hypertrophy, and Full Body.
-      * Rest days follow after heavy workouts.
-      * Always finish the week with a **Full Body workout**.
-
-    - Very Active (6 training days):
-      * 1 rest day.
-      * Push/Pull/Legs + Full Body Functional + Upper Body Pull + Lower Body Power.
-      * Rest day is midweek or at the end (Day 3 or 7).
-      * Always have a **Full Body workout before or after the rest day**.
-      * Day 6 (final session) should be a **Full Body Power workout**.
-
-    * Nutrition Logic:
-    - Lose weight → Calorie deficit, high protein, moderate carbs, low fats.
-    - Gain muscle → Calorie surplus, protein-rich meals, complex carbs, healthy fats.
-    - Maintain → Balanced macros.
-    - Always respect dietary preference (e.g., vegan, vegetarian, keto, halal).
-    - Moderate activity: 5 meals/day (3 main + 2 snacks).
-    - Active/Very Active: 6 meals/day (3 main + 3 snacks).
-
-    * Output Format (JSON only):
-    {{
-      "{weekday_name}": {{
-        "meals": [
-          {{
-            "name": "Breakfast",
-            "Ingredients": ".....",
-            "description": ".....",
-            "calories": 400,
-            "protein": 25,
-            "carbs": 45,
-            "fats": 12,
-            "Rest time": "1h - 1:30h"
-          }},
-            "Snack 1": "......",
-            "Name": ".....",
-            "Description": "Bread, Eggs, Milk",
-            "Ingredients": ".....",
-            "Instructions": ".....",
-            "Calories": ,
-            "Protein": ,
-            "Carbs": ,
-            "Fats": ,
-            "Rest between meals": "2h - 3h"
-            }}
-        ]
-        
-        "workouts": [
-          {{
-            "name": "Bench Press",
-            "type": "Strength",
-            "duration": "20 min",
-            "sets": "4",
-            "reps": "8–10",
-            "rest_between_sets": "90 sec",
-            "intensity": "Moderate",
-            "instructions": ".....",
-            "notes": "Focus on form, controlled movement"
-          }}
-        ]
-      }},
-      ...
-      "{weekday_name}": {{ ... }}
-    }}
+    * Rules:
+    - Always return ONLY valid JSON for this one day.
+    - {meals} with calories, protein, carbs, fats and short instructions.
+    - Lose weight → calorie deficit, high protein. Gain muscle → calorie surplus. Maintain → balanced macros.
+    - Always respect the dietary preference ({user.dietary_pref}).
+    {training}
     """
-
-    completion = client.chat.completions.parse(
+    return dict(
         model="gpt-4o-mini",
         messages=[
-            {"role": "system", "content": "You are a professional coach generating structured weekly fitness and meal plans."},
+            {"role": "system", "content": "You are a professional coach generating structured fitness and meal plans."},
             {"role": "user", "content": prompt}
         ],
-        response_format=WeeklyPlan,
-        # max_completion_tokens=20000,
+        response_format=DayPlan,
         temperature=0.8,
-        # verbosity="medium"    # low, medium or high only with gpt 5
+        max_completion_tokens=1500,
     )
 
-    plan = completion.choices[0].message.parsed
 
-    # Track tokens
-    usage = completion.usage
-    print("\n Token Usage:")
-    print(f"- Prompt tokens: {usage.prompt_tokens}")
-    print(f"- Completion tokens: {usage.completion_tokens}")
-    print(f"- Total tokens: {usage.total_tokens}")
+async def _generate_week(user, schedule, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    async with AsyncOpenAI(max_retries=0) as async_client:
+        async def generate_day(day):
+            async with semaphore:
+                completion = await tracked_call_async("weekly_plan_day", async_client.chat.completions, "parse",
+                                                      **day_plan_request(user, day))
+            day_plan = completion.choices[0].message.parsed
+            if day_plan is None:
+                raise ValueError(f"No plan for {day['weekday']}: {completion.choices[0].message.refusal}")
+            return day["weekday"], day_plan
 
-    return plan
+        return await asyncio.gather(*(generate_day(day) for day in schedule))
+
+
+@cached_generation("weekly_plan", WeeklyPlan)
+def generate_weekly_plan(user):
+    """
+    Derives the week's training schedule first, then generates the seven days
+    concurrently (at most WEEKLY_PLAN_CONCURRENCY at a time) with the async
+    client, so a week takes about as long as the slowest day.
+    """
+    days = asyncio.run(_generate_week(user, week_schedule(user), WEEKLY_PLAN_CONCURRENCY))
+    return WeeklyPlan(**dict(days))  # token usage is recorded per day in ai_calls (tracked_call_async)
 
 
 class User:
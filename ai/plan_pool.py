@@ -0,0 +1,207 @@
+import itertools
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import func
+
+from ai import openai_service
+from ai.image_service import attach_lazy_images
+from ai.ai_usage import ai_call_scope
+from ai.rate_governor import ai_priority
+from datamanager.models import db, User, PooledPlan
+
+# The choices offered by templates/add_user.html
+FITNESS_GOALS = ("maintain", "lose", "gain")
+ACTIVITY_LEVELS = ("sedentary", "light", "moderate", "active", "very_active")
+DIETARY_PREFS = ("no preference", "vegetarian", "vegan", "keto", "pescatarian", "halal", "gluten-free")
+GENDERS = ("male", "female")
+# (first age, last age, age used when generating for the band)
+AGE_BANDS = ((0, 29, 25), (30, 44, 37), (45, 59, 52), (60, 200, 67))
+# height cm / weight kg of the profile the bucket's plans are generated for
+BODY = {"male": (178, 80), "female": (165, 65)}
+
+GENERATORS = {
+    "daily_plan": lambda profile: openai_service.generate_daily_plan.uncached(profile),
+    "weekly_plan": lambda profile: openai_service.generate_weekly_plan.uncached(profile),
+}
+
+
+def _age_band(age):
+    try:
+        age = int(age)
+    except (TypeError, ValueError):
+        return None
+    return next((band for band in AGE_BANDS if age <= band[1]), AGE_BANDS[-1])
+
+
+def bucket_key(user):
+    """'lose|moderate|vegan|female|30-44', or None if the user falls outside the pooled buckets."""
+    goal = (user.fitness_goal or "").strip().lower()
+    activity = (user.activity_level or "").strip().lower()
+    diet = (user.dietary_pref or "").strip().lower()
+    gender = (user.gender or "").strip().lower()
+    band = _age_band(user.age)
+    if (goal not in FITNESS_GOALS or activity not in ACTIVITY_LEVELS or diet not in DIETARY_PREFS
+            or gender not in GENDERS or band is None):
+        return None
+    return f"{goal}|{activity}|{diet}|{gender}|{band[0]}-{band[1]}"
+
+
+def all_buckets():
+    """Every goal × activity level × diet × gender × age band combination."""
+    for goal, activity, diet, gender, band in itertools.product(
+            FITNESS_GOALS, ACTIVITY_LEVELS, DIETARY_PREFS, GENDERS, AGE_BANDS):
+        yield f"{goal}|{activity}|{diet}|{gender}|{band[0]}-{band[1]}"
+
+
+def bucket_profile(bucket):
+    """A transient (never saved) User standing in for everyone in the bucket."""
+    goal, activity, diet, gender, band = bucket.split("|")
+    first_age = int(band.split("-")[0])
+    age = next(rep for first, _, rep in AGE_BANDS if first == first_age)
+    height, weight = BODY[gender]
+    return User(user_name=f"pool:{bucket}", gender=gender, age=age, height=height, weight=weight,
+                dietary_pref=diet, fitness_goal=goal, activity_level=activity)
+
+
+class PlanPool:
+    """
+    Plans generated ahead of time per profile bucket, so the generate routes can
+    hand one out without calling OpenAI. Each pooled plan is given to one user only.
+    Off unless PLAN_POOL_ENABLED is set. When a bucket drops below PLAN_POOL_LOW_WATERMARK unclaimed plans it is topped
+    back up to PLAN_POOL_TARGET in the background.
+
+    Weekly plans always hold Monday–Sunday, so one pool serves every start weekday.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.executor = None
+        self._refilling = set()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.executor = ThreadPoolExecutor(
+            max_workers=app.config.get("PLAN_POOL_WORKERS", 1),
+            thread_name_prefix="plan-pool",
+        )
+        app.extensions["plan_pool"] = self
+
+    def take(self, kind, user):
+        """Claims an unused pooled plan of `kind` for the user's bucket; returns its dict or None."""
+        if kind not in GENERATORS or not self.app.config.get("PLAN_POOL_ENABLED", False):
+            return None
+        bucket = bucket_key(user)
+        if bucket is None:
+            return None
+
+        plan_dict = None
+        for _ in range(3):  # another worker may claim the same row first
+            candidate = (db.session.query(PooledPlan.id)
+                         .filter(PooledPlan.kind == kind, PooledPlan.bucket == bucket,
+                                 PooledPlan.claimed_at.is_(None))
+                         .order_by(PooledPlan.id)
+                         .limit(1)
+                         .scalar())
+            if candidate is None:
+                break
+            claimed = (PooledPlan.query
+                       .filter(PooledPlan.id == candidate, PooledPlan.claimed_at.is_(None))
+                       .update({"claimed_at": datetime.utcnow(), "claimed_by": user.id},
+                               synchronize_session=False))
+            db.session.commit()
+            if claimed:
+                plan_dict = json.loads(db.session.get(PooledPlan, candidate).plan_json)
+                break
+
+        offline = self.app.config.get("PLAN_MODE") == "local"  # refills would call OpenAI
+        if not offline and self.available(kind, bucket) < self.app.config.get("PLAN_POOL_LOW_WATERMARK", 2):
+            self.refill_later(kind, bucket)
+        return plan_dict
+
+    def available(self, kind, bucket):
+        """Number of unclaimed plans of `kind` in the bucket."""
+        return (db.session.query(func.count(PooledPlan.id))
+                .filter(PooledPlan.kind == kind, PooledPlan.bucket == bucket, PooledPlan.claimed_at.is_(None))
+                .scalar())
+
+    def refill_later(self, kind, bucket):
+        """Top the bucket up in the background, unless a refill for it is already under way."""
+        with self._lock:
+            if (kind, bucket) in self._refilling:
+                return
+            self._refilling.add((kind, bucket))
+        self.executor.submit(self._refill, kind, bucket)
+
+    def _refill(self, kind, bucket):
+        with self.app.app_context():
+            try:
+                self.fill(kind, bucket, self.app.config.get("PLAN_POOL_TARGET", 3))
+            except Exception as e:
+                db.session.rollback()
+                print(f"[Plan pool] refill of {kind} {bucket} failed: {e}")
+            finally:
+                with self._lock:
+                    self._refilling.discard((kind, bucket))
+
+    def fill(self, kind, bucket, target):
+        """
+        Generates plans until the bucket holds `target` unclaimed ones; returns how many were added.
+        Images are linked lazily (/img/...), so only the images someone actually views get generated.
+        """
+        profile = bucket_profile(bucket)
+        added = 0
+        for _ in range(max(target - self.available(kind, bucket), 0)):
+            with ai_call_scope(f"plan_pool:{kind}"), ai_priority("idle"):  # every other call goes first
+                plan_dict = GENERATORS[kind](profile).model_dump()
+            attach_lazy_images(plan_dict, profile)
+            db.session.add(PooledPlan(kind=kind, bucket=bucket, plan_json=json.dumps(plan_dict)))
+            db.session.commit()
+            added += 1
+        return added
+
+    def stats(self):
+        """{kind: {"buckets": n, "available": n, "claimed": n}}"""
+        rows = (db.session.query(PooledPlan.kind,
+                                 func.count(func.distinct(PooledPlan.bucket)),
+                                 func.count(PooledPlan.id) - func.count(PooledPlan.claimed_at),
+                                 func.count(PooledPlan.claimed_at))
+                .group_by(PooledPlan.kind))
+        return {kind: {"buckets": buckets, "available": available, "claimed": claimed}
+                for kind, buckets, available, claimed in rows}
+
+
+@click.command("fill-plan-pool")
+@click.option("--kind", type=click.Choice(["daily_plan", "weekly_plan", "all"]), default="all")
+@click.option("--per-bucket", type=int, default=None, help="Unclaimed plans to keep per bucket (PLAN_POOL_TARGET).")
+@click.option("--goal", type=click.Choice(FITNESS_GOALS), default=None, help="Only fill buckets with this goal.")
+@with_appcontext
+def fill_plan_pool_command(kind, per_bucket, goal):
+    """Pre-generate plans for every profile bucket through the OpenAI generators."""
+    pool = current_app.extensions["plan_pool"]
+    target = per_bucket if per_bucket is not None else current_app.config.get("PLAN_POOL_TARGET", 3)
+    kinds = list(GENERATORS) if kind == "all" else [kind]
+
+    total = 0
+    for bucket in all_buckets():
+        if goal and not bucket.startswith(f"{goal}|"):
+            continue
+        for plan_kind in kinds:
+            try:
+                added = pool.fill(plan_kind, bucket, target)
+            except Exception as e:
+                db.session.rollback()
+                click.echo(f"failed  {plan_kind:<12} {bucket}: {e}")
+                continue
+            total += added
+            if added:
+                click.echo(f"+{added:<6} {plan_kind:<12} {bucket}")
+    click.echo(f"Added {total} plan(s) to the pool.")
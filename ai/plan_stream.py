@@ -0,0 +1,125 @@
+import json
+import time
+
+from ai import openai_service
+from ai.openai_service import client, Meal, Exercise
+from ai.ai_usage import record_ai_call
+from ai.rate_governor import current_governor, estimate_tokens
+
+STREAM_REQUESTS = {
+    "daily_meals": openai_service.daily_meals_request,
+    "daily_workouts": openai_service.daily_workouts_request,
+    "daily_plan": openai_service.daily_plan_request,
+}
+
+# top-level array of the response → plan item kind and the model each element must fit
+ITEM_ARRAYS = {"meals": ("meal", Meal), "workouts": ("workout", Exercise)}
+
+
+class ItemStreamParser:
+    """
+    Reads the structured-output JSON as it streams in and hands back every
+    element of the top-level "meals" / "workouts" arrays as soon as its closing
+    brace arrives, without waiting for the rest of the document.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.string_start = None
+        self.last_string = None
+        self.key = None  # top-level key whose value is being read
+        self.item_start = None
+        self.counts = {}
+
+    def feed(self, delta):
+        """Adds a chunk of text; returns [(array key, position, element dict)] completed by it."""
+        self.text += delta
+        completed = []
+        while self.pos < len(self.text):
+            char = self.text[self.pos]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                    if self.depth == 1:
+                        self.last_string = json.loads(self.text[self.string_start:self.pos + 1])
+            elif char == '"':
+                self.in_string = True
+                self.string_start = self.pos
+            elif char == ":" and self.depth == 1:
+                self.key = self.last_string
+            elif char in "{[":
+                self.depth += 1
+                if char == "{" and self.depth == 3 and self.key in ITEM_ARRAYS:
+                    self.item_start = self.pos
+            elif char in "}]":
+                if char == "}" and self.depth == 3 and self.item_start is not None:
+                    element = json.loads(self.text[self.item_start:self.pos + 1])
+                    position = self.counts.get(self.key, 0)
+                    self.counts[self.key] = position + 1
+                    completed.append((self.key, position, element))
+                    self.item_start = None
+                self.depth -= 1
+            self.pos += 1
+        return completed
+
+
+def stream_plan(kind, user):
+    """
+    Generates a daily plan with the streaming completion API. Yields
+    ("item", {"kind", "position", "item"}) for each meal/workout as soon as the
+    model has finished writing it, then ("plan", parsed Pydantic model) once.
+    """
+    parser = ItemStreamParser()
+    request = STREAM_REQUESTS[kind](user)
+    governor = current_governor()
+    estimate = estimate_tokens(request)
+    if governor is not None:
+        governor.acquire(request["model"], estimate)  # no retries here: a failed stream falls back to a job
+    started = time.perf_counter()
+    try:
+        # include_usage: the last chunk carries the token counts for the ai_calls accounting
+        with client.chat.completions.stream(**request, stream_options={"include_usage": True}) as stream:
+            for event in stream:
+                if event.type != "content.delta":
+                    continue
+                for key, position, element in parser.feed(event.delta):
+                    item_kind, model = ITEM_ARRAYS[key]
+                    try:
+                        item = model.model_validate(element).model_dump()
+                    except ValueError as e:
+                        print(f"[Plan stream] skipping malformed {item_kind} {position}: {e}")
+                        continue
+                    yield "item", {"kind": item_kind, "position": position, "item": item}
+            completion = stream.get_final_completion()
+    except Exception as e:
+        record_ai_call(f"{kind}_stream", request["model"], started, error=str(e))
+        raise
+    record_ai_call(f"{kind}_stream", request["model"], started, usage=completion.usage)
+    if governor is not None and completion.usage:
+        governor.settle(request["model"], estimate, completion.usage.total_tokens)
+
+    plan = completion.choices[0].message.parsed
+    if plan is None:
+        raise ValueError(completion.choices[0].message.refusal or "The model returned no plan")
+    yield "plan", plan
+
+
+def replay_plan(plan):
+    """The events of stream_plan() for a plan that is already complete (e.g. from the local planner)."""
+    for key, (item_kind, _) in ITEM_ARRAYS.items():
+        for position, item in enumerate(getattr(plan, key, None) or []):
+            yield "item", {"kind": item_kind, "position": position, "item": item.model_dump()}
+    yield "plan", plan
+
+
+def sse_event(name, data):
+    """One Server-Sent Events message carrying `data` as JSON."""
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
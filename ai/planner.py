@@ -0,0 +1,42 @@
+from flask import current_app
+
+from ai import openai_service
+from ai.local_planner import LOCAL_GENERATORS
+
+# PLAN_MODE:
+#   llm          OpenAI generators; the local planner steps in when a call fails (PLAN_LOCAL_FALLBACK)
+#   local        local planner only, no network calls at all
+#   local_first  the routes save a local plan at once and queue the OpenAI plan as its refinement
+PLAN_MODES = ("llm", "local", "local_first")
+
+LLM_GENERATORS = {
+    "daily_meals": lambda user: openai_service.generate_daily_meals(user),
+    "daily_workouts": lambda user: openai_service.generate_daily_workouts(user),
+    "daily_plan": lambda user: openai_service.generate_daily_plan(user),
+    "weekly_plan": lambda user: openai_service.generate_weekly_plan(user),
+}
+
+
+def plan_mode():
+    mode = current_app.config.get("PLAN_MODE", "llm")
+    if mode not in PLAN_MODES:
+        raise ValueError(f"PLAN_MODE must be one of {', '.join(PLAN_MODES)}, not {mode!r}")
+    return mode
+
+
+def generate_plan(kind, user, mode=None):
+    """The Pydantic plan of `kind` for the user, from OpenAI or the local planner depending on the mode."""
+    mode = mode or plan_mode()
+    if mode == "local":
+        return LOCAL_GENERATORS[kind](user)
+
+    try:
+        plan = LLM_GENERATORS[kind](user)
+        if plan is None:
+            raise ValueError("the model returned no plan")
+        return plan
+    except Exception as e:
+        if not current_app.config.get("PLAN_LOCAL_FALLBACK", True):
+            raise
+        print(f"[Planner] {kind} generation failed, using the local planner: {e}")
+        return LOCAL_GENERATORS[kind](user)
@@ -0,0 +1,206 @@
+import contextvars
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import openai
+from flask import current_app, has_app_context
+
+# Requests and tokens per minute per model. The budget is per process: with several
+# worker processes, give each its share of the account limits (FLASK_AI_RATE_LIMITS='{...}').
+DEFAULT_RATE_LIMITS = {
+    "gpt-4o-mini": {"rpm": 500, "tpm": 200_000},
+    "gpt-image-1": {"rpm": 5, "tpm": 100_000},
+}
+# Lower runs first. Interactive: a user is waiting (routes, jobs, streams); background: backfills;
+# idle: plan pool refills, which only go out when nothing else is queued for the model.
+PRIORITIES = {"interactive": 0, "background": 1, "idle": 2}
+# What a call is charged up front when it does not say itself (max_completion_tokens); corrected after the call.
+DEFAULT_COMPLETION_TOKENS = 1500
+IMAGE_OUTPUT_TOKENS = 1056  # gpt-image-1, 1024x1024
+
+_priority = contextvars.ContextVar("ai_priority", default="interactive")
+
+
+@contextmanager
+def ai_priority(name):
+    """Queues every AI call made inside the block (and in tasks copied from it) at this priority."""
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_governor():
+    """The app's RateGovernor, or None outside an app (scripts call the API ungoverned)."""
+    return current_app.extensions.get("rate_governor") if has_app_context() else None
+
+
+def estimate_tokens(kwargs):
+    """Rough token count of a chat or image request: ~4 characters a token, plus the expected output."""
+    if "prompt" in kwargs:  # images.generate
+        return len(kwargs["prompt"]) // 4 + IMAGE_OUTPUT_TOKENS * kwargs.get("n", 1)
+    prompt = sum(len(str(message.get("content", ""))) for message in kwargs.get("messages", [])) // 4
+    return prompt + (kwargs.get("max_completion_tokens") or kwargs.get("max_tokens") or DEFAULT_COMPLETION_TOKENS)
+
+
+def retry_delay(error, attempt, base=1.0, cap=60.0):
+    """Seconds to wait before retrying: the server's retry-after if it sent one, else jittered exponential backoff."""
+    response = getattr(error, "response", None)
+    headers = response.headers if response is not None else {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass  # an HTTP date; fall back to backoff
+    delay = min(cap, base * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def is_retryable(error):
+    return isinstance(error, (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError))
+
+
+class TokenBucket:
+    """Holds up to `per_minute` units and refills at per_minute / 60 a second."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` units are available (0 if they are now)."""
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+
+class ModelBudget:
+
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.paused_until = 0.0  # set from a 429's retry-after: nobody calls the model before then
+        self.queue = []  # heap of (priority, seq) tickets
+        self.waits = deque(maxlen=1000)  # seconds recent calls spent queued
+        self.rate_limited = 0
+
+    def wait_time(self, tokens, now):
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        return max(self.paused_until - now, self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+    def take(self, tokens):
+        self.requests.level -= 1
+        self.tokens.level -= min(tokens, self.tokens.capacity)
+
+
+class RateGovernor:
+    """
+    Central gate in front of every OpenAI call (see ai_usage.tracked_call).
+    Each model has a requests-per-minute and a tokens-per-minute bucket; a call
+    takes one request and its estimated tokens before it may go out, and waits
+    in a priority queue (interactive before background, then first come first
+    served) until the buckets cover it. A 429 pauses the whole model for its
+    retry-after, so queued calls do not hammer the API while it is limited.
+    """
+
+    def __init__(self, app=None):
+        self.budgets = {}
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self.limits = DEFAULT_RATE_LIMITS
+        self.max_attempts = 4
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.limits = {**DEFAULT_RATE_LIMITS, **app.config.get("AI_RATE_LIMITS", {})}
+        self.max_attempts = app.config.get("AI_MAX_ATTEMPTS", 4)
+        app.extensions["rate_governor"] = self
+
+    def _budget(self, model):
+        name = next((name for name in self.limits if (model or "").startswith(name)), None)
+        if name is None:
+            return None  # unknown model: not governed
+        if name not in self.budgets:
+            self.budgets[name] = ModelBudget(**self.limits[name])
+        return self.budgets[name]
+
+    def acquire(self, model, tokens, priority=None):
+        """Blocks until the model's budget covers one request of `tokens` and it is this call's turn."""
+        started = time.monotonic()
+        with self._cond:
+            budget = self._budget(model)
+            if budget is None:
+                return 0.0
+            ticket = (PRIORITIES[priority or _priority.get()], next(self._seq))
+            heapq.heappush(budget.queue, ticket)
+            try:
+                while True:
+                    if budget.queue[0] == ticket:
+                        wait = budget.wait_time(tokens, time.monotonic())
+                        if wait <= 0:
+                            budget.take(tokens)
+                            break
+                    else:
+                        wait = 1.0  # woken up when the head leaves; the timeout is just a safety net
+                    self._cond.wait(timeout=wait)
+            finally:
+                budget.queue.remove(ticket)
+                heapq.heapify(budget.queue)
+                self._cond.notify_all()
+            waited = time.monotonic() - started
+            budget.waits.append(waited)
+        return waited
+
+    def settle(self, model, estimated, actual):
+        """Corrects the token bucket once the real usage of a call is known."""
+        with self._cond:
+            budget = self._budget(model)
+            if budget is not None and actual:
+                budget.tokens.level = min(budget.tokens.capacity, budget.tokens.level + estimated - actual)
+
+    def rate_limited(self, model, delay):
+        """A 429 came back: hold every call to the model for `delay` seconds."""
+        with self._cond:
+            budget = self._budget(model)
+            if budget is not None:
+                budget.rate_limited += 1
+                budget.paused_until = max(budget.paused_until, time.monotonic() + delay)
+                self._cond.notify_all()
+
+    def stats(self):
+        """{model: queue depth per priority, bucket levels, wait-time percentiles, 429 count}"""
+        report = {}
+        now = time.monotonic()
+        with self._cond:
+            for name, budget in self.budgets.items():
+                budget.wait_time(0, now)  # refill before reporting
+                depth = defaultdict(int)
+                for priority, _ in budget.queue:
+                    depth[next(key for key, value in PRIORITIES.items() if value == priority)] += 1
+                waits = sorted(budget.waits)
+                report[name] = {
+                    "queued": len(budget.queue),
+                    "queued_by_priority": dict(depth),
+                    "requests_available": round(budget.requests.level, 1),
+                    "tokens_available": int(budget.tokens.level),
+                    "paused_for_s": round(max(budget.paused_until - now, 0), 1),
+                    "rate_limited": budget.rate_limited,
+                    "wait_p50_ms": int(waits[len(waits) // 2] * 1000) if waits else None,
+                    "wait_p95_ms": int(waits[min(int(len(waits) * 0.95), len(waits) - 1)] * 1000) if waits else None,
+                    "wait_max_ms": int(waits[-1] * 1000) if waits else None,
+                }
+        return report
@@ -0,0 +1,97 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert
+
+from datamanager.models import db, Lease
+
+_HOST = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def acquire_lease(key):
+    """
+    Takes the lease on key if nobody holds it (or the holder's lease expired).
+    Returns the owner token to release it with, or None if someone else holds it.
+    Runs on its own connection, so the caller's session is left alone.
+    """
+    owner = f"{_HOST}:{uuid.uuid4().hex[:8]}"
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=current_app.config.get("SINGLE_FLIGHT_LEASE_SECONDS", 300))
+    stmt = insert(Lease).values(key=key, owner=owner, expires_at=expires_at)
+    with db.engine.begin() as connection:
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=[Lease.key],
+            set_={"owner": owner, "expires_at": expires_at},
+            where=Lease.expires_at <= now,
+        ))
+        holder = connection.execute(select(Lease.owner).where(Lease.key == key)).scalar()
+    return owner if holder == owner else None
+
+
+def release_lease(key, owner):
+    with db.engine.begin() as connection:
+        connection.execute(delete(Lease).where(Lease.key == key, Lease.owner == owner))
+
+
+def wait_for_lease(key, timeout):
+    """acquire_lease, polling every SINGLE_FLIGHT_POLL_SECONDS; raises TimeoutError after `timeout` seconds."""
+    deadline = time.monotonic() + timeout
+    poll = current_app.config.get("SINGLE_FLIGHT_POLL_SECONDS", 0.2)
+    while True:
+        owner = acquire_lease(key)
+        if owner is not None:
+            return owner
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"lease {key!r} still held after {timeout}s")
+        time.sleep(poll)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key. Within a process the first
+    caller runs the function and the others wait on its Future; the runner
+    also holds the key's lease, so a caller in another worker process waits
+    for that lease first. Functions should therefore re-check their shared
+    cache before doing the work: whoever comes second usually finds the
+    first one's result there.
+    """
+
+    def __init__(self):
+        self._in_flight = {}  # key → Future of the call running in this process
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, timeout):
+        """fn()'s result, shared with every concurrent caller for key; TimeoutError after `timeout` seconds."""
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+
+        if leader:
+            owner = None
+            try:
+                owner = wait_for_lease(key, timeout)
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._in_flight.pop(key, None)
+                if owner is not None:
+                    try:
+                        release_lease(key, owner)
+                    except Exception as e:  # the result stands; the lease just runs out after its expiry
+                        print(f"[Single flight] releasing {key!r} failed: {e}")
+
+        return future.result(timeout=timeout)
+
+
+single_flight = SingleFlight()
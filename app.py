@@ -1,19 +1,36 @@
-from flask import Flask, render_template, request, flash, redirect, url_for
+from flask import Flask, render_template, request, flash, redirect, url_for, jsonify, abort, Response, stream_with_context
+from markupsafe import Markup
 from datamanager.models import db, User, DailyPlan, WeeklyPlan
 from datamanager.sqlite_data_manager import SQLiteDataManager
+from datamanager.sqlite_setup import engine_options
 from validation import validate_user_data
 from datetime import datetime, timezone ,date
 from zoneinfo import ZoneInfo
+import hmac
 import json
-from ai.openai_service import generate_daily_plan, generate_weekly_plan, generate_daily_workouts
-from flask_migrate import Migrate
-import requests
-from functools import lru_cache
-from ai.openai_img import generate_workout_images, generate_meal_images
-# Use threading (optional for dev)
-# If you still want to fill missing images on the fly but not freeze the page, use a background thread or task queue.
-# For a quick Flask-only approach:
 import threading
+from collections import OrderedDict
+from ai import openai_service
+from flask_migrate import Migrate
+from ai.image_service import (attach_plan_images, attach_cached_images, attach_lazy_images, parse_lazy_image_key,
+                              resolve_lazy_image, verify_lazy_image, DEFAULT_MEAL_IMAGE, DEFAULT_WORKOUT_IMAGE)
+from ai.image_cache import image_cache, image_cache_key
+from job_queue import JobQueue
+from datamanager.query_audit import audit_queries_command
+from datamanager.user_import import import_users_command
+from datamanager.export import EXPORT_FORMATS, EXPORT_KINDS, export_chunks, export_command
+from ai.plan_pool import PlanPool, fill_plan_pool_command
+from ai.plan_stream import STREAM_REQUESTS, stream_plan, replay_plan, sse_event
+from ai.ai_usage import usage_report, ai_usage_command
+from ai.planner import generate_plan as build_plan, plan_mode
+from ai.local_planner import LOCAL_GENERATORS
+from ai.image_variants import (QUALITY, VARIANT_WIDTHS, image_src, image_sizes, image_srcset, image_variants_command,
+                               variant_url)
+from ai.mealdb_mirror import import_mealdb_command
+from ai.single_flight import acquire_lease, release_lease, wait_for_lease
+from ai.rate_governor import RateGovernor
+from ai.batch_plans import batch_plans_command
+from http_cache import cache_static_images, conditional_page, hashed_static_url
 
 app = Flask(__name__)
 db_path = 'fitness_app.db'
@@ -21,12 +38,35 @@ db_path = 'fitness_app.db'
 app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.secret_key = 'your_secret_key_here'  # Required for session
+app.config['DB_POOL_SIZE'] = 10
+app.config['DB_MAX_OVERFLOW'] = 20
+# Any setting can be overridden from the environment, e.g. FLASK_JOB_WORKERS=8 or FLASK_DB_POOL_SIZE=20
+app.config.from_prefixed_env()
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(pool_size=app.config['DB_POOL_SIZE'],
+                                                         max_overflow=app.config['DB_MAX_OVERFLOW'])
 
 db.init_app(app)
 data_manager = SQLiteDataManager(db_path, app)  # Use the appropriate path to your Database
+job_queue = JobQueue(app)  # background plan generation, see job_queue.py
+plan_pool = PlanPool(app)  # pre-generated plans per profile bucket, see ai/plan_pool.py
+rate_governor = RateGovernor(app)  # per-model request/token budgets for every OpenAI call
 
 
-migrate = Migrate(app, db)
+migrate = Migrate(app, db, render_as_batch=True)  # batch mode: SQLite cannot ALTER most columns
+app.cli.add_command(audit_queries_command)  # flask audit-queries
+app.cli.add_command(fill_plan_pool_command)  # flask fill-plan-pool --per-bucket 3
+app.cli.add_command(ai_usage_command)  # flask ai-usage --days 7
+app.cli.add_command(image_variants_command)  # flask image-variants
+app.cli.add_command(import_mealdb_command)  # flask import-mealdb meals_a.json meals_b.json ...
+app.cli.add_command(batch_plans_command)  # flask batch-plans --kind all (nightly)
+app.cli.add_command(import_users_command)  # flask import-users roster.csv --upsert
+app.cli.add_command(export_command)  # flask export daily_plans --format csv --since 2025-01-01 -o plans.csv
+
+# {{ url | image_src('list') }}, {{ url | image_srcset }}, see templates/_image.html
+app.add_template_filter(image_src)
+app.add_template_filter(image_sizes)
+app.add_template_filter(image_srcset)
+app.after_request(cache_static_images)  # ?v=<content hash> image URLs are immutable, see http_cache.py
 
 
 with app.app_context():
@@ -131,7 +171,7 @@ def daily_plan(user_id):
         return redirect(url_for("home"))
 
     # Generate a new plan or get the latest
-    plan = generate_daily_plan(user)
+    plan = openai_service.generate_daily_plan(user)
     daily_plan = DailyPlan(user_id=user.id, plan_json=json.dumps(plan))
     db.session.add(daily_plan)
     db.session.commit()
@@ -142,138 +182,101 @@ def daily_plan(user_id):
     return render_template("daily_plan.html", user=user)
 
 
-@app.route('/dashboard/<int:user_id>')
-def dashboard(user_id):
-    utc_now = datetime.now(timezone.utc)
-    local_now = utc_now.astimezone(ZoneInfo("Europe/Berlin"))
-    # old
-    # user = User.query.get(user_id)
-    # new
-    user = db.session.get(User, user_id)
-    # print(user, "UUUUUUUUUUU")
-    if not user:
-        flash("User not found")
-        return redirect(url_for('home'))
-
-    # Parse JSON strings into Python dicts for daily plans
-    for plan in user.daily_plans:
+def parse_daily_plans(plans):
+    """Attach the parsed plan document as plan.data to each DailyPlan."""
+    for plan in plans:
         raw = plan.plan_json
-    #     try:
-    #         if isinstance(plan.plan_json, str):
-    #             plan.data = json.loads(plan.plan_json)
-    #         else:
-    #             plan.data = plan.plan_json
-    #     except Exception as e:
-    #         print("Error parsing daily plan:", e)
-    #         plan.data = {} # fallback if broken JSON
-
         try:
-            data = plan.plan_json
-            #
-            # Skip parsing when empty or None
-            # if not data:
-            #     plan.data = {"meals": [], "workouts": []}
-            #     continue
-            #
             # 1️⃣ Parse JSON strings until we actually get a dict
             if isinstance(raw, str):
                 data = json.loads(raw)
             else:
                 data = raw
-            #     # Sometimes data is a stringified dict nested once more
-            #     while isinstance(data, str):
-            #         data = json.loads(data)
-            #
             # 2️⃣ Guarantee fallback
             if not isinstance(data, dict):
-                 raise ValueError("Data is not a dictionary after parsing")
-            #
-            # 3️⃣ Attach missing pictures
-            # for meal in data.get("meals", []):
-            #     if isinstance(meal, dict):
-            #         name = meal.get("name")
-            #         if name and not meal.get("image_url"):
-            #             meal["image_url"] = get_meal_image(name)
-            # print(vars(plan), "test")    # plan before transforming and to print the result on the dashboard
+                raise ValueError("Data is not a dictionary after parsing")
             plan.data = data
-            # {"meals": [], "workouts": []}  # plan = data
-            # print(vars(plan))            # plan after transforming to print the result on the dashboard
         except Exception as e:
             print("[Dashboard parse error]", e)
-            # plan.data = {}
             plan.data = {"meals": [], "workouts": []}
+    return plans
+
 
-    # Parse JSON for weekly plans
-    for plan in user.weekly_plans:
+def parse_weekly_plans(plans):
+    """Attach the parsed plan document as plan.data to each WeeklyPlan."""
+    for plan in plans:
         raw = plan.plan_json
         try:
-
             if isinstance(raw, str):
                 plan.data = json.loads(raw)
             else:
                 plan.data = raw or {}
         except Exception as e:
-                print("Error parsing weekly plan:", e)
-                plan.data = {}
+            print("Error parsing weekly plan:", e)
+            plan.data = {}
+    return plans
 
-    return render_template("dashboard.html", user=user, time=local_now.strftime("%H:%M"))
 
+def local_time_label():
+    utc_now = datetime.now(timezone.utc)
+    return utc_now.astimezone(ZoneInfo("Europe/Berlin")).strftime("%H:%M")
 
-# Meal Image Fetcher with Caching
-@lru_cache(maxsize=200)
-def get_meal_image(meal_name: str) -> str:
-    """
-    Fetches a meal image from TheMealDB API by meal name.
-    Uses an in-memory cache to reduce repeated API calls.
-    """
+
+@app.route('/dashboard/<int:user_id>')
+def dashboard(user_id):
+    user = db.session.get(User, user_id)
+    if not user:
+        flash("User not found")
+        return redirect(url_for('home'))
+
+    page_size = app.config.get("DASHBOARD_PAGE_SIZE", 5)
+    time = local_time_label()
+    active_jobs = job_queue.active_jobs(user.id)
+
+    def render():
+        # Only the first page of each list is loaded and parsed, older plans come in via "Load more".
+        daily_plans, daily_cursor = data_manager.get_daily_plans_page(user.id, limit=page_size)
+        weekly_plans, weekly_cursor = data_manager.get_weekly_plans_page(user.id, limit=page_size)
+        return render_template("dashboard.html", user=user, time=time,
+                               daily_plans=parse_daily_plans(daily_plans), daily_cursor=daily_cursor,
+                               macros=data_manager.get_plan_macros([plan.id for plan in daily_plans]),
+                               weekly_plans=parse_weekly_plans(weekly_plans), weekly_cursor=weekly_cursor,
+                               active_jobs=active_jobs)
+
+    # Plans never change, so the page only changes with a new plan, a job starting or ending,
+    # the clock label it shows, or new images/derivatives (conditional_page adds images_version());
+    # a matching If-None-Match gets a 304 without loading any plan.
+    latest_daily, latest_weekly = data_manager.get_latest_plan_keys(user.id)
+    etag_parts = (user.id, user.user_name, page_size, time, tuple(latest_daily or ()), tuple(latest_weekly or ()),
+                  tuple((job.id, job.status) for job in active_jobs))
+    last_modified = max((key[1] for key in (latest_daily, latest_weekly) if key), default=None)
+    return conditional_page(etag_parts, last_modified, render)
+
+
+@app.route('/dashboard/<int:user_id>/daily_plans')
+def dashboard_daily_plans(user_id):
+    """HTML fragment with the next page of daily plans, requested by the dashboard's "Load more" button."""
     try:
-    #     meal_name = meal_name.strip().title
-    #     response = requests.get(
-    #         f"https://www.themealdb.com/api/json/v1/1/search.php?s={meal_name}"
-    #     )
-    #     data = response.json()
-    #     meals = data.get("meals")
-    #     if meals and meals[0].get("strMealThumb"):
-    #         return meals[0]["strMealThumb"]
-    # except Exception as e:
-    #     print(f"Error fetching image for {meal_name}: {e}")
-    #
-    # # fallback placeholder if not found
-    # return url_for("static", filename="default_meal.jpg")
-
-        clean = meal_name.strip().title()  # normalize casing
-        response = requests.get(
-            f"https://www.themealdb.com/api/json/v1/1/search.php?s={clean}",
-            timeout=15,
-        )
-        data = response.json()
-        meals = data.get("meals")
-        if meals and meals[0].get("strMealThumb"):
-            return meals[0]["strMealThumb"]
-
-        # --- fallback: retry using only the first keyword (e.g. 'Chicken' from 'Chicken Salad Bowl')
-        # first_word = clean.split()[0]
-        # response = requests.get(
-        #     f"https://www.themealdb.com/api/json/v1/1/search.php?s={first_word}",
-        #     timeout=5,
-        # )
-        # data = response.json()
-        # meals = data.get("meals")
-        # if meals and meals[0].get("strMealThumb"):
-        #     return meals[0]["strMealThumb"]
-
-        # else generate a meal pic:
-        else:
-            generated_image_path = generate_meal_images(meal_name)
-            return generated_image_path
-
-
-    except Exception as e:
-        print(f"[Meal image fetch error] {meal_name!r}: {e}")
-        return generate_meal_images(meal_name)
-    # still nothing → static placeholder
-
-    # return url_for("static", filename="default_meal.jpg")
+        plans, next_cursor = data_manager.get_daily_plans_page(
+            user_id, cursor=request.args.get("cursor"), limit=app.config.get("DASHBOARD_PAGE_SIZE", 5))
+    except ValueError:
+        return "Invalid cursor", 400
+    return render_template("_daily_plan_list.html", user_id=user_id, time=local_time_label(),
+                           daily_plans=parse_daily_plans(plans), daily_cursor=next_cursor, is_first_page=False,
+                           macros=data_manager.get_plan_macros([plan.id for plan in plans]))
+
+
+@app.route('/dashboard/<int:user_id>/weekly_plans')
+def dashboard_weekly_plans(user_id):
+    """HTML fragment with the next page of weekly plans, requested by the dashboard's "Load more" button."""
+    try:
+        plans, next_cursor = data_manager.get_weekly_plans_page(
+            user_id, cursor=request.args.get("cursor"), limit=app.config.get("DASHBOARD_PAGE_SIZE", 5))
+    except ValueError:
+        return "Invalid cursor", 400
+    return render_template("_weekly_plan_list.html", user_id=user_id,
+                           weekly_plans=parse_weekly_plans(plans), weekly_cursor=next_cursor, is_first_page=False)
+
 
 # @app.route('/generate_plan/<int:user_id>')
 # def generate_plan(user_id):
@@ -310,292 +313,354 @@ def get_meal_image(meal_name: str) -> str:
 #     return redirect(url_for('dashboard', user_id=user.id))
 
 
-# Workout Image Fetcher with Caching
-@lru_cache(maxsize=200)
-def get_workout_image(workout_item, user) -> str:
+def attach_images(plan_dict, user):
     """
-    Accepts either a workout dictionary or a plain string.
-    Always passes a proper dictionary to generate_workout_images().
+    Resolve item images; in the offline "local" mode only from the image cache.
+    IMAGE_MODE=lazy (the default) saves the plan with /img/ links that make each image on first view,
+    IMAGE_MODE=eager makes all of them before the plan is saved.
     """
-    # 🧠 1. Convert if it’s just a string
-    if isinstance(workout_item, str):
-        workout_data = {"name": workout_item}
-    else:
-        # assume it's already a dictionary
-        workout_data = workout_item
+    if plan_mode() == "local":
+        return attach_cached_images(plan_dict, user)
+    if app.config.get("IMAGE_MODE", "lazy") == "lazy":
+        return attach_lazy_images(plan_dict, user)
+    return attach_plan_images(plan_dict, user)
 
-    try:
-        generated_image_path = generate_workout_images(workout_data, user)
-        return generated_image_path
 
-    except Exception as e:
-        print(f"[Workout image fetch error] {workout_data.get('name', workout_data)!r}: {e}")
-        # Try one more time just using the name string
-        return generate_workout_images({"name": str(workout_data)}, user)
+# Background jobs: each handler runs inside a job_queue worker with its own app context,
+# and returns the id of the plan it saved so /jobs/<id> can point at it.
+@job_queue.register("daily_meals")
+def run_daily_meals_job(user_id):
+    user = db.session.get(User, user_id)
+    plan_dict = build_plan("daily_meals", user).model_dump()
+    attach_images(plan_dict, user)
 
+    # save to DB as a partial plan (just meals)
+    return data_manager.save_daily_plan(user.id, plan_dict).id
 
-# Generate only daily meals
-@app.route("/generate_daily_meals/<int:user_id>")
-def generate_daily_meals(user_id):
+
+@job_queue.register("daily_workouts")
+def run_daily_workouts_job(user_id):
     user = db.session.get(User, user_id)
-    if not user:
-        flash("User not found", "error")
-        return redirect(url_for('home'))
-    try:
-        # Call AI but only request meals. This won't work at the beginning
-        from ai.openai_service import generate_daily_meals
-        plan_data = generate_daily_meals(user)
-        plan_dict = plan_data.model_dump()
+    plan_data = build_plan("daily_workouts", user)
 
-        for meal in plan_dict.get("meals", []):
-            meal_name = meal.get("name")
-            if meal_name:
-                meal["image_url"] = get_meal_image(meal_name)
+    # Ensure it's a dictionary
+    if hasattr(plan_data, "model_dump"):
+        plan_dict = plan_data.model_dump()
+    elif isinstance(plan_data, str):
+        plan_dict = json.loads(plan_data)
+    else:
+        plan_dict = plan_data
 
-        # save to DB as a partial plan (just meals)
-        daily_plan = DailyPlan(user_id=user.id, plan_json=json.dumps(plan_dict))
-        db.session.add(daily_plan)
-        db.session.commit()
-        flash("Daily meals generated successfully!", "success")
+    attach_images(plan_dict, user)
+    return data_manager.save_daily_plan(user.id, plan_dict).id
 
-    except Exception as e:
-        db.session.rollback()
-        flash(f"Error generating meals: {str(e)}", "error")
 
-    return redirect(url_for('dashboard', user_id=user.id))
+@job_queue.register("daily_plan")
+def run_daily_plan_job(user_id):
+    user = db.session.get(User, user_id)
+    plan_dict = build_plan("daily_plan", user).model_dump()  # Pydantic → dict
+    attach_images(plan_dict, user)
+    return data_manager.save_daily_plan(user.id, plan_dict, indent=2).id
 
 
-# Generate only daily workouts
-@app.route("/generate_daily_workouts/<int:user_id>")
-def generate_daily_workouts(user_id):
+@job_queue.register("weekly_plan")
+def run_weekly_plan_job(user_id):
     user = db.session.get(User, user_id)
-    if not user:
-        flash("User not found", "error")
-        return redirect(url_for('home'))
+    plan_dict = build_plan("weekly_plan", user).model_dump()
+    attach_images(plan_dict, user)  # every meal and workout of every day
+    return data_manager.save_weekly_plan(user.id, plan_dict).id
 
-    try:
-        from ai.openai_service import generate_daily_workouts
-        plan_data = generate_daily_workouts(user)
-
-        print(type(plan_data))
-        # Ensure it's a dictionary
-        if hasattr(plan_data, "model_dump"):
-            plan_dict = plan_data.model_dump()
-            print(type(plan_dict))
-        elif isinstance(plan_data, str):
-            plan_dict = json.loads(plan_data)
-        else:
-            plan_dict = plan_data
-
-        for workout in plan_dict.get("workouts", []):
-            # if it's a dictionary with details, read the name normally
-            if isinstance(workout, dict):
-                workout_name = workout.get("name")
-            else:
-                # if it's just a word (string), use it directly
-                workout_name = str(workout)
-            # now try to get an image using that name
-            if workout_name:
-                image_url = get_workout_image(workout_name, user)
-                workout["image_url"] = image_url
-                # if it's a dictionary, store the image link back inside it
-                if isinstance(workout, dict):
-                    workout["image_url"] = image_url
-
-        daily_plan = DailyPlan(user_id=user.id, plan_json=json.dumps(plan_dict))
-        db.session.add(daily_plan)
-        db.session.commit()
-        flash("Daily workouts generated successfully!", "success")
-
-    except Exception as e:
-        db.session.rollback()
-        flash(f"Error generating workouts: {str(e)}", "error")
 
-    return redirect(url_for('dashboard', user_id=user.id))
+# How each kind of plan is saved when it does not go through a job (pooled and local plans).
+PLAN_SAVERS = {
+    "daily_meals": lambda user_id, plan_dict: data_manager.save_daily_plan(user_id, plan_dict),
+    "daily_workouts": lambda user_id, plan_dict: data_manager.save_daily_plan(user_id, plan_dict),
+    "daily_plan": lambda user_id, plan_dict: data_manager.save_daily_plan(user_id, plan_dict, indent=2),
+    "weekly_plan": lambda user_id, plan_dict: data_manager.save_weekly_plan(user_id, plan_dict),
+}
 
 
-@app.route('/generate_plan/<int:user_id>')
-def generate_plan(user_id):
-    # user = User.query.get(user_id)
+def take_pooled_plan(kind, user):
+    """Saves an unused pre-generated plan for the user and returns its id, or None if the pool has none."""
+    plan_dict = plan_pool.take(kind, user)  # pooled plans already carry their (lazy) image links
+    if plan_dict is None:
+        return None
+    return PLAN_SAVERS[kind](user.id, plan_dict).id
+
+
+def save_local_plan(kind, user):
+    """Builds and saves a local-planner plan right away (a few ms, no network); returns its id."""
+    plan_dict = attach_cached_images(LOCAL_GENERATORS[kind](user).model_dump(), user)
+    return PLAN_SAVERS[kind](user.id, plan_dict).id
+
+
+def enqueue_generation(kind, user_id, label):
+    """
+    Hand out a pre-generated plan when the pool has one for the user's profile,
+    otherwise queue a generation job and return right away instead of blocking on the AI call.
+    In the local PLAN_MODE the local plan is saved right here; in local_first it is saved first,
+    so there is something to show at once, and the job refines it.
+    """
     user = db.session.get(User, user_id)
     if not user:
         flash("User not found", "error")
         return redirect(url_for("home"))
 
-    try:
-        db.session.commit()
+    plan_id = take_pooled_plan(kind, user)
+    if plan_id is not None:
+        if request.accept_mimetypes.best == "application/json":
+            return jsonify({"kind": kind, "plan_id": plan_id, "source": "pool"}), 201
+        flash(f"{label} is ready.", "success")
+        return redirect(url_for('dashboard', user_id=user.id))
+
+    if plan_mode() == "local":  # nothing to wait for: save it in this request instead of queueing a job
+        plan_id = save_local_plan(kind, user)
+        if request.accept_mimetypes.best == "application/json":
+            return jsonify({"kind": kind, "plan_id": plan_id, "source": "local"}), 201
+        flash(f"{label} is ready.", "success")
+        return redirect(url_for('dashboard', user_id=user.id))
+
+    draft_id = save_local_plan(kind, user) if plan_mode() == "local_first" else None
+    job = job_queue.enqueue(kind, user.id)  # in local_first mode: the OpenAI refinement of the draft
+
+    if draft_id is not None:
+        if request.accept_mimetypes.best == "application/json":
+            return jsonify({"kind": kind, "plan_id": draft_id, "source": "local", "job": job.to_dict()}), 201
+        flash(f"{label} is ready. A refined version is being generated and will show up here.", "success")
+        return redirect(url_for('dashboard', user_id=user.id))
+
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify(job.to_dict()), 202
+
+    flash(f"{label} generation started, it will show up here once it is ready.", "success")
+    return redirect(url_for('dashboard', user_id=user.id))
 
-        plan_data = generate_daily_plan(user)  # returns DailyPlan (Pydantic model)
-        plan_dict = plan_data.model_dump()            # ← convert to Python dict
 
-        # attach meal images here
-        for meal in plan_dict.get("meals", []):
-            meal_name = meal.get("name")
-            if meal_name:
-                meal["image_url"] = get_meal_image(meal_name)
+# Generate only daily meals
+@app.route("/generate_daily_meals/<int:user_id>")
+def generate_daily_meals(user_id):
+    return enqueue_generation("daily_meals", user_id, "Daily meals")
 
-        for workout in plan_dict.get("workouts", []):
-            # if it's a dictionary with details, read the name normally
-            if isinstance(workout, dict):
-                workout_name = workout.get("name")
-            else:
-                # if it's just a word (string), use it directly
-                workout_name = str(workout)
-            # now try to get an image using that name
-            if workout_name:
-                image_url = get_workout_image(workout_name, user)
-                workout["image_url"] = image_url
-                # if it's a dictionary, store the image link back inside it
-                if isinstance(workout, dict):
-                    workout["image_url"] = image_url
-
-
-        # Save to DB
-        daily_plan = DailyPlan(
-            user_id=user.id,
-            plan_json=json.dumps(plan_dict, indent=2)
-        )
-        db.session.add(daily_plan)
-        db.session.commit()
 
-        flash("Daily plan generated successfully!", "success")
+# Generate only daily workouts
+@app.route("/generate_daily_workouts/<int:user_id>")
+def generate_daily_workouts(user_id):
+    return enqueue_generation("daily_workouts", user_id, "Daily workouts")
 
-    except Exception as e:
-        db.session.rollback()
-        flash(f"Error generating plan: {str(e)}", "error")
 
-    return redirect(url_for('dashboard', user_id=user.id))
+@app.route('/generate_plan/<int:user_id>')
+def generate_plan(user_id):
+    return enqueue_generation("daily_plan", user_id, "Daily plan")
 
 
 @app.route('/generate_weekly_plan/<int:user_id>')
 def generate_weekly_plan_route(user_id):
-    # user = User.query.get(user_id)
+    return enqueue_generation("weekly_plan", user_id, "Weekly plan")
+
+
+@app.route("/stream/<string:kind>/<int:user_id>")
+def stream_plan_route(kind, user_id):
+    """
+    Server-Sent Events version of the daily generators: an "item" event for each
+    meal/workout as soon as the model has written it, then "done" with the saved
+    plan's id (or "failed" with the error).
+    """
+    if kind not in STREAM_REQUESTS:
+        abort(404)
     user = db.session.get(User, user_id)
     if not user:
-        flash("User not found", "error")
-        return redirect(url_for("home"))
+        abort(404)
+
+    def events():
+        # One stream per user and kind at a time: a double click or second tab waits for the running one
+        # and then points at the plan it saved, instead of paying for a second generation.
+        lease_key = f"stream:{kind}:{user.id}"
+        owner = acquire_lease(lease_key)
+        if owner is None:
+            try:
+                release_lease(lease_key, wait_for_lease(lease_key, app.config.get("STREAM_WAIT_SECONDS", 180)))
+            except TimeoutError as e:
+                yield sse_event("failed", {"error": str(e)})
+                return
+            latest_daily, _ = data_manager.get_latest_plan_keys(user.id)
+            yield sse_event("done", {"plan_id": latest_daily[0] if latest_daily else None,
+                                     "dashboard_url": url_for("dashboard", user_id=user.id)})
+            return
 
-    try:
-        db.session.commit()  # commit any pending changes
-
-        # Call your AI service for weekly plan
-        plan_data = generate_weekly_plan(user)
-
-        # Add images for each meal in each day
-        for day in plan_data.get("days", []):
-            for meal in day.get("meals", []):
-                meal_name = meal.get("name")
-                if meal_name:
-                    meal["image_url"] = get_meal_image(meal_name)
-
-            # Add images for each meal in each day
-            for workout in plan_dict.get("workouts", []):
-                # if it's a dictionary with details, read the name normally
-                if isinstance(workout, dict):
-                    workout_name = workout.get("name")
-                else:
-                    # if it's just a word (string), use it directly
-                    workout_name = str(workout)
-                # now try to get an image using that name
-                if workout_name:
-                    image_url = get_workout_image(workout, user)
-                    # if it's a dictionary, store the image link back inside it
-                    if isinstance(workout, dict):
-                        workout["image_url"] = image_url
-
-        weekly_plan = WeeklyPlan(
-            user_id=user.id,
-            plan_json=json.dumps(plan_data.model_dump()) # Convert Pydantic → dict → JSON string by adding .model_dump()
-        )
-        db.session.add(weekly_plan)
-        db.session.commit()
+        try:
+            # the local planner has the whole plan at once, so its items are just replayed
+            source = replay_plan(LOCAL_GENERATORS[kind](user)) if plan_mode() == "local" else stream_plan(kind, user)
+            for name, data in source:
+                if name == "item":
+                    yield sse_event("item", data)
+                    continue
+                plan_dict = data.model_dump()
+                attach_images(plan_dict, user)
+                plan = PLAN_SAVERS[kind](user.id, plan_dict)
+                yield sse_event("done", {"plan_id": plan.id,
+                                         "dashboard_url": url_for("dashboard", user_id=user.id)})
+        except Exception as e:
+            db.session.rollback()
+            print(f"[Plan stream] {kind} for user {user.id} failed: {e}")
+            yield sse_event("failed", {"error": str(e)})
+        finally:
+            release_lease(lease_key, owner)
 
-        flash("Weekly plan generated successfully!", "success")
-    except Exception as e:
-        db.session.rollback()
-        flash(f"Error generating weekly plan: {str(e)}", "error")
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-    return redirect(url_for('dashboard', user_id=user.id))
 
+@app.route("/jobs/<string:job_id>")
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
 
-# Fill missing images on the fly, but do not freeze the page; use a background thread or task queue.
-def async_get_all_images(meal, workout):
-    if meal:
-        meal_name = meal.get("name")
-        meal["image_url"] = get_meal_image(meal_name)
 
+@app.route("/img/<string:kind>/<string:key>")
+def lazy_image(kind, key):
+    """
+    Redirects to an item's image, generating it first if nobody has viewed it yet (see attach_lazy_images).
+    Only links carrying the signature the app gave them may generate; any other key gets the cached
+    image or the placeholder, so nobody can run up image generations by making up names.
+    """
+    parsed = parse_lazy_image_key(kind, key) if kind in ("meal", "workout") else None
+    if parsed is None:
+        abort(404)
+    name, gender = parsed
+    placeholders = (DEFAULT_MEAL_IMAGE, DEFAULT_WORKOUT_IMAGE)
+    signed = verify_lazy_image(kind, key, request.args.get("s"))
+    if plan_mode() == "local" or not signed:  # no network calls: cached image or placeholder
+        url = image_cache.get(image_cache_key(kind, name, gender)) or placeholders[kind == "workout"]
     else:
-    
-        workout_name = workout.get("name")
-        workout["image_url"] = get_workout_image(workout_name, user)
+        url = resolve_lazy_image(kind, name, gender)
 
-    # in dashboard parsing loop
-    threading.Thread(target=async_get_all_images, args=(meal, workout)).start()
+    # ?size=thumb|medium[&format=avif] from the srcsets (see ai/image_variants.py): the derivative if it exists
+    size, fmt = request.args.get("size"), request.args.get("format", "webp")
+    target = variant_url(url, size, fmt) if size in VARIANT_WIDTHS and fmt in QUALITY else url
 
+    response = redirect(hashed_static_url(target))
+    if url not in placeholders:  # the item's image is settled now, browsers can skip this hop for a day
+        response.cache_control.public = True
+        response.cache_control.max_age = 24 * 3600
+    return response
 
-# Even with a longer timeout, heavy AI calls can easily take 20–40 s, making Flask feel frozen.
-# Use a lightweight background thread or a Celery task:
-###
-def background_generate_workouts(user):
-    try:
-        plan = generate_daily_workouts(user)
-        # save to DB, attach images, etc.
-    except Exception as e:
-        print(e)
 
+@app.route("/admin/image_cache")
+def image_cache_stats():
+    return jsonify(image_cache.stats())
+
+
+@app.route("/admin/plan_pool")
+def plan_pool_stats():
+    return jsonify(plan_pool.stats())
+
+
+@app.route("/admin/ai-usage")
+def ai_usage():
+    return jsonify(usage_report(days=request.args.get("days", 7, type=int)))
 
-# @app.route("/generate_daily_workouts/<int:user_id>")
-# def async_generate_daily_workouts(user_id):
-#     user = db.session.get(User, user_id)
-#     if not user:
-#         flash("User not found", "error")
-#         return redirect(url_for("home"))
-#
-#     threading.Thread(target=background_generate_workouts, args=(user,), daemon=True).start()
-#     flash("Workout generation started—refresh dashboard in a minute.", "info")
-#     return redirect(url_for("dashboard", user_id=user.id))
-# ###
+
+@app.route("/admin/ai-governor")
+def ai_governor():
+    return jsonify(rate_governor.stats())
+
+
+@app.route("/admin/export/<string:kind>")
+def export_data(kind):
+    """
+    Streams users, daily_plans or weekly_plans as ?format=ndjson (default) or csv,
+    optionally filtered by ?user_id=1&user_id=2, ?since=YYYY-MM-DD and ?until=YYYY-MM-DD.
+    Only served when EXPORT_TOKEN is set, to requests sending "Authorization: Bearer <EXPORT_TOKEN>";
+    otherwise use `flask export`.
+    """
+    token = app.config.get("EXPORT_TOKEN")
+    if not token:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        abort(401)
+    fmt = request.args.get("format", "ndjson")
+    if kind not in EXPORT_KINDS or fmt not in EXPORT_FORMATS:
+        abort(404)
+    try:
+        since, until = (date.fromisoformat(request.args[name]) if request.args.get(name) else None
+                        for name in ("since", "until"))
+    except ValueError:
+        abort(400)
+    chunks = export_chunks(kind, fmt, request.args.getlist("user_id", type=int), since, until)
+    return Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[fmt],
+                    headers={"Content-Disposition": f"attachment; filename={kind}.{fmt}",
+                             "X-Accel-Buffering": "no"})
 
 
 @app.route("/daily_meals/<int:user_id>")
 def daily_meals(user_id):
-    user = db.session.get(User, user_id)
-    plans = DailyPlan.query.filter_by(user_id=user_id).all()
-    parsed = [json.loads(p.plan_json) | {"id": p.id} for p in plans]
-    return render_template("daily_meals.html", user=user, plans=parsed)
+    return render_daily_items(user_id, "meal", "daily_meals.html")
 
 
 @app.route("/daily_workouts/<int:user_id>")
 def daily_workouts(user_id):
+    return render_daily_items(user_id, "workout", "daily_workouts.html")
+
+
+def render_daily_items(user_id, kind, template):
+    """One newest-first page of the plans holding `kind` items; only those item rows are read."""
     user = db.session.get(User, user_id)
-    plans = DailyPlan.query.filter_by(user_id=user_id).all()
-    parsed = [json.loads(p.plan_json) | {"id": p.id} for p in plans]
-    return render_template("daily_workouts.html", user=user, plans=parsed)
+    try:
+        plans, next_cursor = data_manager.get_daily_items(
+            user_id, kind, cursor=request.args.get("cursor"), limit=app.config.get("DAILY_ITEMS_PAGE_SIZE", 10))
+    except ValueError:
+        return "Invalid cursor", 400
+    return render_template(template, user=user, plans=plans, next_cursor=next_cursor)
+
+
+# Plans never change once created, so a rendered item card can be reused for every later view.
+_item_cards = OrderedDict()
+_item_cards_lock = threading.Lock()
+
+
+def render_item_card(item_type, plan_id, item_index):
+    """Rendered item card and owner user id for one plan item, or None if the item does not exist."""
+    key = (plan_id, item_type, item_index)
+    with _item_cards_lock:
+        if key in _item_cards:
+            _item_cards.move_to_end(key)
+            return _item_cards[key]
+
+    found = data_manager.get_plan_item(plan_id, item_type, item_index)
+    if not found:
+        return None  # misses are not cached: the plan may still be being written
+    item, user_id = found
+    card = (Markup(render_template("_item_card.html", item=item, item_type=item_type)), user_id)
+
+    with _item_cards_lock:
+        _item_cards[key] = card
+        while len(_item_cards) > app.config.get("ITEM_CARD_CACHE_SIZE", 2048):
+            _item_cards.popitem(last=False)
+    return card
 
 
 @app.route("/item/<string:item_type>/<int:plan_id>/<int:item_index>")
 def item_details(item_type, plan_id, item_index):
-    plan = db.session.get(DailyPlan, plan_id)
-    if not plan:
-        flash("Plan not found", "error")
-        return redirect(url_for("home"))
-
-    data = json.loads(plan.plan_json)
-    item = None
-    if item_type == "meal":
-        item = data.get("meals", [])[item_index]
-        print("test (meal)"[item_index])
-    elif item_type == "workout":
-        item = data.get("workouts", [])[item_index]
-        print("test (workout index)"[item_index])
-    else:
+    if item_type not in ("meal", "workout"):
+        plan = db.session.get(DailyPlan, plan_id)
         flash("Invalid item type", "error")
-        return redirect(url_for("dashboard", user_id=plan.user_id))
+        return redirect(url_for("dashboard", user_id=plan.user_id) if plan else url_for("home"))
+
+    created_at = db.session.query(DailyPlan.created_at).filter_by(id=plan_id).scalar()
+    if created_at is None:
+        abort(404)
+
+    def render():
+        card = render_item_card(item_type, plan_id, item_index)
+        if card is None:
+            abort(404)  # index past the end of the plan's meals/workouts
+        item_card, user_id = card
+        return render_template("item_details.html", item_card=item_card, user_id=user_id)
 
-    return render_template("item_details.html",
-                           item=item,
-                           item_type=item_type,
-                           user_id=plan.user_id)
+    # plans are immutable: the item's address is its version
+    return conditional_page((plan_id, item_type, item_index), created_at, render)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,188 @@
+"""
+End-to-end load test of a running app (ideally pointed at benchmarks.mock_openai).
+
+Creates a few users through /add_user, then keeps --concurrency clients busy
+for --seconds, each picking routes by the --mix weights:
+
+    generate_plan         /generate_plan/<user>          (JSON: pooled/local plan or queued job)
+    generate_weekly_plan  /generate_weekly_plan/<user>
+    dashboard             /dashboard/<user>
+    item                  /item/meal/<plan>/0            (plans produced during the run)
+
+Queued jobs are polled until they finish, so the report also shows how long
+a plan takes end to end. Per route: requests/s and latency percentiles.
+
+    python -m benchmarks.load_test --base-url http://127.0.0.1:5000 --concurrency 16 --seconds 60 \\
+        --mix generate_plan=1,generate_weekly_plan=0.2,dashboard=6,item=6
+"""
+import argparse
+import random
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+import requests
+
+GENERATE_ROUTES = {"generate_plan": "daily_plan", "generate_weekly_plan": "weekly_plan"}
+PROFILE_CHOICES = {
+    "gender": ("male", "female"),
+    "dietary_pref": ("no preference", "vegetarian", "vegan", "keto", "pescatarian", "halal", "gluten-free"),
+    "fitness_goal": ("maintain", "lose", "gain"),
+    "activity_level": ("sedentary", "light", "moderate", "active", "very_active"),
+}
+
+
+def parse_mix(spec):
+    """'dashboard=6,item=6' → {"dashboard": 6.0, "item": 6.0}"""
+    mix = {}
+    for part in spec.split(","):
+        route, _, weight = part.partition("=")
+        if route not in ("generate_plan", "generate_weekly_plan", "dashboard", "item"):
+            raise argparse.ArgumentTypeError(f"unknown route {route!r}")
+        mix[route] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+class LoadTest:
+
+    def __init__(self, base_url, mix):
+        self.base_url = base_url.rstrip("/")
+        self.mix = mix
+        self.user_ids = []
+        self.plan_ids = []  # daily plans, for the item route
+        self.pending_jobs = {}  # job id → (kind, enqueued at)
+        self.latencies = defaultdict(list)  # route → seconds
+        self.errors = defaultdict(int)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def session(self):
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def create_users(self, count):
+        run = uuid.uuid4().hex[:6]
+        for i in range(count):
+            form = {key: random.choice(choices) for key, choices in PROFILE_CHOICES.items()}
+            form.update(user_name=f"load-{run}-{i}", age=str(random.randint(18, 70)),
+                        height=str(random.randint(155, 195)), weight=str(random.randint(50, 110)))
+            response = self.session().post(f"{self.base_url}/add_user", data=form, timeout=30)
+            match = re.search(r"/dashboard/(\d+)", response.text)
+            if not match:
+                raise RuntimeError(f"could not create user {form['user_name']} ({response.status_code})")
+            self.user_ids.append(int(match.group(1)))
+
+    def record(self, route, seconds, ok):
+        with self.lock:
+            self.latencies[route].append(seconds)
+            if not ok:
+                self.errors[route] += 1
+
+    def request(self, route):
+        user_id = random.choice(self.user_ids)
+        if route == "item":
+            with self.lock:
+                plan_id = random.choice(self.plan_ids) if self.plan_ids else None
+            if plan_id is None:
+                route = "dashboard"  # nothing generated yet
+            else:
+                path = f"/item/meal/{plan_id}/0"
+        if route == "dashboard":
+            path = f"/dashboard/{user_id}"
+        elif route in GENERATE_ROUTES:
+            path = f"/{route}/{user_id}"
+
+        started = time.perf_counter()
+        try:
+            response = self.session().get(f"{self.base_url}{path}", timeout=120,
+                                          headers={"Accept": "application/json"} if route in GENERATE_ROUTES else {})
+            ok = response.status_code < 400
+        except requests.RequestException:
+            response, ok = None, False
+        self.record(route, time.perf_counter() - started, ok)
+
+        if ok and route in GENERATE_ROUTES:
+            body = response.json()
+            if "plan_id" in body and route == "generate_plan":
+                with self.lock:
+                    self.plan_ids.append(body["plan_id"])
+            job = body.get("job") or (body if "status" in body else None)
+            if job:
+                with self.lock:
+                    self.pending_jobs[job["id"]] = (GENERATE_ROUTES[route], time.perf_counter())
+
+    def poll_jobs(self):
+        """Checks every pending job once; finished ones are recorded as 'job:<kind>'."""
+        with self.lock:
+            pending = list(self.pending_jobs.items())
+        for job_id, (kind, enqueued) in pending:
+            try:
+                job = self.session().get(f"{self.base_url}/jobs/{job_id}", timeout=30).json()
+            except (requests.RequestException, ValueError):
+                continue
+            if job.get("status") not in ("done", "failed"):
+                continue
+            self.record(f"job:{kind}", time.perf_counter() - enqueued, job["status"] == "done")
+            with self.lock:
+                self.pending_jobs.pop(job_id, None)
+                if job["status"] == "done" and kind == "daily_plan" and job.get("plan_id"):
+                    self.plan_ids.append(job["plan_id"])
+
+    def run(self, concurrency, seconds, drain):
+        routes, weights = zip(*self.mix.items())
+        stop = time.perf_counter() + seconds
+
+        def client():
+            while time.perf_counter() < stop:
+                self.request(random.choices(routes, weights)[0])
+
+        def poller():
+            while time.perf_counter() < stop + drain and (time.perf_counter() < stop or self.pending_jobs):
+                self.poll_jobs()
+                time.sleep(0.5)
+
+        threads = [threading.Thread(target=client) for _ in range(concurrency)] + [threading.Thread(target=poller)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def report(self, seconds):
+        print(f"{'route':<24}{'requests':>9}{'errors':>8}{'req/s':>8}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+        for route in sorted(self.latencies):
+            values = sorted(self.latencies[route])
+            print(f"{route:<24}{len(values):>9}{self.errors[route]:>8}{len(values) / seconds:>8.1f}"
+                  f"{percentile(values, 0.5) * 1000:>9.0f}{percentile(values, 0.9) * 1000:>9.0f}"
+                  f"{percentile(values, 0.99) * 1000:>9.0f}{values[-1] * 1000:>9.0f}")
+        if self.pending_jobs:
+            print(f"\n{len(self.pending_jobs)} job(s) still unfinished after the drain period")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--mix", type=parse_mix, default="generate_plan=1,generate_weekly_plan=0.2,dashboard=6,item=6")
+    parser.add_argument("--drain", type=float, default=60, help="seconds to keep polling unfinished jobs")
+    args = parser.parse_args()
+
+    test = LoadTest(args.base_url, args.mix)
+    test.create_users(args.users)
+    print(f"{args.users} users, {args.concurrency} clients, {args.seconds:g}s\n")
+    test.run(args.concurrency, args.seconds, args.drain)
+    test.report(args.seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Local stand-in for the OpenAI endpoints the app uses, so the app can be
+load-tested without paying for API calls:
+
+    POST /v1/chat/completions   structured-output `parse` calls, also with stream=true
+    POST /v1/images/generations gpt-image-1 style b64_json images
+
+Chat responses are recorded plans from benchmarks/fixtures, picked by the
+response_format schema name (DailyPlan_*.json for DailyPlan, ...). Latencies
+are drawn from the given distributions and a share of calls fail the way the
+real API does (429 / 500), so the SDK's retry logic is exercised too.
+
+    python -m benchmarks.mock_openai --port 8001 --chat-latency lognormal:2.5:0.4 \\
+        --image-latency uniform:3:8 --error-rate 0.02 --rate-limit-rate 0.05
+
+and start the app against it with
+
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=mock python app.py
+
+Latency specs: fixed:S, uniform:LOW:HIGH, normal:MEAN:SD, lognormal:MEDIAN:SIGMA (seconds).
+"""
+import argparse
+import base64
+import glob
+import json
+import os
+import random
+import struct
+import threading
+import time
+import uuid
+import zlib
+from collections import defaultdict
+
+from flask import Flask, Response, jsonify, request
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def parse_latency(spec):
+    """'lognormal:2.5:0.4' → a function returning one latency sample in seconds."""
+    kind, *args = spec.split(":")
+    values = [float(a) for a in args]
+    samplers = {
+        "fixed": lambda: values[0],
+        "uniform": lambda: random.uniform(values[0], values[1]),
+        "normal": lambda: random.gauss(values[0], values[1]),
+        "lognormal": lambda: random.lognormvariate(0, values[1]) * values[0],
+    }
+    if kind not in samplers:
+        raise argparse.ArgumentTypeError(f"unknown latency distribution {kind!r}")
+    sampler = samplers[kind]
+    return lambda: max(sampler(), 0)
+
+
+def load_fixtures(directory=FIXTURES_DIR):
+    """{schema name: [response JSON text, ...]} from <SchemaName>_<n>.json files."""
+    fixtures = defaultdict(list)
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        schema = os.path.basename(path).rsplit("_", 1)[0]
+        with open(path) as f:
+            fixtures[schema].append(json.dumps(json.load(f)))
+    return fixtures
+
+
+def make_png(size=256):
+    """A small gradient PNG standing in for a generated image."""
+    # each scanline: filter byte 0, then RGB pixels
+    rows = b"".join(b"\x00" + bytes(value for x in range(size)
+                                    for value in (x * 255 // size, y * 255 // size, 128))
+                    for y in range(size))
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b"")
+
+
+def create_app(chat_latency, image_latency, error_rate=0.0, rate_limit_rate=0.0, fixtures=None):
+    app = Flask(__name__)
+    fixtures = fixtures or load_fixtures()
+    image_b64 = base64.b64encode(make_png()).decode()
+    counts = defaultdict(int)
+    lock = threading.Lock()
+
+    def count(key):
+        with lock:
+            counts[key] += 1
+
+    def injected_failure():
+        roll = random.random()
+        if roll < rate_limit_rate:
+            count("rate_limited")
+            return jsonify({"error": {"message": "Rate limit reached (mock)", "type": "requests",
+                                      "code": "rate_limit_exceeded"}}), 429
+        if roll < rate_limit_rate + error_rate:
+            count("errors")
+            return jsonify({"error": {"message": "The server had an error (mock)", "type": "server_error"}}), 500
+        return None
+
+    def usage_for(body, content):
+        prompt = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4
+        completion = len(content) // 4
+        return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion,
+                "prompt_tokens_details": {"cached_tokens": 0}}
+
+    @app.post("/v1/chat/completions")
+    def chat_completions():
+        body = request.get_json()
+        failure = injected_failure()
+        if failure:
+            return failure
+
+        schema = ((body.get("response_format") or {}).get("json_schema") or {}).get("name")
+        if schema not in fixtures:
+            return jsonify({"error": {"message": f"No fixture for response_format {schema!r}",
+                                      "type": "invalid_request_error"}}), 400
+        content = random.choice(fixtures[schema])
+        count(f"chat:{schema}")
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        latency = chat_latency()
+
+        if not body.get("stream"):
+            time.sleep(latency)
+            return jsonify({
+                "id": completion_id, "object": "chat.completion", "created": int(time.time()),
+                "model": body.get("model", "gpt-4o-mini"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content, "refusal": None}}],
+                "usage": usage_for(body, content),
+            })
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage")
+
+        def chunks():
+            # the content trickles out over the sampled latency, like tokens do
+            pieces = [content[i:i + 24] for i in range(0, len(content), 24)]
+            for i, piece in enumerate(pieces):
+                time.sleep(latency / len(pieces))
+                delta = {"role": "assistant", "content": piece} if i == 0 else {"content": piece}
+                yield "data: " + json.dumps({
+                    "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": body.get("model", "gpt-4o-mini"),
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+                }) + "\n\n"
+            yield "data: " + json.dumps({
+                "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": body.get("model", "gpt-4o-mini"),
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                **({"usage": usage_for(body, content)} if include_usage else {}),
+            }) + "\n\n"
+            yield "data: [DONE]\n\n"
+
+        return Response(chunks(), mimetype="text/event-stream")
+
+    @app.post("/v1/images/generations")
+    def images_generations():
+        failure = injected_failure()
+        if failure:
+            return failure
+        count("images")
+        time.sleep(image_latency())
+        return jsonify({
+            "created": int(time.time()),
+            "data": [{"b64_json": image_b64}],
+            "usage": {"input_tokens": 60, "output_tokens": 1056, "total_tokens": 1116,
+                      "input_tokens_details": {"text_tokens": 60, "image_tokens": 0}},
+        })
+
+    @app.get("/stats")
+    def stats():
+        return jsonify(dict(counts))
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--chat-latency", type=parse_latency, default="lognormal:2.5:0.4")
+    parser.add_argument("--image-latency", type=parse_latency, default="uniform:3:8")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls answered with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of calls answered with a 429")
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    args = parser.parse_args()
+
+    app = create_app(args.chat_latency, args.image_latency, args.error_rate, args.rate_limit_rate,
+                     load_fixtures(args.fixtures))
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
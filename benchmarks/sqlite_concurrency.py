@@ -0,0 +1,124 @@
+"""
+Concurrent read/write throughput of the plan tables, before and after the
+connection tuning in datamanager/sqlite_setup.py.
+
+Readers run the dashboard's first-page query while writers insert daily
+plans, each on its own pooled connection, the way several gunicorn workers
+and job threads hit the same database file.
+
+    python -m benchmarks.sqlite_concurrency --readers 8 --writers 2 --seconds 10
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, insert, select, exc
+
+from datamanager.models import db, User, DailyPlan
+from datamanager.sqlite_setup import configure_engine, engine_options
+
+PLAN_JSON = json.dumps({
+    "meals": [{"name": f"Meal {i}", "calories": 400, "protein": 30, "carbs": 40, "fats": 12} for i in range(6)],
+    "workouts": [{"name": f"Exercise {i}", "type": "Strength", "duration": "15 min"} for i in range(3)],
+})
+
+
+def make_engine(path, tuned, pool_size):
+    if tuned:
+        engine = create_engine(f"sqlite:///{path}", **engine_options(pool_size=pool_size, max_overflow=0))
+        configure_engine(engine)
+    else:
+        # what the app had before: default pool, rollback journal, FULL sync and pysqlite's default
+        # 5s busy timeout (check_same_thread off only so pooled connections can move between threads)
+        engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    return engine
+
+
+def seed(engine, users, plans_per_user):
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {"id": i, "user_name": f"user{i}", "gender": "male", "age": 30, "height": 180, "weight": 80,
+             "dietary_pref": "no preference", "fitness_goal": "maintain", "activity_level": "moderate",
+             "created_at": datetime.utcnow()}
+            for i in range(1, users + 1)
+        ])
+        conn.execute(insert(DailyPlan), [
+            {"user_id": i, "plan_json": PLAN_JSON, "created_at": datetime.utcnow()}
+            for i in range(1, users + 1) for _ in range(plans_per_user)
+        ])
+
+
+def run(tuned, readers, writers, seconds, users, plans_per_user):
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    engine = make_engine(path, tuned, pool_size=readers + writers)
+    seed(engine, users, plans_per_user)
+
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+    stop = time.perf_counter() + seconds
+
+    def count(key):
+        with lock:
+            counts[key] += 1
+
+    def reader():
+        query = (select(DailyPlan.id, DailyPlan.plan_json)
+                 .order_by(DailyPlan.created_at.desc(), DailyPlan.id.desc())
+                 .limit(5))
+        while time.perf_counter() < stop:
+            try:
+                with engine.connect() as conn:
+                    conn.execute(query.where(DailyPlan.user_id == random.randint(1, users))).all()
+                count("reads")
+            except exc.OperationalError:
+                count("errors")
+
+    def writer():
+        while time.perf_counter() < stop:
+            try:
+                with engine.begin() as conn:
+                    conn.execute(insert(DailyPlan).values(user_id=random.randint(1, users),
+                                                          plan_json=PLAN_JSON, created_at=datetime.utcnow()))
+                count("writes")
+            except exc.OperationalError:
+                count("errors")
+
+    threads = ([threading.Thread(target=reader) for _ in range(readers)]
+               + [threading.Thread(target=writer) for _ in range(writers)])
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    engine.dispose()
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    return {key: value / seconds for key, value in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--plans-per-user", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{args.readers} readers, {args.writers} writers, {args.seconds:g}s per run\n")
+    print(f"{'setup':<10}{'reads/s':>12}{'writes/s':>12}{'errors/s':>12}")
+    for label, tuned in (("before", False), ("after", True)):
+        result = run(tuned, args.readers, args.writers, args.seconds, args.users, args.plans_per_user)
+        print(f"{label:<10}{result['reads']:>12.1f}{result['writes']:>12.1f}{result['errors']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
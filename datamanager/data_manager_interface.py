@@ -29,4 +29,50 @@ class DataManagerInterface(ABC):
     def update_user(self, user_id, updated_data):
         pass
 
+    @abstractmethod
+    def bulk_add_users(self, rows, batch_size=1000):
+        pass
+
+    @abstractmethod
+    def bulk_upsert_users(self, rows, batch_size=1000):
+        pass
+
+    @abstractmethod
+    def get_daily_plans_page(self, user_id, cursor=None, limit=10):
+        pass
+
+    @abstractmethod
+    def get_weekly_plans_page(self, user_id, cursor=None, limit=10):
+        pass
+
+    @abstractmethod
+    def get_latest_plan_keys(self, user_id):
+        pass
+
+    @abstractmethod
+    def save_daily_plan(self, user_id, plan_dict, indent=None):
+        pass
 
+    @abstractmethod
+    def save_weekly_plan(self, user_id, plan_dict):
+        pass
+
+    @abstractmethod
+    def save_daily_plans(self, plans, commit=True):
+        pass
+
+    @abstractmethod
+    def save_weekly_plans(self, plans, commit=True):
+        pass
+
+    @abstractmethod
+    def get_plan_item(self, plan_id, kind, position):
+        pass
+
+    @abstractmethod
+    def get_daily_items(self, user_id, kind, cursor=None, limit=10):
+        pass
+
+    @abstractmethod
+    def get_plan_macros(self, plan_ids):
+        pass
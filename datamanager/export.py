@@ -0,0 +1,111 @@
+import csv
+import io
+import json
+import sys
+from datetime import date, datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import case, func
+
+from .models import db, User, DailyPlan, WeeklyPlan
+
+EXPORT_KINDS = ("users", "daily_plans", "weekly_plans")
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+USER_COLUMNS = ("id", "user_name", "gender", "age", "height", "weight", "dietary_pref", "fitness_goal",
+                "activity_level", "created_at")
+DAILY_PLAN_COLUMNS = ("id", "user_id", "date", "created_at", "plan")
+WEEKLY_PLAN_COLUMNS = ("id", "user_id", "created_at", "plan")
+EXPORT_COLUMNS = {"users": USER_COLUMNS, "daily_plans": DAILY_PLAN_COLUMNS, "weekly_plans": WEEKLY_PLAN_COLUMNS}
+
+
+def plan_document(column):
+    """
+    The stored plan as one line of minified JSON, made by SQLite so Python never
+    parses it. save_weekly_plan stores a JSON string holding the document, which
+    is unwrapped first; rows that are not valid JSON come out as NULL.
+    """
+    document = case((func.json_type(column) == "text", func.json_extract(column, "$")), else_=column)
+    return case((func.json_valid(column), case((func.json_valid(document), func.json(document)))))
+
+
+def export_query(kind, user_ids=None, since=None, until=None):
+    """
+    Column query (rows are tuples, never ORM objects) for one export kind, filtered
+    by user ids and by created_at from `since` to the end of `until` (both dates).
+    """
+    model = User if kind == "users" else DailyPlan if kind == "daily_plans" else WeeklyPlan
+    if kind == "users":
+        query = db.session.query(*(getattr(User, column) for column in USER_COLUMNS))
+        user_column = User.id
+    else:
+        columns = [getattr(model, column) for column in EXPORT_COLUMNS[kind][:-1]]
+        query = db.session.query(*columns, plan_document(model.plan_json))
+        user_column = model.user_id
+    if user_ids:
+        query = query.filter(user_column.in_(user_ids))
+    if since:
+        query = query.filter(model.created_at >= datetime.combine(since, datetime.min.time()))
+    if until:
+        query = query.filter(model.created_at < datetime.combine(until + timedelta(days=1), datetime.min.time()))
+    # with a user filter the (user_id, created_at) index gives this order without a sort
+    if user_ids and kind != "users":
+        return query.order_by(model.user_id, model.created_at, model.id)
+    return query.order_by(model.id)
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, date) else value
+
+
+def _ndjson_line(columns, row):
+    if columns is USER_COLUMNS:
+        return json.dumps({column: _value(value) for column, value in zip(columns, row)}) + "\n"
+    # the plan is spliced in as the text SQLite produced
+    *fields, plan = row
+    head = json.dumps({column: _value(value) for column, value in zip(columns, fields)})
+    return f'{head[:-1]}, "plan": {plan or "null"}}}\n'
+
+
+def export_chunks(kind, fmt, user_ids=None, since=None, until=None, chunk_size=1000):
+    """Yields the export as text, one chunk per `chunk_size` rows fetched; memory stays flat however many rows."""
+    columns = EXPORT_COLUMNS[kind]
+    rows = db.session.execute(export_query(kind, user_ids, since, until).statement
+                              .execution_options(yield_per=chunk_size))
+    if fmt == "ndjson":
+        for partition in rows.partitions():
+            yield "".join(_ndjson_line(columns, row) for row in partition)
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for partition in rows.partitions():
+        writer.writerows([_value(value) for value in row] for row in partition)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()  # only the header: nothing matched
+
+
+@click.command("export")
+@click.argument("kind", type=click.Choice(EXPORT_KINDS))
+@click.option("--format", "fmt", type=click.Choice(list(EXPORT_FORMATS)), default="ndjson", show_default=True)
+@click.option("--user-id", "user_ids", type=int, multiple=True, help="Only these users (repeatable).")
+@click.option("--since", type=click.DateTime(["%Y-%m-%d"]), default=None, help="Created on or after this date.")
+@click.option("--until", type=click.DateTime(["%Y-%m-%d"]), default=None, help="Created on or before this date.")
+@click.option("--output", "-o", type=click.Path(dir_okay=False, writable=True), default="-",
+              show_default=True, help="File to write (- for stdout).")
+@click.option("--chunk-size", type=int, default=1000, show_default=True, help="Rows fetched per round trip.")
+@with_appcontext
+def export_command(kind, fmt, user_ids, since, until, output, chunk_size):
+    """Stream users or plan history out as NDJSON or CSV."""
+    out = sys.stdout if output == "-" else open(output, "w", newline="")
+    try:
+        for chunk in export_chunks(kind, fmt, list(user_ids), since and since.date(), until and until.date(),
+                                   chunk_size):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout:
+            out.close()
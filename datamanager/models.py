@@ -1,5 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+import json
+import uuid
 
 db = SQLAlchemy()
 
@@ -26,6 +28,7 @@ class User(db.Model):
                                   order_by="desc(DailyPlan.created_at)") # newest first
     weekly_plans = db.relationship("WeeklyPlan", back_populates="user", cascade="all, delete-orphan",
                                   order_by="desc(WeeklyPlan.created_at)") # newest first
+    generation_jobs = db.relationship('GenerationJob', backref='user', cascade="all, delete", lazy=True)
 
 
 class Workout(db.Model):
@@ -65,9 +68,22 @@ class DailyPlan(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     date = db.Column(db.Date, default=lambda: datetime.utcnow().date())
     plan_json = db.Column(db.Text, nullable=False)  # Save JSON as string
+    has_meals = db.Column(db.Boolean, default=False, server_default=db.false(), nullable=False)
+    has_workouts = db.Column(db.Boolean, default=False, server_default=db.false(), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
     user = db.relationship('User', back_populates='daily_plans')
+    items = db.relationship('PlanItem', backref='daily_plan', cascade="all, delete-orphan", lazy=True,
+                            order_by="[PlanItem.kind, PlanItem.position]")
+
+    # dashboard / daily_meals / daily_workouts all filter by user and sort newest first
+    __table_args__ = (
+        db.Index('ix_daily_plans_user_created', 'user_id', 'created_at'),
+        db.Index('ix_daily_plans_user_date', 'user_id', 'date'),
+        # daily_meals / daily_workouts only page through plans that contain that kind of item
+        db.Index('ix_daily_plans_user_meals', 'user_id', 'has_meals', 'created_at'),
+        db.Index('ix_daily_plans_user_workouts', 'user_id', 'has_workouts', 'created_at'),
+    )
 
     @property
     def plan(self):
@@ -88,6 +104,43 @@ class WeeklyPlan(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
     user = db.relationship("User", back_populates="weekly_plans")
+    items = db.relationship('PlanItem', backref='weekly_plan', cascade="all, delete-orphan", lazy=True,
+                            order_by="[PlanItem.day, PlanItem.kind, PlanItem.position]")
+
+    __table_args__ = (
+        db.Index('ix_weekly_plans_user_created', 'user_id', 'created_at'),
+    )
+
+
+class PlanItem(db.Model):
+
+    __tablename__ = 'plan_items'
+
+    id = db.Column(db.Integer, primary_key=True)
+    daily_plan_id = db.Column(db.Integer, db.ForeignKey('daily_plans.id'))
+    weekly_plan_id = db.Column(db.Integer, db.ForeignKey('weekly_plans.id'))
+    day = db.Column(db.String(10))  # weekday name, weekly plans only
+    kind = db.Column(db.String(10), nullable=False)  # meal / workout
+    position = db.Column(db.Integer, nullable=False)  # index within the day's meals or workouts
+    name = db.Column(db.String)
+    calories = db.Column(db.Float)
+    protein = db.Column(db.Float)
+    carbs = db.Column(db.Float)
+    fats = db.Column(db.Float)
+    image_url = db.Column(db.String)
+    data = db.Column(db.Text, nullable=False)  # the full item as JSON
+
+    __table_args__ = (
+        db.Index('ix_plan_items_daily', 'daily_plan_id', 'kind', 'position'),
+        db.Index('ix_plan_items_weekly', 'weekly_plan_id', 'day', 'kind', 'position'),
+    )
+
+    def to_dict(self):
+        """Returns the stored item with its current image_url"""
+        item = json.loads(self.data)
+        if self.image_url:
+            item["image_url"] = self.image_url
+        return item
 
 
 class Meal(db.Model):
@@ -132,3 +185,176 @@ class Log(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+
+
+class GenerationJob(db.Model):
+
+    __tablename__ = 'generation_jobs'
+
+    id = db.Column(db.String(32), primary_key=True, default=lambda: uuid.uuid4().hex)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    kind = db.Column(db.String(30), nullable=False)  # daily_plan / daily_meals / daily_workouts / weekly_plan
+    status = db.Column(db.String(10), default='queued', nullable=False)  # queued / running / done / failed
+    plan_id = db.Column(db.Integer)  # DailyPlan.id or WeeklyPlan.id once the job is done
+    error = db.Column(db.String)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_generation_jobs_status_created', 'status', 'created_at'),
+        db.Index('ix_generation_jobs_user_status', 'user_id', 'status'),
+    )
+
+    def to_dict(self):
+        """Returns the job state as a JSON-serializable dict"""
+        return {
+            "id": self.id,
+            "user_id": self.user_id,
+            "kind": self.kind,
+            "status": self.status,
+            "plan_id": self.plan_id,
+            "error": self.error,
+            "attempts": self.attempts,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class ImageCacheEntry(db.Model):
+
+    __tablename__ = 'image_cache'
+
+    key = db.Column(db.String, primary_key=True)  # kind + prompt attributes + normalized item name
+    kind = db.Column(db.String(10), nullable=False)  # meal / workout
+    url = db.Column(db.String, nullable=False)
+    hits = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_image_cache_last_used', 'last_used_at'),
+    )
+
+
+class ImageCacheStat(db.Model):
+
+    __tablename__ = 'image_cache_stats'
+
+    kind = db.Column(db.String(10), primary_key=True)
+    hits = db.Column(db.Integer, default=0, nullable=False)
+    misses = db.Column(db.Integer, default=0, nullable=False)
+    evictions = db.Column(db.Integer, default=0, nullable=False)
+
+
+class LLMCacheEntry(db.Model):
+
+    __tablename__ = 'llm_cache_entries'
+
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String, nullable=False)  # generator kind + profile fingerprint
+    kind = db.Column(db.String(30), nullable=False)
+    response_json = db.Column(db.Text, nullable=False)  # the parsed Pydantic response as JSON
+    served_count = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_llm_cache_key_expires', 'key', 'expires_at'),
+    )
+
+
+class PooledPlan(db.Model):
+
+    __tablename__ = 'plan_pool'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(30), nullable=False)  # daily_plan / weekly_plan
+    bucket = db.Column(db.String, nullable=False)  # goal|activity|diet|gender|age band
+    plan_json = db.Column(db.Text, nullable=False)  # generated plan with image_urls attached
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    claimed_at = db.Column(db.DateTime)  # set once a user got this plan; never handed out twice
+    claimed_by = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'))
+
+    __table_args__ = (
+        db.Index('ix_plan_pool_kind_bucket_claimed', 'kind', 'bucket', 'claimed_at'),
+    )
+
+
+class AICall(db.Model):
+
+    __tablename__ = 'ai_calls'
+
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    operation = db.Column(db.String(30), nullable=False)  # daily_meals / weekly_plan_day / meal_image / ...
+    model = db.Column(db.String(50))
+    route = db.Column(db.String(50))  # endpoint or job kind that made the call
+    user_id = db.Column(db.Integer)  # no FK: usage history outlives deleted users
+    prompt_tokens = db.Column(db.Integer, default=0, nullable=False)
+    completion_tokens = db.Column(db.Integer, default=0, nullable=False)
+    cached_tokens = db.Column(db.Integer, default=0, nullable=False)
+    duration_ms = db.Column(db.Integer, nullable=False)  # wall time including SDK retries
+    retries = db.Column(db.Integer)
+    status = db.Column(db.String(10), nullable=False)  # ok / error
+    error = db.Column(db.String)
+    cost_usd = db.Column(db.Float, default=0, nullable=False)  # estimate from AI_PRICES at call time
+
+    __table_args__ = (
+        db.Index('ix_ai_calls_created', 'created_at'),
+        db.Index('ix_ai_calls_user_created', 'user_id', 'created_at'),
+    )
+
+
+class MealDBMeal(db.Model):
+
+    __tablename__ = 'mealdb_meals'
+
+    id = db.Column(db.Integer, primary_key=True)  # TheMealDB idMeal
+    name = db.Column(db.String, nullable=False)
+    category = db.Column(db.String)
+    area = db.Column(db.String)
+    thumb_url = db.Column(db.String, nullable=False)
+    trigram_count = db.Column(db.Integer, nullable=False)  # size of the name's trigram set, for the similarity
+
+
+class MealDBTrigram(db.Model):
+    """Trigram index over the mirrored meal names: one row per (trigram, meal)."""
+
+    __tablename__ = 'mealdb_trigrams'
+
+    trigram = db.Column(db.String(3), primary_key=True)
+    meal_id = db.Column(db.Integer, db.ForeignKey('mealdb_meals.id', ondelete='CASCADE'), primary_key=True)
+
+
+class Lease(db.Model):
+    """Cross-process lock for one unit of work (see ai/single_flight.py); a row exists while someone holds it."""
+
+    __tablename__ = 'leases'
+
+    key = db.Column(db.String, primary_key=True)  # e.g. image:meal:oatmeal, llm:daily_meals|age=30-34|..., job:daily_plan:7
+    owner = db.Column(db.String, nullable=False)  # host:pid:token of the holder
+    expires_at = db.Column(db.DateTime, nullable=False)  # after this anyone may take it over (holder crashed)
+
+
+class BatchRun(db.Model):
+    """Checkpoint of one `flask batch-plans` run (see ai/batch_plans.py); re-running the command resumes it."""
+
+    __tablename__ = 'batch_runs'
+
+    id = db.Column(db.String, primary_key=True)  # run name, e.g. daily_plan-2026-01-31
+    kind = db.Column(db.String(30), nullable=False)  # daily_plan / weekly_plan
+    backend = db.Column(db.String(10), nullable=False)  # openai / local
+    status = db.Column(db.String(20), nullable=False)  # new / written / submitted / downloaded / imported / failed
+    request_path = db.Column(db.String, nullable=False)
+    output_path = db.Column(db.String)
+    batch_id = db.Column(db.String)
+    request_count = db.Column(db.Integer, default=0, nullable=False)
+    next_line = db.Column(db.Integer, default=0, nullable=False)  # output lines imported so far
+    plans_saved = db.Column(db.Integer, default=0, nullable=False)
+    failures = db.Column(db.Integer, default=0, nullable=False)
+    error = db.Column(db.String)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
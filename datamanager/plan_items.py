@@ -0,0 +1,92 @@
+import json
+
+from sqlalchemy import select, insert, exists
+
+from .models import DailyPlan, WeeklyPlan, PlanItem
+
+
+def iter_plan_items(plan_dict):
+    """
+    Yields (day, kind, position, item) for every meal and workout dict of a plan.
+    Works for daily plans ({"meals": [...], "workouts": [...]}, day is None) and
+    weekly plans ({"Monday": {"meals": [...], ...}, ...}) alike, in display order.
+    """
+    if "meals" in plan_dict or "workouts" in plan_dict:
+        days = [(None, plan_dict)]
+    else:
+        days = [(day, details) for day, details in plan_dict.items() if isinstance(details, dict)]
+
+    for day, details in days:
+        for kind, key in (("meal", "meals"), ("workout", "workouts")):
+            for position, item in enumerate(details.get(key) or []):
+                if isinstance(item, dict):
+                    yield day, kind, position, item
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def plan_item_rows(plan_dict, daily_plan_id=None, weekly_plan_id=None):
+    """Column dicts for the plan_items rows of one plan document."""
+    return [
+        {
+            "daily_plan_id": daily_plan_id,
+            "weekly_plan_id": weekly_plan_id,
+            "day": day,
+            "kind": kind,
+            "position": position,
+            "name": item.get("name"),
+            "calories": _number(item.get("calories")),
+            "protein": _number(item.get("protein")),
+            "carbs": _number(item.get("carbs")),
+            "fats": _number(item.get("fats", item.get("fat"))),
+            "image_url": item.get("image_url"),
+            "data": json.dumps(item),
+        }
+        for day, kind, position, item in iter_plan_items(plan_dict)
+    ]
+
+
+def _load_plan_json(raw):
+    # daily plans store a JSON string, weekly plans a JSON column that may itself hold a string
+    while isinstance(raw, str):
+        raw = json.loads(raw)
+    return raw if isinstance(raw, dict) else {}
+
+
+def backfill_plan_items(connection, chunk_size=500):
+    """
+    Writes plan_items rows for every plan that has none yet, reading the
+    plan_json blobs in id order, chunk_size plans per transaction-sized batch.
+    Safe to run repeatedly. Returns the number of items written.
+    """
+    written = 0
+    for model, fk in ((DailyPlan, "daily_plan_id"), (WeeklyPlan, "weekly_plan_id")):
+        fk_column = getattr(PlanItem, fk)
+        last_id = 0
+        while True:
+            plans = connection.execute(
+                select(model.id, model.plan_json)
+                .where(model.id > last_id)
+                .where(~exists().where(fk_column == model.id))
+                .order_by(model.id)
+                .limit(chunk_size)
+            ).all()
+            if not plans:
+                break
+
+            rows = []
+            for plan_id, raw in plans:
+                try:
+                    rows.extend(plan_item_rows(_load_plan_json(raw), **{fk: plan_id}))
+                except ValueError as e:
+                    print(f"[Plan items backfill] skipping {model.__tablename__} {plan_id}: {e}")
+            if rows:
+                connection.execute(insert(PlanItem), rows)
+            written += len(rows)
+            last_id = plans[-1][0]
+    return written
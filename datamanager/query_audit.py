@@ -0,0 +1,91 @@
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import func
+from sqlalchemy.dialects import sqlite
+
+from .export import export_query
+from .models import db, DailyPlan, WeeklyPlan, GenerationJob, ImageCacheEntry, PlanItem, LLMCacheEntry, PooledPlan, AICall
+
+SAMPLE_USER_ID = 1
+SAMPLE_CURSOR = f"{datetime(2025, 1, 1).isoformat()}_1"
+
+
+def app_queries(data_manager):
+    """
+    The queries the app issues on its hot paths, built the same way the routes
+    build them (sample parameter values do not change the query plan).
+    """
+    return [
+        ("dashboard daily page", data_manager.plans_page_keys_query(DailyPlan, SAMPLE_USER_ID)),
+        ("dashboard daily next page", data_manager.plans_page_keys_query(DailyPlan, SAMPLE_USER_ID, SAMPLE_CURSOR)),
+        ("dashboard weekly page", data_manager.plans_page_keys_query(WeeklyPlan, SAMPLE_USER_ID)),
+        ("dashboard weekly next page", data_manager.plans_page_keys_query(WeeklyPlan, SAMPLE_USER_ID, SAMPLE_CURSOR)),
+        ("daily_meals page", data_manager.daily_items_keys_query(SAMPLE_USER_ID, "meal")),
+        ("daily_workouts next page", data_manager.daily_items_keys_query(SAMPLE_USER_ID, "workout", SAMPLE_CURSOR)),
+        ("daily_meals items", db.session.query(PlanItem).filter(PlanItem.daily_plan_id.in_([1, 2]),
+                                                                 PlanItem.kind == "meal")),
+        ("item details", db.session.query(PlanItem).filter_by(daily_plan_id=1, kind="meal", position=0)),
+        ("dashboard macros", db.session.query(PlanItem.daily_plan_id, func.sum(PlanItem.calories))
+                                       .filter(PlanItem.daily_plan_id.in_([1, 2]), PlanItem.kind == "meal")
+                                       .group_by(PlanItem.daily_plan_id)),
+        ("plans of today", DailyPlan.query.filter_by(user_id=SAMPLE_USER_ID, date=datetime(2025, 1, 1).date())),
+        ("active jobs", GenerationJob.query.filter(GenerationJob.user_id == SAMPLE_USER_ID,
+                                                   GenerationJob.status.in_(("queued", "running")))),
+        ("queued jobs", db.session.query(GenerationJob.id).filter_by(status="queued")
+                                  .order_by(GenerationJob.created_at)),
+        ("image cache eviction", db.session.query(ImageCacheEntry.key).order_by(ImageCacheEntry.last_used_at)
+                                           .limit(10)),
+        ("llm cache lookup", LLMCacheEntry.query.filter(LLMCacheEntry.key == "daily_meals|age=30-34",
+                                                        LLMCacheEntry.expires_at > datetime(2025, 1, 1))
+                                                .order_by(LLMCacheEntry.served_count, LLMCacheEntry.id)),
+        ("plan pool take", db.session.query(PooledPlan.id).filter(PooledPlan.kind == "daily_plan",
+                                                                   PooledPlan.bucket == "lose|light|vegan|male|30-44",
+                                                                   PooledPlan.claimed_at.is_(None))
+                                              .order_by(PooledPlan.id).limit(1)),
+        ("ai usage window", db.session.query(AICall.operation, AICall.duration_ms)
+                                      .filter(AICall.created_at >= datetime(2025, 1, 1))),
+        ("export plans of users", export_query("weekly_plans", user_ids=[1, 2],
+                                                 since=datetime(2025, 1, 1).date())),
+    ]
+
+
+def explain(query):
+    """Runs EXPLAIN QUERY PLAN for an ORM query and returns the plan's detail lines."""
+    compiled = query.statement.compile(dialect=sqlite.dialect(), compile_kwargs={"render_postcompile": True})
+    params = [compiled.params[name] for name in compiled.positiontup]
+    rows = db.session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", tuple(params))
+    return [row[-1] for row in rows]
+
+
+def full_scans(plan):
+    """Plan lines that read a whole table ("SCAN daily_plans") instead of searching an index."""
+    return [line for line in plan if line.startswith("SCAN") and "USING" not in line]
+
+
+def audit_queries(data_manager):
+    """Returns [(name, plan lines, full scan lines)] for every audited query."""
+    results = []
+    for name, query in app_queries(data_manager):
+        plan = explain(query)
+        results.append((name, plan, full_scans(plan)))
+    return results
+
+
+@click.command("audit-queries")
+@with_appcontext
+def audit_queries_command():
+    """EXPLAIN QUERY PLAN the app's queries; exit 1 if any does a full table scan."""
+    data_manager = current_app.extensions["data_manager"]
+    failed = 0
+    for name, plan, scans in audit_queries(data_manager):
+        click.echo(f"{'FAIL' if scans else 'ok  '}  {name}")
+        for line in plan:
+            click.echo(f"        {line}")
+        failed += bool(scans)
+
+    if failed:
+        raise click.ClickException(f"{failed} quer{'y' if failed == 1 else 'ies'} fall back to a full table scan")
+    click.echo("All audited queries use an index.")
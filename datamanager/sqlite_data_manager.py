@@ -1,9 +1,16 @@
 from abc import ABC
+from datetime import datetime
+import json
 
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import tuple_, func, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from .data_manager_interface import DataManagerInterface
-from .models import db, User, Workout, WorkoutPlan, Meal, Log
+from .models import db, User, Workout, WorkoutPlan, Meal, Log, DailyPlan, WeeklyPlan, PlanItem
+from .plan_items import plan_item_rows
+from .sqlite_setup import configure_engine
+from validation import USER_FIELDS, clean_user_row
 
 class SQLiteDataManager(DataManagerInterface, ABC):
     """
@@ -13,6 +20,11 @@ class SQLiteDataManager(DataManagerInterface, ABC):
     def __init__(self, db_file_name, app):
         self.app = app
         self.db_file_name = db_file_name
+        app.extensions["data_manager"] = self
+
+        # WAL + tuned pragmas on every pooled connection (overrides via app.config["SQLITE_PRAGMAS"])
+        with app.app_context():
+            self.pragmas = configure_engine(db.engine, app.config.get("SQLITE_PRAGMAS"))
 
     # def __int__(self, db_file_name, app: Flask):
     #     self.app = app
@@ -68,4 +80,227 @@ class SQLiteDataManager(DataManagerInterface, ABC):
         for key, value in updated_data.items():
             setattr(user, key, value)
         db.session.commit()
-        return user
\ No newline at end of file
+        return user
+
+    def bulk_add_users(self, rows, batch_size=1000):
+        """
+        Add many users from an iterable of field dicts (e.g. a streamed CSV), batch_size per transaction.
+        Invalid rows and names that already exist are skipped and reported:
+        {"inserted": n, "updated": 0, "errors": [{"row": 1-based number, "user_name": ..., "error": ...}]}
+        """
+        return self._bulk_users(rows, batch_size, upsert=False)
+
+    def bulk_upsert_users(self, rows, batch_size=1000):
+        """Like bulk_add_users, but a row whose user_name exists updates that user instead."""
+        return self._bulk_users(rows, batch_size, upsert=True)
+
+    def _bulk_users(self, rows, batch_size, upsert):
+        report = {"inserted": 0, "updated": 0, "errors": []}
+        batch = []
+        for number, row in enumerate(rows, 1):
+            values, error = clean_user_row(row)
+            if error:
+                name = row.get("user_name") if isinstance(row, dict) else None
+                report["errors"].append({"row": number, "user_name": name, "error": error})
+                continue
+            batch.append((number, values))
+            if len(batch) >= batch_size:
+                self._write_users(batch, upsert, report)
+                batch = []
+        if batch:
+            self._write_users(batch, upsert, report)
+        report["errors"].sort(key=lambda error: error["row"])  # a batch's conflicts come after its invalid rows
+        return report
+
+    def _write_users(self, batch, upsert, report):
+        # one executemany per batch; ON CONFLICT(user_name) replaces the per-user existence query
+        stmt = sqlite_insert(User)
+        values = [row for _, row in batch]
+        if upsert:
+            existing = set(db.session.execute(
+                select(User.user_name).where(User.user_name.in_([row["user_name"] for row in values]))).scalars())
+            db.session.execute(stmt.on_conflict_do_update(
+                index_elements=[User.user_name],
+                set_={field: stmt.excluded[field] for field in USER_FIELDS if field != "user_name"},
+            ), values)
+            for row in values:
+                report["updated" if row["user_name"] in existing else "inserted"] += 1
+                existing.add(row["user_name"])  # a repeat later in the file updates the same user
+        else:
+            inserted = set(db.session.execute(
+                stmt.on_conflict_do_nothing(index_elements=[User.user_name]).returning(User.user_name),
+                values).scalars())
+            for number, row in batch:
+                if row["user_name"] in inserted:
+                    inserted.discard(row["user_name"])
+                    report["inserted"] += 1
+                else:
+                    report["errors"].append({"row": number, "user_name": row["user_name"],
+                                             "error": f"User '{row['user_name']}' already exists."})
+        db.session.commit()
+
+    def get_daily_plans_page(self, user_id, cursor=None, limit=10):
+        """Retrieve one newest-first page of a user's daily plans and the cursor of the next page."""
+        return self._plans_page(DailyPlan, user_id, cursor, limit)
+
+    def get_weekly_plans_page(self, user_id, cursor=None, limit=10):
+        """Retrieve one newest-first page of a user's weekly plans and the cursor of the next page."""
+        return self._plans_page(WeeklyPlan, user_id, cursor, limit)
+
+    @staticmethod
+    def encode_cursor(plan):
+        """Keyset cursor pointing just after `plan`: "<created_at ISO>_<id>"."""
+        return f"{plan.created_at.isoformat()}_{plan.id}"
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """Inverse of encode_cursor; raises ValueError for malformed cursors."""
+        created_at, plan_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(created_at), int(plan_id)
+
+    def _plans_page(self, model, user_id, cursor, limit):
+        """
+        Keyset pagination over (created_at, id), newest first.
+        The first query only reads the keys, the second one loads plan_json
+        for the rows of the visible page, so no other plan document is read.
+        """
+        keys = self.plans_page_keys_query(model, user_id, cursor, limit).all()
+
+        page_ids = [plan_id for plan_id, _ in keys[:limit]]
+        plans = (model.query
+                 .filter(model.id.in_(page_ids))
+                 .order_by(model.created_at.desc(), model.id.desc())
+                 .all()) if page_ids else []
+
+        next_cursor = self.encode_cursor(plans[-1]) if len(keys) > limit else None
+        return plans, next_cursor
+
+    def plans_page_keys_query(self, model, user_id, cursor=None, limit=10, criteria=()):
+        """The (id, created_at) query behind _plans_page, one row more than the page to detect a next page."""
+        keys = (db.session.query(model.id, model.created_at)
+                .filter(model.user_id == user_id, *criteria))
+        if cursor:
+            keys = keys.filter(tuple_(model.created_at, model.id) < tuple_(*self.decode_cursor(cursor)))
+        return keys.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1)
+
+    def get_latest_plan_keys(self, user_id):
+        """(id, created_at) of the user's newest daily and weekly plan (None if none), from the page indexes."""
+        return tuple(self.plans_page_keys_query(model, user_id, limit=0).first()
+                     for model in (DailyPlan, WeeklyPlan))
+
+    def save_daily_plan(self, user_id, plan_dict, indent=None):
+        """Store a daily plan document together with its normalized meal/workout rows."""
+        daily_plan = DailyPlan(user_id=user_id, plan_json=json.dumps(plan_dict, indent=indent),
+                               has_meals=bool(plan_dict.get("meals")),
+                               has_workouts=bool(plan_dict.get("workouts")))
+        db.session.add(daily_plan)
+        db.session.flush()  # assigns daily_plan.id
+        rows = plan_item_rows(plan_dict, daily_plan_id=daily_plan.id)
+        if rows:
+            db.session.execute(insert(PlanItem), rows)
+        db.session.commit()
+        return daily_plan
+
+    def save_weekly_plan(self, user_id, plan_dict):
+        """Store a weekly plan document together with its normalized meal/workout rows."""
+        weekly_plan = WeeklyPlan(user_id=user_id, plan_json=json.dumps(plan_dict))
+        db.session.add(weekly_plan)
+        db.session.flush()
+        rows = plan_item_rows(plan_dict, weekly_plan_id=weekly_plan.id)
+        if rows:
+            db.session.execute(insert(PlanItem), rows)
+        db.session.commit()
+        return weekly_plan
+
+    def save_daily_plans(self, plans, commit=True):
+        """Bulk save_daily_plan for [(user_id, plan_dict), ...]; returns the new ids in order."""
+        rows = [{"user_id": user_id, "plan_json": json.dumps(plan_dict),
+                 "has_meals": bool(plan_dict.get("meals")), "has_workouts": bool(plan_dict.get("workouts"))}
+                for user_id, plan_dict in plans]
+        return self._save_plans(DailyPlan, "daily_plan_id", rows, [plan_dict for _, plan_dict in plans], commit)
+
+    def save_weekly_plans(self, plans, commit=True):
+        """Bulk save_weekly_plan for [(user_id, plan_dict), ...]; returns the new ids in order."""
+        rows = [{"user_id": user_id, "plan_json": json.dumps(plan_dict)} for user_id, plan_dict in plans]
+        return self._save_plans(WeeklyPlan, "weekly_plan_id", rows, [plan_dict for _, plan_dict in plans], commit)
+
+    def _save_plans(self, model, fk, rows, plan_dicts, commit):
+        # one multi-row INSERT ... RETURNING for the plans, one executemany for all their items
+        if not rows:
+            return []
+        plan_ids = db.session.execute(
+            insert(model).returning(model.id, sort_by_parameter_order=True), rows).scalars().all()
+        item_rows = [row for plan_id, plan_dict in zip(plan_ids, plan_dicts)
+                     for row in plan_item_rows(plan_dict, **{fk: plan_id})]
+        if item_rows:
+            db.session.execute(insert(PlanItem), item_rows)
+        if commit:
+            db.session.commit()
+        return plan_ids
+
+    def get_plan_item(self, plan_id, kind, position):
+        """
+        Retrieve one meal or workout of a daily plan as (item dict, owner user id),
+        or None when the plan does not exist or has no item at that position.
+        """
+        row = (db.session.query(PlanItem, DailyPlan.user_id)
+               .join(DailyPlan, DailyPlan.id == PlanItem.daily_plan_id)
+               .filter(PlanItem.daily_plan_id == plan_id,
+                       PlanItem.kind == kind,
+                       PlanItem.position == position)
+               .first())
+        if row is not None:
+            item, user_id = row
+            return item.to_dict(), user_id
+
+        # Plans saved before plan_items existed: let SQLite's JSON1 pull out just this one item.
+        key = "meals" if kind == "meal" else "workouts"
+        row = (db.session.query(DailyPlan.user_id,
+                                func.json_extract(DailyPlan.plan_json, f"$.{key}[{int(position)}]"))
+               .filter(DailyPlan.id == plan_id, func.json_valid(DailyPlan.plan_json))
+               .first())
+        if row is None or row[1] is None:
+            return None
+        user_id, item_json = row
+        item = json.loads(item_json)
+        return (item, user_id) if isinstance(item, dict) else None
+
+    def get_daily_items(self, user_id, kind, cursor=None, limit=10):
+        """
+        Retrieve one newest-first page of the user's daily plans that contain meals
+        (kind="meal") or workouts (kind="workout"), as
+        ([{"id": plan_id, "meals"/"workouts": [...]}, ...], next page cursor).
+        Only the item rows of that kind for the visible plans are read.
+        """
+        keys = self.daily_items_keys_query(user_id, kind, cursor, limit).all()
+        page_ids = [plan_id for plan_id, _ in keys[:limit]]
+        next_cursor = self.encode_cursor(keys[limit - 1]) if len(keys) > limit else None
+
+        key = "meals" if kind == "meal" else "workouts"
+        plans = {plan_id: {"id": plan_id, key: []} for plan_id in page_ids}  # keeps newest-first order
+        if page_ids:
+            rows = (PlanItem.query
+                    .filter(PlanItem.daily_plan_id.in_(page_ids), PlanItem.kind == kind)
+                    .order_by(PlanItem.daily_plan_id, PlanItem.position)
+                    .all())
+            for item in rows:
+                plans[item.daily_plan_id][key].append(item.to_dict())
+        return list(plans.values()), next_cursor
+
+    def daily_items_keys_query(self, user_id, kind, cursor=None, limit=10):
+        """Page keys of the daily plans holding items of `kind`, served by the has_meals/has_workouts indexes."""
+        flag = DailyPlan.has_meals if kind == "meal" else DailyPlan.has_workouts
+        return self.plans_page_keys_query(DailyPlan, user_id, cursor, limit, criteria=(flag.is_(True),))
+
+    def get_plan_macros(self, plan_ids):
+        """Sum calories and macros of the meals of each daily plan: {plan_id: {"calories": ..., ...}}."""
+        if not plan_ids:
+            return {}
+        rows = (db.session.query(PlanItem.daily_plan_id,
+                                 func.sum(PlanItem.calories), func.sum(PlanItem.protein),
+                                 func.sum(PlanItem.carbs), func.sum(PlanItem.fats))
+                .filter(PlanItem.daily_plan_id.in_(plan_ids), PlanItem.kind == "meal")
+                .group_by(PlanItem.daily_plan_id)
+                .all())
+        return {plan_id: {"calories": calories or 0, "protein": protein or 0, "carbs": carbs or 0, "fats": fats or 0}
+                for plan_id, calories, protein, carbs, fats in rows}
@@ -0,0 +1,48 @@
+from sqlalchemy import event
+
+# Applied to every new SQLite connection. WAL lets dashboard reads run while a
+# plan is being written, NORMAL sync is safe in WAL mode and avoids an fsync per
+# commit, and the busy timeout makes writers wait for each other instead of
+# failing with "database is locked".
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,  # ms
+    "mmap_size": 256 * 1024 * 1024,  # bytes
+    "cache_size": -64000,  # negative = KiB, so 64 MB per connection
+    "temp_store": "MEMORY",
+}
+
+
+def engine_options(pool_size=10, max_overflow=20, pool_timeout=30, pool_recycle=3600):
+    """SQLALCHEMY_ENGINE_OPTIONS for a file-based SQLite database shared by several worker threads."""
+    return {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": pool_timeout,
+        "pool_recycle": pool_recycle,
+        "pool_pre_ping": False,  # a local file never goes away underneath us
+        # connections are handed between the request thread and job/image workers by the pool
+        "connect_args": {"check_same_thread": False},
+    }
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    """Run PRAGMA statements on a raw sqlite3 connection."""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def configure_engine(engine, pragmas=None):
+    """Apply `pragmas` (DEFAULT_PRAGMAS merged with overrides) to every connection the engine opens."""
+    settings = {**DEFAULT_PRAGMAS, **(pragmas or {})}
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        apply_pragmas(dbapi_connection, settings)
+
+    return settings
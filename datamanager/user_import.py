@@ -0,0 +1,52 @@
+import csv
+import json
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+
+def read_user_rows(path):
+    """
+    Streams the user records of a .csv (header row with the users column names)
+    or .jsonl file (one JSON object per line), one dict at a time.
+    """
+    with open(path, newline="") as f:
+        if path.endswith(".csv"):
+            yield from csv.DictReader(f)
+            return
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                yield None  # reported as an invalid row
+
+
+@click.command("import-users")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--upsert", is_flag=True, help="Update users whose user_name already exists instead of skipping them.")
+@click.option("--batch-size", type=int, default=1000, show_default=True, help="Rows per transaction.")
+@click.option("--errors", "errors_path", type=click.Path(dir_okay=False), default=None,
+              help="Write the rejected rows here as JSONL (default: print them).")
+@with_appcontext
+def import_users_command(path, upsert, batch_size, errors_path):
+    """Bulk-import users from a CSV or JSONL file (a gym's roster, say)."""
+    data_manager = current_app.extensions["data_manager"]
+    started = time.perf_counter()
+    bulk = data_manager.bulk_upsert_users if upsert else data_manager.bulk_add_users
+    report = bulk(read_user_rows(path), batch_size=batch_size)
+    elapsed = time.perf_counter() - started
+
+    if errors_path:
+        with open(errors_path, "w") as f:
+            for error in report["errors"]:
+                f.write(json.dumps(error) + "\n")
+    else:
+        for error in report["errors"]:
+            click.echo(f"row {error['row']} ({error['user_name']}): {error['error']}")
+    rows = report["inserted"] + report["updated"] + len(report["errors"])
+    click.echo(f"{report['inserted']} inserted, {report['updated']} updated, {len(report['errors'])} rejected "
+               f"in {elapsed:.2f}s ({rows / elapsed if elapsed else 0:,.0f} rows/s)")
@@ -0,0 +1,101 @@
+import functools
+import glob
+import hashlib
+import os
+
+from flask import current_app, make_response, request, session
+from werkzeug.http import is_resource_modified
+
+# Generated images never change once written (one file per item name), so a URL
+# carrying their content hash can be cached by browsers for good.
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+HASHED_STATIC_DIRS = ("meal_images/", "workout_images/", "default_")
+
+def content_hash(path):
+    """First 12 hex digits of the file's SHA-256 (memoized per path and mtime); None if the file does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return _file_hash(path, stat.st_mtime_ns, stat.st_size)
+
+
+@functools.lru_cache(maxsize=4096)
+def _file_hash(path, mtime_ns, size):
+    # mtime and size are part of the key, so a rewritten file gets a new hash
+    try:
+        with open(path, "rb") as f:
+            return hashlib.file_digest(f, "sha256").hexdigest()[:12]
+    except OSError:
+        return None
+
+
+def images_version():
+    """
+    Changes whenever an image or derivative is added under the hashed static
+    directories (a new file bumps its directory's mtime), which changes the
+    srcsets the image filters render.
+    """
+    stats = []
+    for directory in ("", *(name for name in HASHED_STATIC_DIRS if name.endswith("/"))):
+        try:
+            stats.append(os.stat(os.path.join(current_app.static_folder, directory)).st_mtime_ns)
+        except OSError:
+            stats.append(None)
+    return tuple(stats)
+
+
+def hashed_static_url(url):
+    """'/static/meal_images/x.png' → '/static/meal_images/x.png?v=<content hash>'; other URLs unchanged."""
+    if not url or not url.startswith("/static/") or "?" in url:
+        return url
+    relative = url[len("/static/"):]
+    if not relative.startswith(HASHED_STATIC_DIRS):
+        return url
+    digest = content_hash(os.path.join(current_app.static_folder, relative))
+    return f"{url}?v={digest}" if digest else url
+
+
+def cache_static_images(response):
+    """after_request hook: content-hashed static files are immutable, everything else keeps Flask's defaults."""
+    if request.path.startswith("/static/") and request.args.get("v") and response.status_code == 200:
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+        response.cache_control.no_cache = None
+    return response
+
+
+def templates_version(app):
+    """Changes whenever a template file changes, and is the same in every worker process."""
+    stats = sorted((path, os.path.getmtime(path), os.path.getsize(path))
+                   for path in glob.glob(os.path.join(app.root_path, app.template_folder, "**", "*"), recursive=True)
+                   if os.path.isfile(path))
+    return hashlib.sha256(repr(stats).encode()).hexdigest()[:12]
+
+
+def conditional_page(etag_parts, last_modified, render):
+    """
+    Answers a conditional GET with 304 when the page identified by `etag_parts`
+    (plus the template and images versions) is what the client already has; otherwise
+    calls `render()` and returns its response tagged with ETag/Last-Modified.
+    Pages with pending flash messages are always rendered.
+    """
+    version = current_app.extensions.get("templates_version")
+    if version is None:
+        version = current_app.extensions["templates_version"] = templates_version(current_app)
+    etag = hashlib.sha256(repr((version, images_version(), *etag_parts)).encode()).hexdigest()[:20]
+    fresh = "_flashes" not in session
+
+    if fresh and not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(render())
+    if fresh:
+        response.set_etag(etag)
+        if last_modified is not None:
+            response.last_modified = last_modified
+    # browsers keep the page but check back every time
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
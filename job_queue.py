@@ -0,0 +1,167 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_
+
+from ai.ai_usage import ai_call_scope
+from ai.single_flight import single_flight
+from datamanager.models import db, GenerationJob
+
+
+class JobQueue:
+    """
+    Runs plan generation in the background with a bounded thread pool.
+    Job state lives in the generation_jobs table, so a restarted process
+    picks up whatever was still queued (or stuck running) before it died.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.executor = None
+        self.handlers = {}
+        self._recovered = False
+        self._recover_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.stale_after = timedelta(seconds=app.config.get("JOB_STALE_SECONDS", 15 * 60))
+        self.executor = ThreadPoolExecutor(
+            max_workers=app.config.get("JOB_WORKERS", 4),
+            thread_name_prefix="plan-job",
+        )
+        app.extensions["job_queue"] = self
+        if app.config.get("JOB_RECOVER_ON_START", True):
+            # on the first request, so only a serving process resumes jobs, never a `flask` CLI command
+            app.before_request(self._recover_once)
+
+    def register(self, kind):
+        """Decorator registering the function that runs jobs of this kind.
+        The handler receives the user id and returns the id of the saved plan."""
+        def decorator(func):
+            self.handlers[kind] = func
+            return func
+        return decorator
+
+    def enqueue(self, kind, user_id):
+        """
+        Persist a new job and hand it to the worker pool. While the user already
+        has a job of this kind queued or running (a double click, a second tab),
+        that job is returned instead of starting another generation. A job whose
+        worker died (running for over JOB_STALE_SECONDS) is re-queued instead.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        def enqueue_once():
+            # the lease makes check-then-insert atomic across threads and worker processes
+            active = (db.session.query(GenerationJob.id)
+                      .filter(GenerationJob.user_id == user_id, GenerationJob.kind == kind, self._live())
+                      .first())
+            if active is not None:
+                return active.id
+            # a job still "running" past JOB_STALE_SECONDS lost its worker: run it again instead of waiting on it
+            stale = (db.session.query(GenerationJob.id)
+                     .filter_by(user_id=user_id, kind=kind, status="running")
+                     .first())
+            if stale is not None:
+                (GenerationJob.query
+                 .filter_by(id=stale.id, status="running")
+                 .update({"status": "queued"}, synchronize_session=False))
+                db.session.commit()
+                self.executor.submit(self._run, stale.id)
+                return stale.id
+            job = GenerationJob(user_id=user_id, kind=kind)
+            db.session.add(job)
+            db.session.commit()
+            self.executor.submit(self._run, job.id)
+            return job.id
+
+        job_id = single_flight.do(f"job:{kind}:{user_id}", enqueue_once, timeout=30)
+        return self.get(job_id)
+
+    def get(self, job_id):
+        """Retrieve a job by its ID."""
+        return db.session.get(GenerationJob, job_id)
+
+    def active_jobs(self, user_id):
+        """Jobs of a user that are still waiting or running, oldest first."""
+        return (GenerationJob.query
+                .filter(GenerationJob.user_id == user_id, self._live())
+                .order_by(GenerationJob.created_at)
+                .all())
+
+    def _live(self):
+        """Filter for jobs that are queued, or running and started within JOB_STALE_SECONDS."""
+        cutoff = datetime.utcnow() - self.stale_after
+        return or_(GenerationJob.status == "queued",
+                   and_(GenerationJob.status == "running", GenerationJob.started_at >= cutoff))
+
+    def recover(self):
+        """Re-submit jobs left behind by a previous process.
+        Running jobs whose worker died are re-queued once they are older than JOB_STALE_SECONDS."""
+        with self.app.app_context():
+            cutoff = datetime.utcnow() - self.stale_after
+            (GenerationJob.query
+             .filter(GenerationJob.status == "running", GenerationJob.started_at < cutoff)
+             .update({"status": "queued"}, synchronize_session=False))
+            db.session.commit()
+
+            job_ids = [job_id for (job_id,) in db.session.query(GenerationJob.id)
+                       .filter_by(status="queued")
+                       .order_by(GenerationJob.created_at)]
+
+        for job_id in job_ids:
+            self.executor.submit(self._run, job_id)
+        return len(job_ids)
+
+    def _recover_once(self):
+        with self._recover_lock:
+            if self._recovered:
+                return
+            self._recovered = True
+        count = self.recover()
+        if count:
+            print(f"[Job queue] Resumed {count} job(s) left by a previous process")
+
+    def _claim(self, job_id):
+        """Flip queued → running in one UPDATE so only one worker (or process) runs the job."""
+        claimed = (GenerationJob.query
+                   .filter_by(id=job_id, status="queued")
+                   .update({"status": "running",
+                            "started_at": datetime.utcnow(),
+                            "attempts": GenerationJob.attempts + 1},
+                           synchronize_session=False))
+        db.session.commit()
+        return claimed == 1
+
+    def _finish(self, job_id, status, plan_id=None, error=None):
+        (GenerationJob.query
+         .filter_by(id=job_id)
+         .update({"status": status,
+                  "plan_id": plan_id,
+                  "error": error,
+                  "finished_at": datetime.utcnow()},
+                 synchronize_session=False))
+        db.session.commit()
+
+    def _run(self, job_id):
+        with self.app.app_context():
+            if not self._claim(job_id):
+                return
+
+            job = db.session.get(GenerationJob, job_id)
+            handler = self.handlers.get(job.kind)
+            try:
+                if handler is None:
+                    raise ValueError(f"No handler registered for {job.kind!r}")
+                with ai_call_scope(f"job:{job.kind}", job.user_id):
+                    plan_id = handler(job.user_id)
+            except Exception as e:
+                db.session.rollback()
+                print(f"[Job error] {job_id} ({job.kind}): {e}")
+                self._finish(job_id, "failed", error=str(e))
+            else:
+                self._finish(job_id, "done", plan_id=plan_id)
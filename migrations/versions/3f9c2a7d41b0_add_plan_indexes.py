@@ -0,0 +1,32 @@
+"""add (user_id, created_at) and (user_id, date) indexes to plan tables
+
+Revision ID: 3f9c2a7d41b0
+Revises: 
+Create Date: 2026-10-18 10:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c2a7d41b0'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # if_not_exists: databases created by db.create_all() already have them
+    op.create_index('ix_daily_plans_user_created', 'daily_plans', ['user_id', 'created_at'],
+                    unique=False, if_not_exists=True)
+    op.create_index('ix_daily_plans_user_date', 'daily_plans', ['user_id', 'date'],
+                    unique=False, if_not_exists=True)
+    op.create_index('ix_weekly_plans_user_created', 'weekly_plans', ['user_id', 'created_at'],
+                    unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_weekly_plans_user_created', table_name='weekly_plans', if_exists=True)
+    op.drop_index('ix_daily_plans_user_date', table_name='daily_plans', if_exists=True)
+    op.drop_index('ix_daily_plans_user_created', table_name='daily_plans', if_exists=True)
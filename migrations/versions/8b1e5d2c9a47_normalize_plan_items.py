@@ -0,0 +1,56 @@
+"""normalize plan meals/workouts into plan_items and backfill existing plans
+
+Revision ID: 8b1e5d2c9a47
+Revises: 3f9c2a7d41b0
+Create Date: 2026-10-18 11:15:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from datamanager.plan_items import backfill_plan_items
+
+
+# revision identifiers, used by Alembic.
+revision = '8b1e5d2c9a47'
+down_revision = '3f9c2a7d41b0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table('plan_items'):
+        op.create_table(
+            'plan_items',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('daily_plan_id', sa.Integer(), nullable=True),
+            sa.Column('weekly_plan_id', sa.Integer(), nullable=True),
+            sa.Column('day', sa.String(length=10), nullable=True),
+            sa.Column('kind', sa.String(length=10), nullable=False),
+            sa.Column('position', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(), nullable=True),
+            sa.Column('calories', sa.Float(), nullable=True),
+            sa.Column('protein', sa.Float(), nullable=True),
+            sa.Column('carbs', sa.Float(), nullable=True),
+            sa.Column('fats', sa.Float(), nullable=True),
+            sa.Column('image_url', sa.String(), nullable=True),
+            sa.Column('data', sa.Text(), nullable=False),
+            sa.ForeignKeyConstraint(['daily_plan_id'], ['daily_plans.id']),
+            sa.ForeignKeyConstraint(['weekly_plan_id'], ['weekly_plans.id']),
+            sa.PrimaryKeyConstraint('id'),
+        )
+    op.create_index('ix_plan_items_daily', 'plan_items', ['daily_plan_id', 'kind', 'position'],
+                    unique=False, if_not_exists=True)
+    op.create_index('ix_plan_items_weekly', 'plan_items', ['weekly_plan_id', 'day', 'kind', 'position'],
+                    unique=False, if_not_exists=True)
+
+    # copy the meals/workouts of every existing plan_json blob into plan_items
+    written = backfill_plan_items(bind)
+    print(f"[plan_items] backfilled {written} items")
+
+
+def downgrade():
+    op.drop_index('ix_plan_items_weekly', table_name='plan_items', if_exists=True)
+    op.drop_index('ix_plan_items_daily', table_name='plan_items', if_exists=True)
+    op.drop_table('plan_items')
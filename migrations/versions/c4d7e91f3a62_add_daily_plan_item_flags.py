@@ -0,0 +1,47 @@
+"""add has_meals/has_workouts flags to daily_plans for filtered item pages
+
+Revision ID: c4d7e91f3a62
+Revises: 8b1e5d2c9a47
+Create Date: 2026-10-18 11:50:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d7e91f3a62'
+down_revision = '8b1e5d2c9a47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('daily_plans')}
+    with op.batch_alter_table('daily_plans', schema=None) as batch_op:
+        if 'has_meals' not in columns:
+            batch_op.add_column(sa.Column('has_meals', sa.Boolean(), server_default=sa.false(), nullable=False))
+        if 'has_workouts' not in columns:
+            batch_op.add_column(sa.Column('has_workouts', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+    # plan_items were backfilled by the previous revision
+    op.execute("""
+        UPDATE daily_plans SET
+            has_meals = EXISTS (SELECT 1 FROM plan_items
+                                WHERE plan_items.daily_plan_id = daily_plans.id AND plan_items.kind = 'meal'),
+            has_workouts = EXISTS (SELECT 1 FROM plan_items
+                                   WHERE plan_items.daily_plan_id = daily_plans.id AND plan_items.kind = 'workout')
+    """)
+
+    op.create_index('ix_daily_plans_user_meals', 'daily_plans', ['user_id', 'has_meals', 'created_at'],
+                    unique=False, if_not_exists=True)
+    op.create_index('ix_daily_plans_user_workouts', 'daily_plans', ['user_id', 'has_workouts', 'created_at'],
+                    unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_daily_plans_user_workouts', table_name='daily_plans', if_exists=True)
+    op.drop_index('ix_daily_plans_user_meals', table_name='daily_plans', if_exists=True)
+    with op.batch_alter_table('daily_plans', schema=None) as batch_op:
+        batch_op.drop_column('has_workouts')
+        batch_op.drop_column('has_meals')
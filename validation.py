@@ -2,3 +2,24 @@ def validate_user_data(**fields):
     missing = [key for key, value in fields.items() if not value]
     return missing
 
+
+USER_FIELDS = ("user_name", "gender", "age", "height", "weight", "dietary_pref", "fitness_goal", "activity_level")
+
+
+def clean_user_row(row):
+    """(column values, None) for one imported user record, or (None, error message) if it is not valid."""
+    if not isinstance(row, dict):
+        return None, "not a user record"
+    values = {field: "" if row.get(field) is None else str(row[field]).strip() for field in USER_FIELDS}
+    missing = validate_user_data(**values)
+    if missing:
+        return None, f"Missing fields: {', '.join(missing)}"
+    if len(values["user_name"]) > 50:
+        return None, "user_name is longer than 50 characters"
+    try:
+        values["age"] = int(values["age"])
+        values["height"] = float(values["height"])
+        values["weight"] = float(values["weight"])
+    except ValueError:
+        return None, "age, height and weight must be numbers"
+    return values, None